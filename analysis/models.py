@@ -0,0 +1,87 @@
+# analysis/models.py
+# 分析结果的轻量类型：slots dataclass，不持有 DataFrame，序列化走 orjson（未安装时退回标准库 json）
+from __future__ import annotations
+
+import json
+from dataclasses import asdict, dataclass, field
+from typing import Any, Dict, List, Optional
+
+try:
+    import orjson
+except ImportError:  # orjson 是可选依赖
+    orjson = None
+
+
+@dataclass(slots=True)
+class MetricSummary:
+    key: str
+    name: str
+    unit: str
+    latest: float
+    zscore_latest: Optional[float]
+    trend: str
+    yoy_delta: Optional[float]
+    out_of_range: bool
+    out_flag: str
+    ref_low: Optional[float]
+    ref_high: Optional[float]
+    monotonic_increase_last3: bool
+    cohort_percentile: Optional[float] = None  # 在同龄同性别人群中的百分位（0~100）
+    cohort: Optional[str] = None  # 对比人群，如 "50–59岁男性"
+
+
+@dataclass(slots=True)
+class AnalysisWarning:
+    metric: str
+    kind: str  # "out_of_range" / "zscore" / "rising"
+    text: str
+
+
+@dataclass(slots=True)
+class FigureRef:
+    key: str
+    path: str
+
+
+@dataclass(slots=True)
+class AnalysisResult:
+    summary: Dict[str, MetricSummary] = field(default_factory=dict)
+    warnings: List[AnalysisWarning] = field(default_factory=list)
+    figures: List[FigureRef] = field(default_factory=list)
+
+    @property
+    def warning_texts(self) -> List[str]:
+        return [w.text for w in self.warnings]
+
+    @property
+    def figure_paths(self) -> Dict[str, str]:
+        return {f.key: f.path for f in self.figures}
+
+
+def dumps(obj: Any, indent: bool = False) -> bytes:
+    """
+    快速序列化为 UTF-8 JSON 字节
+    orjson 原生支持 dataclass / numpy 标量，比 json.dumps(indent=2) 快一个数量级
+    """
+    if orjson is not None:
+        option = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+        if indent:
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, option=option)
+    return json.dumps(
+        obj, ensure_ascii=False, indent=2 if indent else None, default=_json_default
+    ).encode("utf-8")
+
+
+def loads(data: bytes | str) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def _json_default(obj: Any) -> Any:
+    if hasattr(obj, "__dataclass_fields__"):
+        return asdict(obj)
+    if hasattr(obj, "item"):  # numpy 标量
+        return obj.item()
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
@@ -0,0 +1,511 @@
+# analysis/population.py
+"""
+人群百分位索引：每个 指标 × 性别 × 年龄段 维护一个 KLL 分位数草图（可合并、内存有界）
+
+- 构建：从队列数据（JSONL 人员记录 / CSV 宽表）或模拟数据增量写入，可多次追加、多份合并
+- 持久化：草图本体（可继续追加）+ 冻结后的累计权重表（只读查询）
+- 查询：冻结表上二分查找，单次百分位查询为微秒级，run_analysis 里直接调用
+
+python -m analysis.population build --synthetic 20000
+python -m analysis.population build --from cohort.jsonl --from more.csv
+python -m analysis.population query ldl 3.9 --sex M --age 54
+"""
+from __future__ import annotations
+
+import bisect
+import io
+import json
+import math
+import os
+import random
+import threading
+import time
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from data.reference_ranges import REFERENCE_RANGES
+from storage.files import atomic_write_bytes
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_INDEX_DIR = PROJECT_ROOT / "outputs" / "population_index"
+
+DEFAULT_K = 200  # KLL 精度参数：秩误差约 1.7/k（k=200 时约 ±1 个百分位）
+AGE_BAND_WIDTH = 10
+ANY = "*"  # 不区分性别 / 年龄段的汇总层
+
+SEX_ALIASES = {
+    "m": "M", "male": "M", "man": "M", "男": "M",
+    "f": "F", "female": "F", "woman": "F", "女": "F",
+}
+SEX_LABELS = {"M": "男性", "F": "女性"}
+
+
+class KLLSketch:
+    """
+    KLL 分位数草图（Karnin-Lang-Liberty）
+    第 h 层的每个元素代表 2^h 个原始值；某层满了就排序、隔一个取一个升到上一层
+    两个草图按层拼接后再压缩即为合并，结果与顺序无关地保持误差界
+    """
+
+    __slots__ = ("k", "n", "compactors", "_rng", "_size", "_max")
+
+    def __init__(self, k: int = DEFAULT_K, seed: Optional[int] = None):
+        self.k = k
+        self.n = 0
+        self.compactors: List[List[float]] = [[]]
+        self._rng = random.Random(seed)
+        self._recount()
+
+    def _capacity(self, level: int) -> int:
+        depth = len(self.compactors) - level - 1
+        return max(2, int(math.ceil(self.k * (2.0 / 3.0) ** depth)))
+
+    def _max_size(self) -> int:
+        return sum(self._capacity(h) for h in range(len(self.compactors)))
+
+    def _recount(self) -> None:
+        # 当前保留的元素数 / 容量上限，直接改 compactors 之后要调用
+        self._size = sum(len(c) for c in self.compactors)
+        self._max = self._max_size()
+
+    def _compress(self) -> None:
+        # 惰性压缩：总数达到上限才压缩，每次只压缩最低的一个满层
+        while self._size >= self._max:
+            for h in range(len(self.compactors)):
+                if len(self.compactors[h]) >= self._capacity(h):
+                    if h + 1 == len(self.compactors):
+                        self.compactors.append([])
+                        self._max = self._max_size()
+                    buf = sorted(self.compactors[h])
+                    # 奇数个时随机留一个在本层，保证总权重不变（固定留最大值会让高分位系统性偏高）
+                    keep = [buf.pop(self._rng.randrange(len(buf)))] if len(buf) % 2 else []
+                    promoted = buf[self._rng.randint(0, 1)::2]
+                    self.compactors[h + 1].extend(promoted)
+                    self.compactors[h] = keep
+                    self._size -= len(buf) - len(promoted)
+                    break
+
+    def update(self, value: float) -> None:
+        self.compactors[0].append(float(value))
+        self.n += 1
+        self._size += 1
+        if self._size >= self._max:
+            self._compress()
+
+    def update_many(self, values: Iterable[float]) -> None:
+        for v in values:
+            self.compactors[0].append(float(v))
+            self.n += 1
+            self._size += 1
+            if self._size >= self._max:
+                self._compress()
+
+    def merge(self, other: "KLLSketch") -> None:
+        while len(self.compactors) < len(other.compactors):
+            self.compactors.append([])
+        for h, items in enumerate(other.compactors):
+            self.compactors[h].extend(items)
+        self.n += other.n
+        self._recount()
+        self._compress()
+
+    def weighted_items(self) -> Tuple[np.ndarray, np.ndarray]:
+        """(排序后的值, 对应权重)"""
+        values = np.array([v for c in self.compactors for v in c], dtype=np.float64)
+        weights = np.array(
+            [1 << h for h, c in enumerate(self.compactors) for _ in c], dtype=np.int64
+        )
+        order = np.argsort(values, kind="stable")
+        return values[order], weights[order]
+
+    def freeze(self) -> "FrozenCDF":
+        values, weights = self.weighted_items()
+        return FrozenCDF(values, np.cumsum(weights), self.n)
+
+
+class FrozenCDF:
+    """冻结的累计分布：去重后的值 + 累计权重，查询只做两次二分查找。"""
+
+    __slots__ = ("values", "cum", "n")
+
+    def __init__(self, values: np.ndarray, cum: np.ndarray, n: int):
+        # 合并相同的值，只保留每个值最后的累计权重
+        if len(values):
+            last = np.r_[values[1:] != values[:-1], True]
+            values, cum = values[last], cum[last]
+        # 纯 Python 列表 + bisect：标量查询比 np.searchsorted 的调用开销更低
+        self.values: List[float] = values.tolist()
+        self.cum: List[int] = cum.tolist()
+        self.n = n
+
+    def percentile(self, x: float) -> Optional[float]:
+        """x 在分布中的百分位（0~100，相同值取中点秩）。"""
+        if not self.values:
+            return None
+        lo = bisect.bisect_left(self.values, x)
+        hi = bisect.bisect_right(self.values, x)
+        below = self.cum[lo - 1] if lo else 0
+        upto = self.cum[hi - 1] if hi else 0
+        total = self.cum[-1]
+        return 100.0 * (below + upto) / 2.0 / total
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.values:
+            return None
+        target = q * self.cum[-1]
+        i = bisect.bisect_left(self.cum, target)
+        return self.values[min(i, len(self.values) - 1)]
+
+
+def normalize_sex(sex: Any) -> str:
+    if sex is None:
+        return ANY
+    return SEX_ALIASES.get(str(sex).strip().lower(), ANY)
+
+
+def age_band(age: Any) -> str:
+    try:
+        age = int(age)
+    except (TypeError, ValueError):
+        return ANY
+    if age < 0:
+        return ANY
+    lo = age // AGE_BAND_WIDTH * AGE_BAND_WIDTH
+    return f"{lo}-{lo + AGE_BAND_WIDTH - 1}"
+
+
+def cohort_label(sex: str, band: str) -> str:
+    parts = []
+    if band != ANY:
+        parts.append(band.replace("-", "–") + "岁")
+    if sex != ANY:
+        parts.append(SEX_LABELS[sex])
+    return "".join(parts) or "全体人群"
+
+
+def _key(metric: str, sex: str, band: str) -> str:
+    return f"{metric}|{sex}|{band}"
+
+
+def _savez_atomic(path: Path, **arrays: np.ndarray) -> None:
+    buf = io.BytesIO()
+    np.savez(buf, **arrays)
+    atomic_write_bytes(path, buf.getvalue())
+
+
+class PopulationIndex:
+    """
+    指标 × 性别 × 年龄段 的草图集合
+    每个观测同时写入 (性别,年龄段) / (性别,*) / (*,年龄段) / (*,*) 四层，
+    查询时按画像从细到粗回退，样本量不足 min_count 的层不用
+    """
+
+    def __init__(self, k: int = DEFAULT_K, seed: int = 0, min_count: int = 100):
+        self.k = k
+        self.seed = seed
+        self.min_count = min_count
+        self.sketches: Dict[str, KLLSketch] = {}
+        self._frozen: Dict[str, FrozenCDF] = {}
+
+    def _sketch(self, key: str) -> KLLSketch:
+        sk = self.sketches.get(key)
+        if sk is None:
+            # 种子按 key 派生：同样的输入重建出同样的草图
+            sk = self.sketches[key] = KLLSketch(self.k, seed=zlib.crc32(f"{self.seed}|{key}".encode("utf-8")))
+        return sk
+
+    def add(self, metric: str, value: float, sex: Any = None, age: Any = None) -> None:
+        if value is None or not math.isfinite(value):
+            return
+        s, b = normalize_sex(sex), age_band(age)
+        for ks in {(s, b), (s, ANY), (ANY, b), (ANY, ANY)}:
+            self._sketch(_key(metric, *ks)).update(value)
+        self._frozen.clear()
+
+    def add_row(self, row: Dict[str, Any], sex: Any = None, age: Any = None) -> int:
+        """一次体检（一年）的全部指标；返回写入的观测数。"""
+        added = 0
+        for metric in REFERENCE_RANGES:
+            v = row.get(metric)
+            if isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v):
+                self.add(metric, float(v), sex, age)
+                added += 1
+        return added
+
+    def add_person(
+        self,
+        rows: List[Dict[str, Any]],
+        sex: Any = None,
+        age: Any = None,
+        birth_year: Any = None,
+    ) -> int:
+        """
+        一个人的多年数据：每个指标只写入最近一年的有效值（按当年的实际年龄分层），
+        每人每指标权重相同，不会因为体检年数多而被重复计入
+        有 birth_year 时按出生年推算年龄；只有 age 时视为最近一年的年龄往前推
+        """
+        if not rows:
+            return 0
+        latest = max(int(r.get("year", 0)) for r in rows)
+        added = 0
+        seen: set = set()
+        for r in sorted(rows, key=lambda r: int(r.get("year", latest)), reverse=True):
+            year = int(r.get("year", latest))
+            if birth_year is not None:
+                row_age = year - int(birth_year)
+            elif age is not None:
+                row_age = int(age) - (latest - year)
+            else:
+                row_age = None
+            for metric in REFERENCE_RANGES:
+                if metric in seen:
+                    continue
+                v = r.get(metric)
+                if isinstance(v, (int, float)) and not isinstance(v, bool) and math.isfinite(v):
+                    self.add(metric, float(v), sex, row_age)
+                    seen.add(metric)
+                    added += 1
+        return added
+
+    def merge(self, other: "PopulationIndex") -> None:
+        for key, sk in other.sketches.items():
+            self._sketch(key).merge(sk)
+        self._frozen.clear()
+
+    def _cdf(self, key: str) -> Optional[FrozenCDF]:
+        cdf = self._frozen.get(key)
+        if cdf is None:
+            sk = self.sketches.get(key)
+            if sk is None:
+                return None
+            cdf = self._frozen[key] = sk.freeze()
+        return cdf
+
+    def lookup(
+        self, metric: str, value: float, sex: Any = None, age: Any = None
+    ) -> Optional[Dict[str, Any]]:
+        """
+        返回 {"percentile", "cohort", "n"}；没有足够样本时返回 None
+        例：LDL 3.9 对 50–59 岁男性 -> {"percentile": 88.2, "cohort": "50–59岁男性", "n": 1234}
+        """
+        s, b = normalize_sex(sex), age_band(age)
+        for ks in ((s, b), (s, ANY), (ANY, b), (ANY, ANY)):
+            cdf = self._cdf(_key(metric, *ks))
+            if cdf is not None and cdf.n >= self.min_count:
+                return {
+                    "percentile": round(cdf.percentile(value), 1),
+                    "cohort": cohort_label(*ks),
+                    "n": cdf.n,
+                }
+        return None
+
+    # ---------------- 持久化 ----------------
+
+    def save(self, index_dir: str | Path = DEFAULT_INDEX_DIR) -> Dict[str, Any]:
+        """
+        sketches.npz：每个草图各层的值（可继续追加 / 合并）
+        frozen.npz：冻结表（值 + 累计权重，按 key 偏移拼接），加载后直接查询
+        manifest.json 最后写，作为索引完整的标记；每个文件都原子写，API 进程加载时不会读到半个文件
+        """
+        index_dir = Path(index_dir)
+        keys = sorted(self.sketches)
+
+        level_values, level_sizes, level_ptr = [], [], [0]
+        frozen_values, frozen_cum, frozen_ptr = [], [], [0]
+        for key in keys:
+            sk = self.sketches[key]
+            for c in sk.compactors:
+                level_values.extend(c)
+                level_sizes.append(len(c))
+            level_ptr.append(len(level_sizes))
+            cdf = self._cdf(key)
+            frozen_values.extend(cdf.values)
+            frozen_cum.extend(cdf.cum)
+            frozen_ptr.append(len(frozen_values))
+
+        _savez_atomic(
+            index_dir / "sketches.npz",
+            values=np.array(level_values, dtype=np.float64),
+            level_sizes=np.array(level_sizes, dtype=np.int64),
+            level_ptr=np.array(level_ptr, dtype=np.int64),
+            n=np.array([self.sketches[k].n for k in keys], dtype=np.int64),
+        )
+        _savez_atomic(
+            index_dir / "frozen.npz",
+            values=np.array(frozen_values, dtype=np.float64),
+            cum=np.array(frozen_cum, dtype=np.int64),
+            ptr=np.array(frozen_ptr, dtype=np.int64),
+        )
+        manifest = {
+            "k": self.k,
+            "seed": self.seed,
+            "min_count": self.min_count,
+            "keys": keys,
+            "observations": int(sum(self.sketches[k].n for k in keys if k.endswith(f"|{ANY}|{ANY}"))),
+            "retained_items": len(level_values),
+            "saved_at": time.strftime("%Y-%m-%d %H:%M:%S"),
+        }
+        atomic_write_bytes(index_dir / "manifest.json", json.dumps(manifest, ensure_ascii=False).encode("utf-8"))
+        return manifest
+
+    @classmethod
+    def load(cls, index_dir: str | Path = DEFAULT_INDEX_DIR, frozen_only: bool = False) -> "PopulationIndex":
+        """frozen_only=True：只加载冻结表（查询用，最快）；否则连草图一起加载以便继续追加。"""
+        index_dir = Path(index_dir)
+        manifest = json.loads((index_dir / "manifest.json").read_text(encoding="utf-8"))
+        index = cls(k=manifest["k"], seed=manifest["seed"], min_count=manifest["min_count"])
+        keys = manifest["keys"]
+
+        with np.load(index_dir / "frozen.npz") as z:
+            values, cum, ptr = z["values"], z["cum"], z["ptr"]
+            for i, key in enumerate(keys):
+                lo, hi = int(ptr[i]), int(ptr[i + 1])
+                n = int(cum[hi - 1]) if hi > lo else 0
+                index._frozen[key] = FrozenCDF(values[lo:hi], cum[lo:hi], n)
+        if frozen_only:
+            return index
+
+        with np.load(index_dir / "sketches.npz") as z:
+            values, sizes, lptr, ns = z["values"], z["level_sizes"], z["level_ptr"], z["n"]
+        pos = 0
+        for i, key in enumerate(keys):
+            sk = index._sketch(key)
+            sk.compactors = []
+            for size in sizes[int(lptr[i]):int(lptr[i + 1])]:
+                sk.compactors.append(values[pos:pos + int(size)].tolist())
+                pos += int(size)
+            sk.n = int(ns[i])
+            sk._recount()
+        return index
+
+
+# ---------------- 数据来源 ----------------
+
+def ingest_file(index: PopulationIndex, path: str | Path, chunksize: int = 50_000) -> int:
+    """
+    追加一个队列数据文件，返回写入的观测数
+    - .jsonl：每行一个人 {"sex": "M", "age": 54 | "birth_year": 1970, "rows": [{"year":..., ...}]}
+    - .csv：宽表，每行一次体检，列 sex / age（可选）+ 指标列（按块读取，内存有界）；
+      没有人员标识，每行按一个人计，同一人多年的数据请用 JSONL（只取最近一年）或只导出最近一次
+    """
+    path = str(path)
+    added = 0
+    if path.lower().endswith((".jsonl", ".ndjson")):
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                rec = json.loads(line)
+                added += index.add_person(
+                    rec.get("rows", []), rec.get("sex"), rec.get("age"), rec.get("birth_year")
+                )
+        return added
+
+    if path.lower().endswith((".csv", ".csv.gz")):
+        import pandas as pd
+
+        with pd.read_csv(path, chunksize=chunksize) as reader:
+            for chunk in reader:
+                sexes = chunk["sex"].map(normalize_sex) if "sex" in chunk.columns else None
+                bands = chunk["age"].map(age_band) if "age" in chunk.columns else None
+                for metric in REFERENCE_RANGES:
+                    if metric not in chunk.columns:
+                        continue
+                    vals = pd.to_numeric(chunk[metric], errors="coerce")
+                    frame = pd.DataFrame({
+                        "v": vals,
+                        "s": ANY if sexes is None else sexes,
+                        "b": ANY if bands is None else bands,
+                    }).dropna(subset=["v"])
+                    # 按分层批量写入，避免逐行 Python 调用
+                    for (s, b), grp in frame.groupby(["s", "b"], sort=False):
+                        v = grp["v"].to_numpy(dtype=np.float64)
+                        for ks in {(s, b), (s, ANY), (ANY, b), (ANY, ANY)}:
+                            index._sketch(_key(metric, *ks)).update_many(v)
+                        added += len(v)
+        index._frozen.clear()
+        return added
+
+    raise ValueError(f"unsupported cohort file: {path}")
+
+
+def add_synthetic_cohort(index: PopulationIndex, persons: int, seed: int = 0, years: int = 5) -> int:
+    """用 mock 生成器模拟一个队列（随机性别 / 年龄 / 严重程度），用于演示和基准。"""
+    from data.mock_generator import generate_mock_health_data
+
+    rng = random.Random(seed)
+    added = 0
+    for i in range(persons):
+        rows = generate_mock_health_data(
+            years=years,
+            severity=rng.uniform(0.0, 1.5),
+            seed=seed * 1_000_003 + i,
+            clamp_to_reference=False,
+        )
+        added += index.add_person(rows, sex=rng.choice("MF"), age=rng.randint(25, 84))
+    return added
+
+
+_index: Optional[PopulationIndex] = None
+_index_dir: Optional[Path] = None
+_index_lock = threading.Lock()
+
+
+def get_population_index() -> Optional[PopulationIndex]:
+    """
+    进程内单例（只读冻结表），目录由 HA_POPULATION_INDEX 指定
+    索引未构建时返回 None：人群百分位是可选增强，不影响主流程
+    """
+    global _index, _index_dir
+    index_dir = Path(os.getenv("HA_POPULATION_INDEX", str(DEFAULT_INDEX_DIR)))
+    if _index is not None and _index_dir == index_dir:
+        return _index
+    if not (index_dir / "manifest.json").is_file():
+        return None
+    with _index_lock:
+        if _index is None or _index_dir != index_dir:
+            _index = PopulationIndex.load(index_dir, frozen_only=True)
+            _index_dir = index_dir
+    return _index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="人群百分位索引")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    build = sub.add_parser("build", help="构建 / 追加（已有索引时在其基础上追加）")
+    build.add_argument("--index", default=str(DEFAULT_INDEX_DIR))
+    build.add_argument("--from", dest="sources", action="append", default=[], help="队列数据 .jsonl / .csv，可重复")
+    build.add_argument("--synthetic", type=int, default=0, help="追加 N 个模拟人员")
+    build.add_argument("--seed", type=int, default=0)
+    build.add_argument("--k", type=int, default=DEFAULT_K)
+    build.add_argument("--fresh", action="store_true", help="忽略已有索引，从头构建")
+
+    query = sub.add_parser("query", help="查询百分位")
+    query.add_argument("metric")
+    query.add_argument("value", type=float)
+    query.add_argument("--sex", default=None)
+    query.add_argument("--age", type=int, default=None)
+    query.add_argument("--index", default=str(DEFAULT_INDEX_DIR))
+    args = parser.parse_args()
+
+    if args.command == "build":
+        t0 = time.perf_counter()
+        existing = Path(args.index) / "manifest.json"
+        index = PopulationIndex.load(args.index) if existing.is_file() and not args.fresh else PopulationIndex(k=args.k)
+        added = 0
+        for src in args.sources:
+            added += ingest_file(index, src)
+        if args.synthetic:
+            added += add_synthetic_cohort(index, args.synthetic, seed=args.seed)
+        manifest = index.save(args.index)
+        print(f"added={added} observations={manifest['observations']} sketches={len(manifest['keys'])} "
+              f"retained={manifest['retained_items']} elapsed={time.perf_counter() - t0:.2f}s")
+    else:
+        print(PopulationIndex.load(args.index, frozen_only=True).lookup(args.metric, args.value, args.sex, args.age))
@@ -3,25 +3,34 @@ from __future__ import annotations
 
 import os
 import math
-from typing import Any, Dict, List, Tuple
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
 
 import pandas as pd
 import matplotlib as mpl
-import matplotlib.pyplot as plt
 from matplotlib import font_manager
+from matplotlib.figure import Figure
 
+from analysis.models import AnalysisResult, AnalysisWarning, FigureRef, MetricSummary
 from data.reference_ranges import REFERENCE_RANGES
 
 
-def setup_cn_font() -> None:
-    candidates = ["Microsoft YaHei", "SimHei", "PingFang SC", "Noto Sans CJK SC", "Arial Unicode MS"]
+CN_FONT_CANDIDATES = ["Microsoft YaHei", "SimHei", "PingFang SC", "Noto Sans CJK SC", "Arial Unicode MS"]
+
+
+@lru_cache(maxsize=1)
+def cn_font_family() -> Tuple[str, ...]:
+    """可用的中文字体排在最前的候选列表（只读，不改 rcParams；后台线程可以直接传给 fontfamily=）。"""
     available = {f.name for f in font_manager.fontManager.ttflist}
-    for name in candidates:
+    for name in CN_FONT_CANDIDATES:
         if name in available:
-            mpl.rcParams["font.sans-serif"] = [name] + [n for n in candidates if n != name]
-            mpl.rcParams["axes.unicode_minus"] = False
-            return
-    mpl.rcParams["font.sans-serif"] = candidates
+            return (name, *[n for n in CN_FONT_CANDIDATES if n != name])
+    return tuple(CN_FONT_CANDIDATES)
+
+
+def setup_cn_font() -> None:
+    # 修改全局 rcParams：只在导入时调用一次，不要在请求 / 后台线程里调用
+    mpl.rcParams["font.sans-serif"] = list(cn_font_family())
     mpl.rcParams["axes.unicode_minus"] = False
 
 
@@ -68,24 +77,40 @@ def _monotonic_increase_last_n(series: pd.Series, n: int = 3) -> bool:
 def run_analysis(
     rows: List[Dict[str, Any]],
     output_dir: str = "outputs",
-) -> Dict[str, Any]:
+    make_figures: bool = True,
+    profile: Optional[Dict[str, Any]] = None,
+) -> AnalysisResult:
     """
     输入：List[Dict] 每年一条数据
-    输出：
-      - summary: 每个指标的 zscore / 趋势 / 是否超范围
-      - warnings: 文本预警列表
-      - figures: 保存的图路径
+    profile：可选画像 {"sex": "M"/"F", "age": 最近一年的年龄 或 "birth_year": ...}
+             提供且人群索引已构建（analysis/population.py）时，附带同龄同性别人群百分位
+    输出：AnalysisResult（见 analysis/models.py，不持有 DataFrame）
+      - summary: 每个指标的 zscore / 趋势 / 是否超范围 / 人群百分位
+      - warnings: 预警列表（指标 / 类型 / 文本）
+      - figures: 保存的图路径（make_figures=False 时不画图）
     """
-    os.makedirs(output_dir, exist_ok=True)
+    if make_figures:
+        os.makedirs(output_dir, exist_ok=True)
     df = pd.DataFrame(rows).sort_values("year").reset_index(drop=True)
 
-    summary: Dict[str, Any] = {}
-    warnings: List[str] = []
-    figures: Dict[str, str] = {}
+    summary: Dict[str, MetricSummary] = {}
+    warnings: List[AnalysisWarning] = []
+    figures: List[FigureRef] = []
 
     # 找出有哪些可分析指标（排除 year）
     metric_keys = [c for c in df.columns if c != "year"]
 
+    population = None
+    sex = age = None
+    if profile:
+        from analysis.population import get_population_index
+
+        population = get_population_index()
+        sex = profile.get("sex")
+        age = profile.get("age")
+        if age is None and profile.get("birth_year") is not None:
+            age = int(df["year"].iloc[-1]) - int(profile["birth_year"])
+
     for key in metric_keys:
         rr = REFERENCE_RANGES.get(key, {"name": key, "unit": "", "low": None, "high": None})
         name = rr.get("name", key)
@@ -101,56 +126,59 @@ def run_analysis(
         yoy = float((s.iloc[-1] - s.iloc[-2])) if len(s) >= 2 else None
         out, out_flag = _is_out_of_range(latest_val, low, high)
         monot3 = _monotonic_increase_last_n(s, n=3)
-
-        summary[key] = {
-            "name": name,
-            "unit": unit,
-            "latest": latest_val,
-            "zscore_latest": None if z is None else round(z, 2),
-            "trend": trend,
-            "yoy_delta": None if yoy is None else round(yoy, 2),
-            "out_of_range": out,
-            "out_flag": out_flag,
-            "ref_low": low,
-            "ref_high": high,
-            "monotonic_increase_last3": monot3,
-        }
+        cohort = None if population is None else population.lookup(key, latest_val, sex, age)
+
+        summary[key] = MetricSummary(
+            key=key,
+            name=name,
+            unit=unit,
+            latest=latest_val,
+            zscore_latest=None if z is None else round(z, 2),
+            trend=trend,
+            yoy_delta=None if yoy is None else round(yoy, 2),
+            out_of_range=out,
+            out_flag=out_flag,
+            ref_low=low,
+            ref_high=high,
+            monotonic_increase_last3=monot3,
+            cohort_percentile=None if cohort is None else cohort["percentile"],
+            cohort=None if cohort is None else cohort["cohort"],
+        )
 
         # 预警规则（MVP：简单直接）
         if out:
             if out_flag == "HIGH":
-                warnings.append(f"{name}（最新 {latest_val}{unit}）高于参考范围上限{'' if high is None else str(high)+unit}。")
+                warnings.append(AnalysisWarning(key, "out_of_range", f"{name}（最新 {latest_val}{unit}）高于参考范围上限{'' if high is None else str(high)+unit}。"))
             elif out_flag == "LOW":
-                warnings.append(f"{name}（最新 {latest_val}{unit}）低于参考范围下限{'' if low is None else str(low)+unit}。")
+                warnings.append(AnalysisWarning(key, "out_of_range", f"{name}（最新 {latest_val}{unit}）低于参考范围下限{'' if low is None else str(low)+unit}。"))
 
         if z is not None and abs(z) >= 2:
-            warnings.append(f"{name} 的最新值相对近{len(s)}年明显偏离（Z={z:.2f}），建议关注变化原因。")
+            warnings.append(AnalysisWarning(key, "zscore", f"{name} 的最新值相对近{len(s)}年明显偏离（Z={z:.2f}），建议关注变化原因。"))
 
         if monot3 and trend == "UP":
-            warnings.append(f"{name} 最近3年呈持续上升趋势，建议结合生活方式与复查频率评估。")
+            warnings.append(AnalysisWarning(key, "rising", f"{name} 最近3年呈持续上升趋势，建议结合生活方式与复查频率评估。"))
+
+        if not make_figures:
+            continue
 
         # 画趋势图（每个指标一张）
+        # 用 Figure 对象而不是 pyplot 的全局“当前图”：API 在线程池里并发调用，pyplot 状态会串图
         fig_path = os.path.join(output_dir, f"trend_{key}.png")
-        plt.figure(figsize=(7, 4))
-        plt.plot(df["year"], s, marker="o")
-        plt.title(f"{name} 趋势 ({len(df)}年)")
-        plt.xlabel("年份")
-        plt.ylabel(f"{name} ({unit})" if unit else name)
+        fig = Figure(figsize=(7, 4))
+        ax = fig.add_subplot()
+        ax.plot(df["year"], s, marker="o")
+        ax.set_title(f"{name} 趋势 ({len(df)}年)")
+        ax.set_xlabel("年份")
+        ax.set_ylabel(f"{name} ({unit})" if unit else name)
 
         if low is not None:
-            plt.axhline(y=low, linestyle="--")
+            ax.axhline(y=low, linestyle="--")
         if high is not None:
-            plt.axhline(y=high, linestyle="--")
+            ax.axhline(y=high, linestyle="--")
 
-        plt.tight_layout()
-        plt.savefig(fig_path, dpi=160)
-        plt.close()
+        fig.tight_layout()
+        fig.savefig(fig_path, dpi=160)
 
-        figures[key] = fig_path
+        figures.append(FigureRef(key, fig_path))
 
-    return {
-        "dataframe": df,       # 方便你调试/扩展
-        "summary": summary,
-        "warnings": warnings,
-        "figures": figures,
-    }
+    return AnalysisResult(summary=summary, warnings=warnings, figures=figures)
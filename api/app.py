@@ -1,24 +1,45 @@
 from __future__ import annotations
 
+from concurrent.futures import wait as wait_futures
+from contextlib import ExitStack, contextmanager
 from pathlib import Path
-from typing import Any, Literal, Optional
+from typing import TYPE_CHECKING, Any, Callable, Literal, Optional
 import json
+import os
 import time
 import uuid
 
-from fastapi import FastAPI, UploadFile, File, Form
+from fastapi import FastAPI, UploadFile, File, Form, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import FileResponse, JSONResponse, Response
 from fastapi.staticfiles import StaticFiles
 
+from diagnostics.logs import configure_logging
+
+if TYPE_CHECKING:
+    from analysis.models import AnalysisResult
+    from diagnostics.profiling import ProfileSession
+
+# 日志级别：HA_LOG_LEVEL（默认 WARNING；DEBUG 时输出 OCR 原始结果等调试信息）
+configure_logging()
+
 # 你的项目根目录 = api/ 的上一级
 PROJECT_ROOT = Path(__file__).resolve().parents[1]
 OUTPUT_DIR = PROJECT_ROOT / "outputs"
 OUTPUT_DIR.mkdir(exist_ok=True)
-
-# 静态文件挂载：/static -> outputs/
-# 前端访问趋势图：/static/trend_weight_kg.png
+PDF_CACHE_DIR = OUTPUT_DIR / "pdf_cache"
+# 每个请求一个目录：outputs/requests/{request_id}/（report.json + 趋势图），并发请求互不覆盖
+# 过期目录由 storage/retention.py 定期清理（HA_OUTPUT_TTL_HOURS / HA_OUTPUT_MAX_REQUESTS）
+REQUESTS_DIR = OUTPUT_DIR / "requests"
+REQUESTS_DIR.mkdir(exist_ok=True)
+# 剖析文件：outputs/profiles/{request_id}/，不在 /static 下（含源码路径 / 调用栈，只能凭 token 下载）
+PROFILES_DIR = OUTPUT_DIR / "profiles"
+
+# 静态文件挂载：/static/requests -> outputs/requests/（只公开趋势图所在目录，上传文件 / 剖析文件不对外）
+# 前端访问趋势图：/static/requests/{request_id}/trend_weight_kg.png
 app = FastAPI(title="Health Actuary API", version="0.1.0")
-app.mount("/static", StaticFiles(directory=str(OUTPUT_DIR)) , name="static")
+app.mount("/static/requests", StaticFiles(directory=str(REQUESTS_DIR)), name="static")
 
 # 允许前端跨域（开发阶段先放开，生产再收紧）
 app.add_middleware(
@@ -29,68 +50,214 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# 报告正文 + 数据体积较大，超过 1KB 的响应按客户端 Accept-Encoding 做 gzip
+app.add_middleware(GZipMiddleware, minimum_size=1000)
+
+
+@app.on_event("startup")
+async def _configure_threadpool() -> None:
+    # /analyze 是同步函数（OCR / 画图 / LLM 都是阻塞调用），由 FastAPI 放到线程池执行
+    # HA_API_THREADS 控制线程池大小，即同时处理的请求数（默认沿用 anyio 的 40）
+    threads = os.getenv("HA_API_THREADS")
+    if threads:
+        from anyio import to_thread
+
+        to_thread.current_default_thread_limiter().total_tokens = int(threads)
+
+
+@app.on_event("startup")
+def _start_output_sweeper() -> None:
+    # 每个请求一个目录，按 TTL / 最大数量定期清理（见 storage/retention.py）
+    from storage.retention import start_output_sweeper
 
-def _run_analysis(data: list[dict[str, Any]]) -> dict[str, Any]:
+    start_output_sweeper(OUTPUT_DIR)
+
+
+@app.on_event("startup")
+def _warm_guidance_index() -> None:
+    # 启动时构建（若需要）并 mmap 加载指引检索索引，避免第一个请求付出构建成本
+    # 人群百分位索引若已构建，也在这里加载冻结表
+    from analysis.population import get_population_index
+    from llm.retrieval import get_guidance_index
+
+    get_guidance_index()
+    get_population_index()
+
+
+def _run_analysis(
+    data: list[dict[str, Any]],
+    out_dir: Path,
+    profile: Optional[dict[str, Any]] = None,
+) -> "AnalysisResult":
     from analysis.stats import run_analysis
 
     # 你的 run_analysis 现在支持 output_dir 参数（你已经跑通）
-    return run_analysis(data, output_dir=str(OUTPUT_DIR))
+    return run_analysis(data, output_dir=str(out_dir), profile=profile)
 
 
-def _run_llm_reports(
+def _llm_report_generator(
     data: list[dict[str, Any]],
-    analysis_result: dict[str, Any],
+    analysis_result: "AnalysisResult",
     audience: Literal["both", "child", "elder"] = "both",
-) -> dict[str, str]:
+) -> Optional[Callable[[], dict[str, Any]]]:
     """
-    你之前 main.py 里已经能调用 llm.explain.generate_reports 并产出两份报告
-    这里直接复用。
+    返回一个在后台线程里调用 llm.explain.generate_reports 的函数
+    没有 DEEPSEEK_API_KEY 时返回 None（只用模板报告）
+    DEEPSEEK_BASE_URL 可以指向本地假服务（llm/fake_server.py）做离线压测
     """
-    from llm.explain import generate_reports
+    api_key = os.getenv("DEEPSEEK_API_KEY")
+    if not api_key:
+        return None
+
+    def _generate() -> dict[str, Any]:
+        from llm.explain import generate_reports
+
+        return generate_reports(
+            rows=data,
+            analysis_result=analysis_result,
+            api_key=api_key,
+            base_url=os.getenv("DEEPSEEK_BASE_URL"),
+            model=os.getenv("DEEPSEEK_MODEL"),
+            audience=audience,
+        )
+
+    return _generate
 
-    reports = generate_reports(
-        data=data,
-        analysis=analysis_result,
-        audience=audience,  # 你如果没这个参数，就删掉这一行，并在 generate_reports 内部默认 both
-    )
-    # 期望返回结构：{"report_child": "...", "report_elder": "..."}
-    # 如果你 generate_reports 返回的是别的结构，这里按你实际改一下 key 即可。
-    return reports
 
+def _ocr_extract(image_path: str) -> dict[str, Any]:
+    from ocr.stub import ocr_extract_stub, stub_enabled
 
-def _save_payload(payload: dict[str, Any], out_dir: Path) -> Path:
-    path = out_dir / "report.json"
-    path.write_text(json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8")
-    return path
+    if stub_enabled():
+        return ocr_extract_stub(image_path)
+
+    from ocr.extractor import ocr_extract
+
+    return ocr_extract(image_path)
+
+
+class _StageTimer:
+    """记录每个阶段耗时（秒），出错时记住是哪个阶段，便于压测按阶段统计。"""
+
+    def __init__(self) -> None:
+        self.timings: dict[str, float] = {}
+        self.current: Optional[str] = None
+
+    @contextmanager
+    def stage(self, name: str):
+        self.current = name
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[name] = round(time.perf_counter() - t0, 4)
+        self.current = None
+
+
+def _save_payload(body: bytes, out_dir: Path) -> Path:
+    # body 已经由 analysis.models.dumps 序列化好，落盘和响应共用同一份字节
+    # 原子写：后台 LLM 回调重写时，/static 下载和 PDF 重新生成不会读到半个文件
+    from storage.files import atomic_write_bytes
+
+    return atomic_write_bytes(out_dir / "report.json", body)
 
 
 def _as_public_urls(figures: dict[str, str]) -> dict[str, str]:
     """
     analysis.stats.run_analysis 里 figures 的 value 可能是绝对路径
-    这里统一转换成 /static/xxx.png，便于前端直接访问。
+    这里统一转换成 /static/<相对 outputs 的路径>，便于前端直接访问。
     """
     urls: dict[str, str] = {}
     for k, p in figures.items():
         try:
-            name = Path(p).name
+            rel = Path(p).resolve().relative_to(OUTPUT_DIR).as_posix()
         except Exception:
-            name = str(p).split("\\")[-1].split("/")[-1]
-        urls[k] = f"/static/{name}"
+            rel = str(p).split("\\")[-1].split("/")[-1]
+        urls[k] = f"/static/{rel}"
     return urls
 
 
+def _from_public_url(url: str) -> Path:
+    # _as_public_urls 的逆变换：/static/<rel> -> outputs/<rel>
+    return OUTPUT_DIR / url.removeprefix("/static/")
+
+
+def _profile_artifacts(
+    session: Optional["ProfileSession"], request_id: str, authorized: bool
+) -> Optional[dict[str, Any]]:
+    # 只有 token 校验通过的请求才在响应里带剖析信息；抽样命中的请求只落盘，供运维按 token 下载
+    if session is None or not authorized:
+        return None
+    files = {k: f"/profile/{request_id}/{Path(p).name}" for k, p in session.files.items()}
+    return {**session.info(), "files": files}
+
+
+def _submit_pdf(
+    reports: dict[str, str], figures: dict[str, str], request_id: str, lazy: bool = False
+) -> Optional[str]:
+    """
+    后台导出 PDF（不阻塞 /analyze），返回内容哈希用于下载；同时记下来源请求，PDF 丢失时可重新生成
+    lazy=True 时只记录不渲染（模板版：多数情况下很快会被 LLM 版替换），第一次下载时再渲染
+    """
+    from export.pdf import submit_report_pdf
+
+    if not (reports.get("report_child") or reports.get("report_elder")):
+        return None
+    return submit_report_pdf(
+        reports, figures, PDF_CACHE_DIR, source={"request_id": request_id}, lazy=lazy
+    )
+
+
+def _regenerate_pdf(content_hash: str) -> Optional[str]:
+    """
+    缓存里没有这个 PDF（重启前没渲染完 / 被清理）：按来源记录读回该请求的 report.json 重新提交渲染
+    返回重新提交的内容哈希；与 content_hash 不同说明 report.json 已被替换（模板版升级成了 LLM 版）
+    找不到来源或 report.json 时返回 None
+    """
+    from export.pdf import load_pdf_source
+
+    source = load_pdf_source(content_hash, PDF_CACHE_DIR) or {}
+    request_id = str(source.get("request_id") or "")
+    if not request_id or Path(request_id).name != request_id:
+        return None
+    try:
+        stored = json.loads((REQUESTS_DIR / request_id / "report.json").read_bytes())
+    except (OSError, ValueError):
+        return None
+    figures = {k: str(_from_public_url(u)) for k, u in (stored.get("figures") or {}).items()}
+    return _submit_pdf(stored, figures, request_id)
+
+
 @app.get("/health")
 def health():
     return {"ok": True, "output_dir": str(OUTPUT_DIR)}
 
 
+@app.get("/metrics/llm")
+def llm_metrics():
+    """LLM 限流 / 熔断指标：并发上限、排队等待分位数、拒绝次数等（容量规划用）。"""
+    from llm.limiter import get_llm_guard
+
+    return get_llm_guard().snapshot()
+
+
+@app.get("/metrics/ocr-cache")
+def ocr_cache_metrics():
+    """OCR 结果缓存：命中率（精确 / 近似）、条目数、磁盘占用、淘汰次数。"""
+    from ocr.cache import get_ocr_cache
+
+    return get_ocr_cache().stats()
+
+
 @app.post("/analyze")
-async def analyze(
+def analyze(
+    request: Request,
     mode: Literal["mock", "ocr"] = Form("mock"),
     years: int = Form(5),
     severity: float = Form(1.2),
     clamp_to_reference: bool = Form(False),
     audience: Literal["both", "child", "elder"] = Form("both"),
+    sex: Optional[str] = Form(None),
+    age: Optional[int] = Form(None),
     file: Optional[UploadFile] = File(None),
 ):
     """
@@ -99,98 +266,278 @@ async def analyze(
     mode=ocr:
       - 上传图片 file（png/jpg/pdf截图等），走 OCR -> 结构化数据
         （你步骤一 ocr_extract 目前是从 image_path 读，这里会先保存成临时文件再传进去）
+    sex / age（可选）：提供时 summary 附带同龄同性别人群百分位（需先构建人群索引）
 
     返回：
       - data: 年度体检数据
       - warnings: 预警列表
       - figures: 指标->图片URL
-      - report_child/report_elder: 文字报告
-      - artifacts: report.json 的路径
+      - report_child/report_elder: 文字报告（先返回本地模板版，LLM 版在后台生成）
+      - report_source / report_status: template|llm / pending|ready|template
+      - report_url: 轮询 LLM 版报告的地址（/report/{request_id}）
+      - artifacts: report.json 的路径（剖析时还有 profile 文件的 URL）
+    HA_LLM_WAIT_SEC > 0 时最多等这么久，LLM 版在此之前完成就直接返回 LLM 版
+    整个处理都是阻塞调用，所以这里用普通 def：FastAPI 把它放进线程池，不占用事件循环，
+    并发请求之间不会互相排队（线程池大小见 HA_API_THREADS）
+
+    剖析（见 diagnostics/profiling.py）：HA_PROFILE_SAMPLE_N 抽样，或在 HA_PROFILE_ALLOW_REQUEST=1 时
+    带 X-HA-Profile-Token 的请求头 X-HA-Profile / 查询参数 ?profile=；结果写在 outputs/profiles/{request_id}/ 下
+    （不经 /static 公开，凭 token 从 /profile/{request_id}/{file} 下载；只有带 token 的请求响应里才有 artifacts.profile）
+    （profile.* 覆盖 数据/OCR/分析/画图/报告/保存，profile_llm.* 覆盖后台 LLM 任务）
+    剖析只跟踪处理本请求的线程池线程，并发的其他请求不计入；OCR 进程池、PDF 导出等交给
+    其他线程 / 进程的工作也不计入，只体现为本线程的等待
     """
+    from analysis.models import dumps
+    from diagnostics.profiling import profile_block, profiled, request_authorized, requested_mode
+    from llm.report_jobs import report_status, submit_report_upgrade
+    from llm.template_report import render_template_reports
+    from ocr.rows import ocr_to_rows
+
     request_id = uuid.uuid4().hex[:10]
     started = time.time()
+    timer = _StageTimer()
+    req_dir = REQUESTS_DIR / request_id
+
+    profile_token = request.headers.get("x-ha-profile-token")
+    profile_mode = requested_mode(
+        request.headers.get("x-ha-profile"),
+        request.query_params.get("profile"),
+        token=profile_token,
+    )
+    profile_authorized = request_authorized(profile_token)
+    profile_dir = PROFILES_DIR / request_id
+    profiler = ExitStack()
+    session = profiler.enter_context(
+        profile_block(profile_mode, profile_dir, stage=lambda: timer.current)
+    )
 
-    # 1) 拿数据
-    if mode == "mock":
-        from data.mock_generator import generate_mock_health_data
-
-        data = generate_mock_health_data(
-            years=years,
-            severity=severity,
-            clamp_to_reference=clamp_to_reference,
+    try:
+        # 1) 拿数据
+        if mode == "mock":
+            with timer.stage("data"):
+                from data.mock_generator import generate_mock_health_data
+
+                data = generate_mock_health_data(
+                    years=years,
+                    severity=severity,
+                    clamp_to_reference=clamp_to_reference,
+                )
+
+        elif mode == "ocr":
+            if file is None:
+                return {"error": "mode=ocr 时必须上传 file"}
+
+            with timer.stage("upload"):
+                # 保存上传文件到临时目录（outputs/uploads）
+                up_dir = OUTPUT_DIR / "uploads"
+                up_dir.mkdir(exist_ok=True)
+                suffix = Path(file.filename or "").suffix or ".png"
+                tmp_path = up_dir / f"{request_id}{suffix}"
+
+                content = file.file.read()
+                tmp_path.write_bytes(content)
+
+            # 调用步骤一 OCR（HA_OCR_STUB=1 时走替身，便于压测）
+            # ocr_extract(image_path) 返回 extracted_data（键值对）
+            # 但是 run_analysis 需要 list[{"year":..., ...}]
+            # 所以这里需要做一个“适配”：
+            with timer.stage("ocr"):
+                extracted = _ocr_extract(str(tmp_path))
+
+            # 把 OCR 结果当作“今年一次体检”（与命令行共用 ocr/rows.py 的适配；years 只用于模拟数据）
+            data = ocr_to_rows(extracted)
+
+        else:
+            return {"error": f"unknown mode: {mode}"}
+
+        # 2) 分析 + 画图
+        with timer.stage("analysis"):
+            req_dir.mkdir(parents=True, exist_ok=True)
+            cohort_profile = {"sex": sex, "age": age} if (sex or age is not None) else None
+            analysis_result = _run_analysis(data, req_dir, profile=cohort_profile)
+
+        # 3) 模板报告（毫秒级），LLM 报告稍后在后台替换
+        with timer.stage("report"):
+            reports = render_template_reports(data, analysis_result, audience=audience)
+            generate = _llm_report_generator(data, analysis_result, audience=audience)
+            if generate is not None:
+                generate = profiled(generate, profile_mode, profile_dir, name="profile_llm")
+
+        # 4) 汇总输出（把 figures 转 URL）
+        with timer.stage("save"):
+            figures_abs = analysis_result.figure_paths
+            figures_url = _as_public_urls(figures_abs)
+            # 有 LLM 升级时模板版 PDF 延迟到第一次下载再渲染；没有升级的模板版就是最终版，直接渲染
+            pdf_hash = _submit_pdf(reports, figures_abs, request_id, lazy=generate is not None)
+
+            payload = {
+                "request_id": request_id,
+                "mode": mode,
+                "elapsed_sec": round(time.time() - started, 3),
+                "timings": timer.timings,
+                "data": data,
+                "warnings": analysis_result.warning_texts,
+                "summary": analysis_result.summary,
+                "figures": figures_url,
+                "report_child": reports.get("report_child", ""),
+                "report_elder": reports.get("report_elder", ""),
+                "report_source": "template",
+                "report_status": "template" if generate is None else "pending",
+                "report_url": f"/report/{request_id}",
+                "artifacts": {
+                    "report_json": str(req_dir / "report.json"),
+                    "report_pdf": None if pdf_hash is None else f"/report/pdf/{pdf_hash}",
+                },
+            }
+
+            # 只序列化一次（orjson），同一份字节既写 report.json 也作为响应体
+            body = dumps(payload)
+            _save_payload(body, req_dir)
+
+        def _on_llm_ready(llm_reports: dict[str, str]) -> dict[str, Any]:
+            # LLM 版就绪：重写 report.json，重新导出 PDF
+            llm_pdf = _submit_pdf(llm_reports, figures_abs, request_id)
+            artifacts = {
+                **payload["artifacts"],
+                "report_pdf": None if llm_pdf is None else f"/report/pdf/{llm_pdf}",
+            }
+            _save_payload(
+                dumps({**payload, **llm_reports, "report_source": "llm",
+                       "report_status": "ready", "artifacts": artifacts}),
+                req_dir,
+            )
+            return {"artifacts": artifacts}
+
+        # report.json 先落盘再提交，避免后台回调写入的 LLM 版被模板版覆盖
+        job = submit_report_upgrade(
+            request_id,
+            reports,
+            generate=generate,
+            on_ready=_on_llm_ready,
+            extra={"artifacts": payload["artifacts"]},
+            state_path=req_dir / "report_status.json",
         )
+        if job is None and generate is not None:
+            # 升级队列已满：不会有 LLM 版，响应和 report.json 直接标成最终模板版
+            payload = {**payload, "report_status": "template"}
+            body = dumps(payload)
+            _save_payload(body, req_dir)
+
+        wait_sec = float(os.getenv("HA_LLM_WAIT_SEC", "0"))
+        if job is not None and wait_sec > 0:
+            with timer.stage("llm_wait"):
+                # 等待超时不会取消后台任务，LLM 版之后仍会替换
+                wait_futures([job], timeout=wait_sec)
+            current = report_status(request_id)
+            if current is not None and current["status"] != "pending":
+                payload = {
+                    **payload,
+                    "timings": timer.timings,
+                    "report_child": current["report_child"],
+                    "report_elder": current["report_elder"],
+                    "report_source": current["source"],
+                    "report_status": current["status"],
+                    "artifacts": current.get("artifacts", payload["artifacts"]),
+                }
+                body = dumps(payload)
+
+    except Exception as e:
+        from llm.limiter import LLMRejectedError
+
+        stage = timer.current
+        if session is not None:
+            session.notes = f"error at stage {stage}: {type(e).__name__}: {e}\ntimings {timer.timings}"
+        profiler.close()
+
+        # 统一返回出错阶段，压测时可以按阶段统计错误
+        # 被限流 / 熔断拒绝时返回 503，表示“稍后再试”而不是服务故障
+        return JSONResponse(
+            {
+                "request_id": request_id,
+                "error": f"{type(e).__name__}: {e}",
+                "stage": stage,
+                "timings": timer.timings,
+                "profile": _profile_artifacts(session, request_id, profile_authorized),
+            },
+            status_code=503 if isinstance(e, LLMRejectedError) else 500,
+        )
+    finally:
+        # 正常结束 / 提前 return（参数错误）都在这里停掉剖析并写文件；重复 close 无副作用
+        if session is not None and not session.notes:
+            session.notes = f"timings {timer.timings}"
+        profiler.close()
+
+    profile_info = _profile_artifacts(session, request_id, profile_authorized)
+    if profile_info is not None:
+        payload = {**payload, "artifacts": {**payload["artifacts"], "profile": profile_info}}
+        body = dumps(payload)
+
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/report/{request_id}")
+def report(request_id: str):
+    """
+    查询某次 /analyze 的当前报告
+    - status=pending：仍是模板版，LLM 版生成中，前端稍后重试
+    - status=ready：已替换为 LLM 版
+    - status=template：最终使用模板版（reason 说明原因：无 key / 超时 / 出错）
+    状态同时落盘在 requests/{request_id}/report_status.json，多 worker / 重启后也能查到
+    """
+    from llm.report_jobs import report_status
+
+    if Path(request_id).name != request_id:
+        return JSONResponse({"status": "missing"}, status_code=404)
+    current = report_status(request_id, state_path=REQUESTS_DIR / request_id / "report_status.json")
+    if current is None:
+        return JSONResponse({"status": "missing"}, status_code=404)
+    return {"request_id": request_id, **current}
+
 
-    elif mode == "ocr":
-        if file is None:
-            return {"error": "mode=ocr 时必须上传 file"}
-
-        # 保存上传文件到临时目录（outputs/uploads）
-        up_dir = OUTPUT_DIR / "uploads"
-        up_dir.mkdir(exist_ok=True)
-        suffix = Path(file.filename or "").suffix or ".png"
-        tmp_path = up_dir / f"{request_id}{suffix}"
-
-        content = await file.read()
-        tmp_path.write_bytes(content)
-
-        # 调用你的步骤一 OCR
-        from ocr.extractor import ocr_extract
-
-        # 你现在 ocr_extract(image_path) 返回 extracted_data（键值对）
-        # 但是 run_analysis 需要 list[{"year":..., ...}]
-        # 所以这里需要做一个“适配”：
-        extracted = ocr_extract(str(tmp_path))
-
-        # 简单适配：把 OCR 结果当作“当年一次体检”
-        # 你后面会升级为：识别“日期/年份”，或支持多页多份报告
-        # 注意：OCR 输出目前多是字符串，这里尽量转 float/int
-        def to_num(x: Any) -> Any:
-            try:
-                if isinstance(x, str) and x.strip() == "":
-                    return x
-                if isinstance(x, str) and "." in x:
-                    return float(x)
-                if isinstance(x, str):
-                    return int(float(x))
-                return x
-            except Exception:
-                return x
-
-        item = {"year": int(years)}
-        for k, v in extracted.items():
-            item[k] = to_num(v)
-
-        data = [item]
-
-    else:
-        return {"error": f"unknown mode: {mode}"}
-
-    # 2) 分析 + 画图
-    analysis_result = _run_analysis(data)
-
-    # 3) LLM 报告
-    reports = _run_llm_reports(data, analysis_result, audience=audience)
-
-    # 4) 汇总输出（把 figures 转 URL）
-    figures_abs = analysis_result.get("figures", {})
-    figures_url = _as_public_urls(figures_abs)
-
-    payload = {
-        "request_id": request_id,
-        "mode": mode,
-        "elapsed_sec": round(time.time() - started, 3),
-        "data": data,
-        "warnings": analysis_result.get("warnings", []),
-        "figures": figures_url,
-        "report_child": reports.get("report_child", ""),
-        "report_elder": reports.get("report_elder", ""),
-    }
-
-    report_path = _save_payload(payload, OUTPUT_DIR)
-
-    return {
-        **payload,
-        "artifacts": {
-            "report_json": str(report_path),
-        },
-    }
+@app.get("/profile/{request_id}/{filename}")
+def profile_file(request_id: str, filename: str, request: Request):
+    """
+    下载剖析文件（profile.prof / profile.txt / profile.folded / profile_llm.*）
+    与按请求开启剖析同一套校验：HA_PROFILE_ALLOW_REQUEST=1 且 X-HA-Profile-Token 正确，否则一律 404
+    """
+    from diagnostics.profiling import request_authorized
+
+    if not request_authorized(request.headers.get("x-ha-profile-token")):
+        return JSONResponse({"status": "missing"}, status_code=404)
+    path = (PROFILES_DIR / request_id / filename).resolve()
+    if not path.is_relative_to(PROFILES_DIR.resolve()) or not path.is_file():
+        return JSONResponse({"status": "missing"}, status_code=404)
+    return FileResponse(path, filename=filename)
+
+
+@app.get("/report/pdf/{content_hash}")
+def report_pdf(content_hash: str):
+    """
+    下载 PDF 报告（按内容哈希缓存）
+    - 已生成：直接返回文件
+    - 生成中：202，前端稍后重试
+    - 缓存里没有（服务重启 / 被清理）：从该请求的 report.json 重新生成，同样返回 202
+    - 报告已升级为 LLM 版：404 + 当前版本的 report_pdf 链接
+    """
+    from export.pdf import report_pdf_status
+
+    try:
+        status, path, error = report_pdf_status(content_hash, PDF_CACHE_DIR)
+    except ValueError:
+        return JSONResponse({"error": "invalid content hash"}, status_code=400)
+
+    if status == "ready":
+        return FileResponse(path, media_type="application/pdf", filename="health_report.pdf")
+    if status == "pending":
+        return JSONResponse({"status": "pending"}, status_code=202)
+    if status == "failed":
+        return JSONResponse({"status": "failed", "error": error}, status_code=500)
+
+    regenerated = _regenerate_pdf(content_hash)
+    if regenerated == content_hash:
+        return JSONResponse({"status": "pending"}, status_code=202)
+    if regenerated is not None:
+        return JSONResponse(
+            {"status": "superseded", "report_pdf": f"/report/pdf/{regenerated}"}, status_code=404
+        )
+    return JSONResponse({"status": "missing"}, status_code=404)
@@ -0,0 +1,257 @@
+# benchmarks/loadtest.py
+"""
+/analyze 端到端压测
+
+# 已有 API 服务：
+python -m benchmarks.loadtest --url http://127.0.0.1:8000 --mode mock -n 200 -c 16
+
+# 一键：起假 LLM + 起 uvicorn（OCR 替身），再压测
+python -m benchmarks.loadtest --spawn-api --mode ocr -n 100 -c 8 --llm-latency lognormal:-1,0.5 --llm-error-429 0.1
+
+# LLM 报告默认在后台生成（/analyze 先返回模板版）；--llm-wait 让 API 最多同步等待这么多秒
+python -m benchmarks.loadtest --spawn-api -n 100 -c 8 --llm-wait 30
+
+输出：端到端 p50/p95/p99、吞吐、每个阶段（data/upload/ocr/analysis/report/save/llm_wait）的分位数、按阶段/状态码的错误分布
+各阶段耗时来自服务端的 timings；queue/overhead = 端到端延迟 - 各阶段之和，
+即排队（线程池 / 事件循环被占用）+ 网络 + 序列化的时间，这一行明显变大说明瓶颈不在任何一个阶段里
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from diagnostics.metrics import percentile
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+
+# 1x1 PNG：OCR 替身模式下不关心图片内容
+_TINY_PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010802000000907753de"
+    "0000000c49444154789c63f8ffff3f0005fe02fe0def46b80000000049454e44ae426082"
+)
+
+
+def _multipart(fields: Dict[str, str], files: Dict[str, Tuple[str, bytes, str]]) -> Tuple[bytes, str]:
+    boundary = uuid.uuid4().hex
+    parts: List[bytes] = []
+    for k, v in fields.items():
+        parts.append(
+            f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"\r\n\r\n{v}\r\n'.encode("utf-8")
+        )
+    for k, (filename, data, ctype) in files.items():
+        parts.append(
+            (
+                f'--{boundary}\r\nContent-Disposition: form-data; name="{k}"; filename="{filename}"\r\n'
+                f"Content-Type: {ctype}\r\n\r\n"
+            ).encode("utf-8")
+            + data
+            + b"\r\n"
+        )
+    parts.append(f"--{boundary}--\r\n".encode("utf-8"))
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def _one_request(url: str, mode: str, image: bytes, timeout: float) -> Dict[str, Any]:
+    fields = {"mode": mode, "years": "5", "severity": "1.2", "audience": "both"}
+    files = {"file": ("report.png", image, "image/png")} if mode == "ocr" else {}
+    body, ctype = _multipart(fields, files)
+    req = urllib.request.Request(
+        url.rstrip("/") + "/analyze", data=body, method="POST", headers={"Content-Type": ctype}
+    )
+
+    t0 = time.perf_counter()
+    status = 0
+    payload: Dict[str, Any] = {}
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            status = resp.status
+            payload = json.loads(resp.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        status = e.code
+        try:
+            payload = json.loads(e.read() or b"{}")
+        except ValueError:
+            payload = {}
+    except Exception as e:
+        payload = {"error": f"{type(e).__name__}: {e}", "stage": "client"}
+    elapsed = time.perf_counter() - t0
+
+    ok = status == 200 and "error" not in payload
+    return {
+        "ok": ok,
+        "status": status,
+        "latency": elapsed,
+        "timings": payload.get("timings") or {},
+        "stage": None if ok else (payload.get("stage") or "unknown"),
+        "error": None if ok else str(payload.get("error", ""))[:120],
+    }
+
+
+def run_load(
+    url: str,
+    mode: str = "mock",
+    requests: int = 100,
+    concurrency: int = 8,
+    image: bytes = _TINY_PNG,
+    timeout: float = 300.0,
+) -> Dict[str, Any]:
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        results = list(pool.map(lambda _: _one_request(url, mode, image, timeout), range(requests)))
+    wall = time.perf_counter() - started
+
+    latencies = sorted(r["latency"] for r in results if r["ok"])
+    per_stage: Dict[str, List[float]] = defaultdict(list)
+    for r in results:
+        for stage, sec in r["timings"].items():
+            per_stage[stage].append(sec)
+    # 服务端各阶段之外的时间：排队等待、网络、框架开销（只统计成功请求）
+    overhead = [max(0.0, r["latency"] - sum(r["timings"].values())) for r in results if r["ok"]]
+
+    def pcts(vals: List[float]) -> Dict[str, Any]:
+        vals = sorted(vals)
+        return {
+            "n": len(vals),
+            "p50": percentile(vals, 50),
+            "p95": percentile(vals, 95),
+            "p99": percentile(vals, 99),
+        }
+
+    errors = Counter((r["stage"], r["status"]) for r in results if not r["ok"])
+    samples: Dict[str, str] = {}
+    for r in results:
+        if not r["ok"] and r["stage"] not in samples:
+            samples[r["stage"]] = r["error"]
+
+    return {
+        "mode": mode,
+        "requests": requests,
+        "concurrency": concurrency,
+        "wall_sec": round(wall, 3),
+        "throughput_rps": round(requests / wall, 2) if wall > 0 else None,
+        "ok": len(latencies),
+        "latency": pcts(latencies),
+        "stages": {**{k: pcts(v) for k, v in sorted(per_stage.items())}, "queue/overhead": pcts(overhead)},
+        "errors": [
+            {"stage": stage, "status": status, "count": n, "sample": samples.get(stage)}
+            for (stage, status), n in errors.most_common()
+        ],
+    }
+
+
+def _print_report(res: Dict[str, Any]) -> None:
+    def fmt(x: Optional[float]) -> str:
+        return "-" if x is None else f"{x * 1000:8.1f}ms"
+
+    print(
+        f"\nmode={res['mode']} requests={res['requests']} concurrency={res['concurrency']} "
+        f"wall={res['wall_sec']}s throughput={res['throughput_rps']} req/s ok={res['ok']}"
+    )
+    lat = res["latency"]
+    print(f"{'end-to-end':<14} n={lat['n']:<5} p50={fmt(lat['p50'])} p95={fmt(lat['p95'])} p99={fmt(lat['p99'])}")
+    for stage, s in res["stages"].items():
+        print(f"{stage:<14} n={s['n']:<5} p50={fmt(s['p50'])} p95={fmt(s['p95'])} p99={fmt(s['p99'])}")
+    if res["errors"]:
+        print("\nerrors:")
+        for e in res["errors"]:
+            print(f"  stage={e['stage']} status={e['status']} count={e['count']} e.g. {e['sample']}")
+
+
+def _wait_http(url: str, timeout: float = 30.0) -> None:
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=2):
+                return
+        except Exception:
+            time.sleep(0.3)
+    raise RuntimeError(f"server not ready: {url}")
+
+
+def _spawn_api(
+    port: int,
+    llm_url: Optional[str],
+    ocr_latency_ms: float,
+    llm_wait_sec: float = 0.0,
+) -> subprocess.Popen:
+    env = dict(os.environ)
+    env["HA_OCR_STUB"] = "1"
+    env["HA_OCR_STUB_LATENCY_MS"] = str(ocr_latency_ms)
+    env["HA_LLM_WAIT_SEC"] = str(llm_wait_sec)
+    if llm_url:
+        env["DEEPSEEK_API_KEY"] = env.get("DEEPSEEK_API_KEY") or "fake"
+        env["DEEPSEEK_BASE_URL"] = llm_url
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "api.app:app", "--port", str(port), "--log-level", "warning"],
+        cwd=str(PROJECT_ROOT),
+        env=env,
+    )
+    _wait_http(f"http://127.0.0.1:{port}/health")
+    return proc
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="/analyze 压测")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--mode", choices=["mock", "ocr"], default="mock")
+    parser.add_argument("-n", "--requests", type=int, default=100)
+    parser.add_argument("-c", "--concurrency", type=int, default=8)
+    parser.add_argument("--image", default=None, help="ocr 模式上传的图片（默认 1x1 PNG）")
+    parser.add_argument("--timeout", type=float, default=300.0)
+    parser.add_argument("--json", action="store_true", help="输出 JSON 结果")
+    # 一键模式
+    parser.add_argument("--spawn-api", action="store_true", help="自动启动假 LLM + uvicorn（OCR 替身）")
+    parser.add_argument("--api-port", type=int, default=8765)
+    parser.add_argument("--no-llm", action="store_true", help="不启用 LLM 阶段")
+    parser.add_argument("--llm-latency", default="const:0.3")
+    parser.add_argument("--llm-error-429", type=float, default=0.0)
+    parser.add_argument("--llm-error-5xx", type=float, default=0.0)
+    parser.add_argument("--llm-retry-after", type=int, default=1)
+    parser.add_argument("--ocr-latency-ms", type=float, default=800)
+    parser.add_argument("--llm-wait", type=float, default=0.0, help="API 同步等待 LLM 版报告的秒数")
+    args = parser.parse_args()
+
+    image = Path(args.image).read_bytes() if args.image else _TINY_PNG
+    url = args.url
+    proc = None
+    if args.spawn_api:
+        llm_url = None
+        if not args.no_llm:
+            from llm.fake_server import FakeLLMConfig, serve_fake_llm
+
+            fake = serve_fake_llm(
+                port=0,
+                config=FakeLLMConfig(
+                    latency=args.llm_latency,
+                    error_429=args.llm_error_429,
+                    error_5xx=args.llm_error_5xx,
+                    retry_after=args.llm_retry_after,
+                ),
+                background=True,
+            )
+            llm_url = f"http://127.0.0.1:{fake.server_address[1]}/v1"
+        proc = _spawn_api(args.api_port, llm_url, args.ocr_latency_ms, args.llm_wait)
+        url = f"http://127.0.0.1:{args.api_port}"
+
+    try:
+        result = run_load(url, args.mode, args.requests, args.concurrency, image, args.timeout)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=10)
+
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+    else:
+        _print_report(result)
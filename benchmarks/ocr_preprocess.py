@@ -0,0 +1,130 @@
+# benchmarks/ocr_preprocess.py
+"""
+OCR 前处理档位基准：延迟 vs 提取准确率
+
+python -m benchmarks.ocr_preprocess samples/ --truth samples/truth.json
+python -m benchmarks.ocr_preprocess samples/ --presets off,fast,balanced --repeat 3
+
+truth.json 格式：{"文件名.png": {"Haemoglobin": "13.8", "RBC": "4.62", ...}, ...}
+没有 truth 时，以 "off"（原图直接识别）的结果作为参照，报告各档位与原图的一致率。
+计时与生产路径（ocr.extractor.ocr_extract）一致：从内存字节 Image.open -> preprocess_image，
+解码计入前处理耗时，JPEG 的缩小解码（draft）也能生效；准确率按每次重复都计分后取平均。
+"""
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from diagnostics.metrics import percentile
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".tif", ".tiff", ".webp"}
+
+
+def _same_value(a: Any, b: Any) -> bool:
+    try:
+        return abs(float(a) - float(b)) < 1e-6
+    except (TypeError, ValueError):
+        return str(a).strip() == str(b).strip()
+
+
+def _score(extracted: Dict[str, Any], expected: Dict[str, Any]) -> Optional[float]:
+    if not expected:
+        return None
+    hits = sum(1 for k, v in expected.items() if k in extracted and _same_value(extracted[k], v))
+    return hits / len(expected)
+
+
+def run_benchmark(
+    images: List[Path],
+    presets: List[str],
+    truth: Optional[Dict[str, Dict[str, Any]]] = None,
+    repeat: int = 1,
+) -> List[Dict[str, Any]]:
+    import numpy as np
+    from PIL import Image
+
+    from ocr.extractor import extract_indicators, get_ocr
+    from ocr.preprocess import get_preset, preprocess_image
+
+    ocr = get_ocr()
+    # 图片字节先读进内存（与 API 收到上传后一样），磁盘读取不计入
+    blobs = {img.name: img.read_bytes() for img in images}
+    # 预热：首次推理包含模型加载 / 图编译，不计入
+    ocr.predict(np.array(Image.open(io.BytesIO(blobs[images[0].name])).convert("RGB")))
+
+    # 没有 truth 时用原图结果当参照
+    reference = truth
+    if reference is None:
+        reference = {}
+        for img in images:
+            out, _ = preprocess_image(Image.open(io.BytesIO(blobs[img.name])), **get_preset("off"))
+            reference[img.name] = extract_indicators(ocr.predict(np.array(out)))
+
+    rows = []
+    for name in presets:
+        cfg = get_preset(name)
+        pre_ms: List[float] = []
+        ocr_ms: List[float] = []
+        pixels: List[int] = []
+        scores: List[float] = []
+        for img in images:
+            data = blobs[img.name]
+            for _ in range(repeat):
+                # 不提前 load()：解码放在计时区内，让 preprocess_image 里的 draft() 决定解码尺寸
+                t0 = time.perf_counter()
+                out, _ = preprocess_image(Image.open(io.BytesIO(data)), **cfg)
+                t1 = time.perf_counter()
+                result = ocr.predict(np.array(out))
+                t2 = time.perf_counter()
+                pre_ms.append((t1 - t0) * 1000)
+                ocr_ms.append((t2 - t1) * 1000)
+                pixels.append(out.size[0] * out.size[1])
+                s = _score(extract_indicators(result), reference.get(img.name, {}))
+                if s is not None:
+                    scores.append(s)
+        total = sorted(a + b for a, b in zip(pre_ms, ocr_ms))
+        rows.append({
+            "preset": name,
+            "images": len(images),
+            "megapixels_mean": round(sum(pixels) / len(pixels) / 1e6, 2),
+            "preprocess_ms_mean": round(sum(pre_ms) / len(pre_ms), 1),
+            "ocr_ms_mean": round(sum(ocr_ms) / len(ocr_ms), 1),
+            "total_ms_p50": round(percentile(total, 50), 1),
+            "total_ms_p95": round(percentile(total, 95), 1),
+            "accuracy": None if not scores else round(sum(scores) / len(scores), 3),
+        })
+    return rows
+
+
+if __name__ == "__main__":
+    from ocr.preprocess import PRESETS
+
+    parser = argparse.ArgumentParser(description="OCR 前处理档位基准")
+    parser.add_argument("image_dir")
+    parser.add_argument("--truth", default=None, help="期望提取结果 JSON（按文件名）")
+    parser.add_argument("--presets", default=",".join(PRESETS))
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    images = sorted(p for p in Path(args.image_dir).iterdir() if p.suffix.lower() in IMAGE_SUFFIXES)
+    if not images:
+        raise SystemExit(f"no images in {args.image_dir}")
+    truth = json.loads(Path(args.truth).read_text(encoding="utf-8")) if args.truth else None
+
+    rows = run_benchmark(images, args.presets.split(","), truth, args.repeat)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        label = "accuracy" if truth else "agree_w_off"
+        print(f"{'preset':<10}{'MP':>7}{'pre ms':>9}{'ocr ms':>9}{'p50 ms':>9}{'p95 ms':>9}{label:>13}")
+        for r in rows:
+            acc = "-" if r["accuracy"] is None else f"{r['accuracy']:.1%}"
+            print(
+                f"{r['preset']:<10}{r['megapixels_mean']:>7}{r['preprocess_ms_mean']:>9}"
+                f"{r['ocr_ms_mean']:>9}{r['total_ms_p50']:>9}{r['total_ms_p95']:>9}{acc:>13}"
+            )
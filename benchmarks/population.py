@@ -0,0 +1,118 @@
+# benchmarks/population.py
+"""
+人群百分位索引基准：构建吞吐 / 合并 / 落盘与加载 / 查询延迟 / 相对精确百分位的误差
+
+python -m benchmarks.population
+python -m benchmarks.population --values 1000000 --k 200
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+import numpy as np
+
+from analysis.population import KLLSketch, PopulationIndex, add_synthetic_cohort
+from diagnostics.metrics import percentile
+
+
+def _pct_us(vals: List[float], p: int) -> float:
+    return round(percentile(sorted(vals), p) * 1e6, 2)
+
+
+def _exact_percentile(sorted_vals: np.ndarray, x: float) -> float:
+    lo = np.searchsorted(sorted_vals, x, side="left")
+    hi = np.searchsorted(sorted_vals, x, side="right")
+    return 100.0 * (lo + hi) / 2.0 / len(sorted_vals)
+
+
+def run_benchmark(values: int = 500_000, k: int = 200, persons: int = 2000, queries: int = 20000) -> Dict[str, Any]:
+    rng = np.random.default_rng(0)
+    # 对数正态近似体检指标的偏态分布（如甘油三酯）
+    data = rng.lognormal(mean=0.3, sigma=0.45, size=values)
+    truth = np.sort(data)
+
+    # 1) 单个草图：构建吞吐 + 误差
+    t0 = time.perf_counter()
+    single = KLLSketch(k, seed=1)
+    single.update_many(data.tolist())
+    build_sec = time.perf_counter() - t0
+
+    # 2) 分成 8 份各自构建再合并（模拟多文件 / 多进程增量构建）
+    parts = [KLLSketch(k, seed=i) for i in range(8)]
+    for i, part in enumerate(np.array_split(data, 8)):
+        parts[i].update_many(part.tolist())
+    t0 = time.perf_counter()
+    merged = parts[0]
+    for part in parts[1:]:
+        merged.merge(part)
+    merge_sec = time.perf_counter() - t0
+
+    probes = np.quantile(truth, np.linspace(0.01, 0.99, 99))
+    errors = {}
+    for name, sk in (("single", single), ("merged", merged)):
+        cdf = sk.freeze()
+        errors[name] = round(max(abs(cdf.percentile(x) - _exact_percentile(truth, x)) for x in probes), 3)
+
+    # 3) 完整索引：模拟队列 -> 落盘 -> 只读加载 -> 查询
+    work = Path(tempfile.mkdtemp(prefix="ha_population_"))
+    try:
+        index = PopulationIndex(k=k)
+        t0 = time.perf_counter()
+        observations = add_synthetic_cohort(index, persons)
+        index_build_sec = time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        manifest = index.save(work)
+        save_sec = time.perf_counter() - t0
+        disk_kb = sum(p.stat().st_size for p in work.iterdir()) / 1024
+
+        t0 = time.perf_counter()
+        frozen = PopulationIndex.load(work, frozen_only=True)
+        load_sec = time.perf_counter() - t0
+
+        metrics = ["ldl", "sbp", "fasting_glucose", "uric_acid"]
+        sexes = ["M", "F", None]
+        lookups: List[float] = []
+        for i in range(queries):
+            metric = metrics[i % len(metrics)]
+            t0 = time.perf_counter()
+            frozen.lookup(metric, 3.0 + (i % 50) / 10, sexes[i % 3], 25 + i % 60)
+            lookups.append(time.perf_counter() - t0)
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+    return {
+        "k": k,
+        "values": values,
+        "sketch_retained_items": sum(len(c) for c in single.compactors),
+        "sketch_build_values_per_sec": int(values / build_sec),
+        "merge_8_parts_ms": round(merge_sec * 1000, 2),
+        "max_abs_percentile_error_single": errors["single"],
+        "max_abs_percentile_error_merged": errors["merged"],
+        "index_persons": persons,
+        "index_observations": observations,
+        "index_sketches": len(manifest["keys"]),
+        "index_build_sec": round(index_build_sec, 2),
+        "index_save_ms": round(save_sec * 1000, 2),
+        "index_disk_kb": round(disk_kb, 1),
+        "index_load_ms": round(load_sec * 1000, 2),
+        "lookup_us_p50": _pct_us(lookups, 50),
+        "lookup_us_p99": _pct_us(lookups, 99),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="人群百分位索引基准")
+    parser.add_argument("--values", type=int, default=500_000, help="单个草图写入的值个数")
+    parser.add_argument("--k", type=int, default=200)
+    parser.add_argument("--persons", type=int, default=2000, help="模拟队列人数")
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(args.values, args.k, args.persons, args.queries), ensure_ascii=False, indent=2))
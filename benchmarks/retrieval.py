@@ -0,0 +1,101 @@
+# benchmarks/retrieval.py
+"""
+指引检索基准：索引构建 / mmap 加载 / 查询延迟
+
+python -m benchmarks.retrieval
+python -m benchmarks.retrieval --scale 200     # 把语料复制 200 份，观察规模变大后的表现
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List
+
+from data.reference_ranges import REFERENCE_RANGES
+from diagnostics.metrics import percentile
+from llm.retrieval import DEFAULT_CORPUS_DIR, GuidanceIndex, build_index
+
+
+def _pct_us(vals: List[float], p: int) -> float:
+    return round(percentile(sorted(vals), p) * 1e6, 1)
+
+
+def _scaled_corpus(src: Path, dst: Path, scale: int) -> None:
+    dst.mkdir(parents=True, exist_ok=True)
+    for p in sorted(src.glob("*.md")):
+        text = p.read_text(encoding="utf-8")
+        for i in range(scale):
+            (dst / f"{p.stem}_{i:04d}.md").write_text(text, encoding="utf-8")
+
+
+def run_benchmark(scale: int = 1, builds: int = 5, queries: int = 2000) -> Dict[str, Any]:
+    work = Path(tempfile.mkdtemp(prefix="ha_retrieval_"))
+    try:
+        corpus = DEFAULT_CORPUS_DIR
+        if scale > 1:
+            corpus = work / "corpus"
+            _scaled_corpus(DEFAULT_CORPUS_DIR, corpus, scale)
+        index_dir = work / "index"
+
+        build_times = []
+        for _ in range(builds):
+            t0 = time.perf_counter()
+            info = build_index(corpus, index_dir)
+            build_times.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        index = GuidanceIndex(index_dir)
+        load_sec = time.perf_counter() - t0
+        # 数据文件在 v{版本}-{语料哈希}/ 子目录里，要递归统计
+        index_bytes = sum(p.stat().st_size for p in index_dir.rglob("*") if p.is_file())
+
+        metrics = [(k, v["name"]) for k, v in REFERENCE_RANGES.items()]
+        flags = ["HIGH", "LOW", "UP"]
+
+        # 未缓存：每次都做 BM25 打分 + top-k
+        raw: List[float] = []
+        for i in range(queries):
+            key, name = metrics[i % len(metrics)]
+            t0 = time.perf_counter()
+            index.search(f"{name} {key} 偏高 复查", k=2, extra_terms=(f"metric:{key}",),
+                         restrict_to=index.metric_chunks.get(key))
+            raw.append(time.perf_counter() - t0)
+
+        # 按指标检索（与 retrieve_guidance 相同路径，带进程内缓存）
+        cached: List[float] = []
+        for i in range(queries):
+            key, name = metrics[i % len(metrics)]
+            t0 = time.perf_counter()
+            index.search_metric(key, name, flags[i % len(flags)], k=2)
+            cached.append(time.perf_counter() - t0)
+
+        return {
+            "scale": scale,
+            "files": info["files"],
+            "chunks": info["chunks"],
+            "vocab": info["vocab"],
+            "postings": info["postings"],
+            "index_kb": round(index_bytes / 1024, 1),
+            "build_ms_mean": round(sum(build_times) / len(build_times) * 1000, 2),
+            "load_ms": round(load_sec * 1000, 2),
+            "query_us_p50": _pct_us(raw, 50),
+            "query_us_p99": _pct_us(raw, 99),
+            "cached_query_us_p50": _pct_us(cached, 50),
+            "cached_query_us_p99": _pct_us(cached, 99),
+        }
+    finally:
+        shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="指引检索基准")
+    parser.add_argument("--scale", type=int, default=1, help="语料复制倍数")
+    parser.add_argument("--builds", type=int, default=5)
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(args.scale, args.builds, args.queries), ensure_ascii=False, indent=2))
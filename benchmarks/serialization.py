@@ -0,0 +1,111 @@
+# benchmarks/serialization.py
+"""
+分析结果的内存占用与序列化基准：旧 dict（含 DataFrame）vs AnalysisResult
+
+python -m benchmarks.serialization
+python -m benchmarks.serialization --requests 200 --years 20
+"""
+from __future__ import annotations
+
+import argparse
+import gc
+import gzip
+import json
+import time
+import tracemalloc
+from dataclasses import asdict
+from typing import Any, Callable, Dict, List
+
+import pandas as pd
+
+from analysis.models import AnalysisResult, dumps
+from analysis.stats import run_analysis
+from data.mock_generator import generate_mock_health_data
+
+
+def _legacy_result(rows: List[Dict[str, Any]], result: AnalysisResult) -> Dict[str, Any]:
+    """还原旧版 run_analysis 的返回结构：DataFrame + 每个指标一个嵌套 dict。"""
+    summary = {}
+    for k, m in result.summary.items():
+        d = asdict(m)
+        d.pop("key")
+        summary[k] = d
+    return {
+        "dataframe": pd.DataFrame(rows).sort_values("year").reset_index(drop=True),
+        "summary": summary,
+        "warnings": result.warning_texts,
+        "figures": result.figure_paths,
+    }
+
+
+def _retained_kb(build: Callable[[], Any], n: int) -> float:
+    """同时持有 n 个结果时，平均每个结果常驻的内存（KB）。"""
+    gc.collect()
+    tracemalloc.start()
+    base = tracemalloc.get_traced_memory()[0]
+    held = [build() for _ in range(n)]
+    gc.collect()
+    current = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del held
+    return round((current - base) / n / 1024, 2)
+
+
+def _time_us(fn: Callable[[], bytes], loops: int) -> float:
+    t0 = time.perf_counter()
+    for _ in range(loops):
+        fn()
+    return round((time.perf_counter() - t0) / loops * 1e6, 1)
+
+
+def run_benchmark(requests: int = 100, years: int = 5, loops: int = 2000) -> Dict[str, Any]:
+    rows = generate_mock_health_data(years=years, severity=1.2)
+    result = run_analysis(rows, make_figures=False)
+
+    legacy_kb = _retained_kb(lambda: _legacy_result(rows, run_analysis(rows, make_figures=False)), requests)
+    typed_kb = _retained_kb(lambda: run_analysis(rows, make_figures=False), requests)
+
+    # API 响应体：数据 + 预警 + 摘要（报告正文用固定长度的占位文本）
+    report = "体检结果解读。" * 200
+    legacy = _legacy_result(rows, result)
+    legacy_payload = {
+        "data": rows,
+        "summary": legacy["summary"],
+        "warnings": legacy["warnings"],
+        "report_child": report,
+        "report_elder": report,
+    }
+    typed_payload = {
+        "data": rows,
+        "summary": result.summary,
+        "warnings": result.warning_texts,
+        "report_child": report,
+        "report_elder": report,
+    }
+
+    legacy_body = json.dumps(legacy_payload, ensure_ascii=False, indent=2).encode("utf-8")
+    typed_body = dumps(typed_payload)
+
+    return {
+        "years": years,
+        "metrics": len(result.summary),
+        "retained_kb_per_request_legacy": legacy_kb,
+        "retained_kb_per_request_typed": typed_kb,
+        "serialize_us_json_indent2": _time_us(
+            lambda: json.dumps(legacy_payload, ensure_ascii=False, indent=2).encode("utf-8"), loops
+        ),
+        "serialize_us_fast": _time_us(lambda: dumps(typed_payload), loops),
+        "body_bytes_json_indent2": len(legacy_body),
+        "body_bytes_fast": len(typed_body),
+        "body_bytes_fast_gzip": len(gzip.compress(typed_body, compresslevel=9)),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="分析结果内存 / 序列化基准")
+    parser.add_argument("--requests", type=int, default=100, help="同时持有的结果个数")
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--loops", type=int, default=2000)
+    args = parser.parse_args()
+
+    print(json.dumps(run_benchmark(args.requests, args.years, args.loops), ensure_ascii=False, indent=2))
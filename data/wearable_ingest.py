@@ -0,0 +1,284 @@
+# data/wearable_ingest.py
+from __future__ import annotations
+
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, Iterable, Iterator, List, Tuple
+
+from data.reference_ranges import REFERENCE_RANGES
+
+
+# 聚合时的量化精度：同一桶内按该精度计数，保证内存只和“不同取值个数”相关，
+# 且各文件的部分结果可以直接相加合并（百分位也随之可合并）
+WEARABLE_RESOLUTION = {
+    "resting_heart_rate": 1.0,
+    "weight_kg": 0.1,
+}
+DEFAULT_RESOLUTION = 0.01
+
+DEFAULT_CHUNKSIZE = 200_000
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+
+# 部分聚合结果：(metric, "YYYY-MM") -> Counter{量化值: 次数}
+Partial = Dict[Tuple[str, str], Counter]
+
+
+def _iter_chunks(path: str, chunksize: int) -> Iterator["Any"]:
+    """按块读取 CSV / JSONL，单块行数受 chunksize 限制（内存有界）。"""
+    import pandas as pd
+
+    lower = path.lower()
+    if lower.endswith((".jsonl", ".ndjson", ".jsonl.gz", ".ndjson.gz")):
+        # 时间戳保持原始字符串，由 _local_timestamps 统一按本地时间解析
+        reader = pd.read_json(path, lines=True, chunksize=chunksize, convert_dates=False)
+    elif lower.endswith((".csv", ".csv.gz")):
+        reader = pd.read_csv(path, chunksize=chunksize)
+    else:
+        raise ValueError(f"unsupported wearable file: {path}")
+
+    with reader:
+        yield from reader
+
+
+def _to_long(chunk: "Any") -> "Any":
+    """
+    统一成长表：timestamp / metric / value / unit
+    支持两种导出格式：
+      - 长表：timestamp, metric, value[, unit]
+      - 宽表：timestamp, resting_heart_rate, weight_kg ...（单位默认与参考区间一致）
+    """
+    import pandas as pd
+
+    if "metric" in chunk.columns:
+        cols = ["timestamp", "metric", "value"] + (["unit"] if "unit" in chunk.columns else [])
+        return chunk[cols]
+
+    metric_cols = [c for c in chunk.columns if c in REFERENCE_RANGES]
+    if not metric_cols:
+        return pd.DataFrame(columns=["timestamp", "metric", "value"])
+    # 宽表里某个指标当天没测是正常的：空单元格不算读数，也不计入拒绝数
+    return chunk.melt(
+        id_vars=["timestamp"], value_vars=metric_cols, var_name="metric", value_name="value"
+    ).dropna(subset=["value"])
+
+
+# 时间戳末尾的时区（Z / +08:00 / -0500）
+_TZ_SUFFIX = r"(?:Z|[+-]\d{2}:?\d{2})$"
+
+
+def _local_timestamps(raw: "Any") -> "Any":
+    """
+    解析为本地墙上时间（去掉时区偏移，不换算成 UTC）：
+    按月分桶要跟着用户当地的日期走，2024-02-01T00:30+08:00 属于 2 月而不是 UTC 的 1 月
+    """
+    import pandas as pd
+
+    if isinstance(raw.dtype, pd.DatetimeTZDtype):
+        return raw.dt.tz_localize(None)
+    if raw.dtype == object or pd.api.types.is_string_dtype(raw):
+        raw = raw.astype(str).str.strip().str.replace(_TZ_SUFFIX, "", regex=True)
+    return pd.to_datetime(raw, errors="coerce")
+
+
+def _aggregate_chunk(chunk: "Any", partial: Partial, stats: Dict[str, int]) -> None:
+    """校验 + 按月量化计数（全部向量化，不逐行 Python 循环）。"""
+    import numpy as np
+    import pandas as pd
+
+    long_df = _to_long(chunk)
+    stats["rows"] += int(long_df.shape[0])
+
+    # 1) 只保留已知指标
+    known = long_df["metric"].isin(list(REFERENCE_RANGES.keys()))
+    stats["rejected_metric"] += int((~known).sum())
+    long_df = long_df[known]
+
+    # 2) 单位必须与 REFERENCE_RANGES 一致（避免 lb / kg、次/分 混入）
+    if "unit" in long_df.columns:
+        expected = long_df["metric"].map({k: v.get("unit", "") for k, v in REFERENCE_RANGES.items()})
+        unit = long_df["unit"].fillna(expected).astype(str).str.strip()
+        unit_ok = unit == expected
+        stats["rejected_unit"] += int((~unit_ok).sum())
+        long_df = long_df[unit_ok]
+
+    # 3) 时间与数值可解析
+    ts = _local_timestamps(long_df["timestamp"])
+    val = pd.to_numeric(long_df["value"], errors="coerce")
+    ok = ts.notna() & val.notna() & np.isfinite(val)
+    stats["rejected_value"] += int((~ok).sum())
+
+    metric = long_df["metric"][ok]
+    if metric.empty:
+        return
+    ts = ts[ok]
+    month = ts.dt.year * 100 + ts.dt.month  # YYYYMM 整数，比 strftime 快得多
+    res = metric.map(WEARABLE_RESOLUTION).fillna(DEFAULT_RESOLUTION).astype(float)
+    q = (val[ok] / res).round().astype("int64")
+
+    counts = pd.DataFrame({"metric": metric, "month": month, "q": q}).groupby(
+        ["metric", "month", "q"], sort=False
+    ).size()
+    for (m, mon, qv), n in counts.items():
+        partial.setdefault((m, f"{mon // 100:04d}-{mon % 100:02d}"), Counter())[int(qv)] += int(n)
+    stats["accepted"] += int(counts.sum())
+
+
+def ingest_file(path: str, chunksize: int = DEFAULT_CHUNKSIZE) -> Dict[str, Any]:
+    """
+    单文件流式读取 + 部分聚合（可在子进程里运行）
+    返回：{"path", "partial", "stats"}
+    """
+    started = time.perf_counter()
+    partial: Partial = {}
+    stats = {"rows": 0, "accepted": 0, "rejected_metric": 0, "rejected_unit": 0, "rejected_value": 0}
+
+    for chunk in _iter_chunks(path, chunksize):
+        _aggregate_chunk(chunk, partial, stats)
+
+    stats["bytes"] = os.path.getsize(path)
+    stats["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return {"path": path, "partial": partial, "stats": stats}
+
+
+def _merge_partials(partials: Iterable[Partial]) -> Partial:
+    merged: Partial = {}
+    for p in partials:
+        for k, c in p.items():
+            merged.setdefault(k, Counter()).update(c)
+    return merged
+
+
+def _bucket_stats(
+    counter: Counter, resolution: float, percentiles: Tuple[int, ...]
+) -> Dict[str, Any]:
+    """从量化计数计算 count / mean / min / max / 百分位（最近秩法）。"""
+    keys = sorted(counter)
+    total = sum(counter.values())
+    mean = sum(k * n for k, n in counter.items()) / total
+
+    out: Dict[str, Any] = {
+        "count": total,
+        "mean": round(mean * resolution, 2),
+        "min": round(keys[0] * resolution, 2),
+        "max": round(keys[-1] * resolution, 2),
+    }
+
+    targets = [(p, max(1, -(-p * total // 100))) for p in percentiles]
+    cum = 0
+    ti = 0
+    for k in keys:
+        cum += counter[k]
+        while ti < len(targets) and cum >= targets[ti][1]:
+            out[f"p{targets[ti][0]}"] = round(k * resolution, 2)
+            ti += 1
+        if ti == len(targets):
+            break
+    return out
+
+
+def aggregate_wearable_files(
+    paths: List[str],
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    max_workers: int | None = None,
+    percentiles: Tuple[int, ...] = DEFAULT_PERCENTILES,
+) -> Dict[str, Any]:
+    """
+    多文件并行流式聚合
+    输出：
+      - monthly: {metric: {"YYYY-MM": {count, mean, min, max, p5...}}}
+      - yearly:  {metric: {YYYY: {...}}}
+      - stats:   行数 / 拒绝原因 / 吞吐（rows/s、MB/s）/ 每个文件的耗时
+    """
+    started = time.perf_counter()
+    paths = [str(p) for p in paths]
+    workers = max_workers or min(len(paths), os.cpu_count() or 1) or 1
+
+    if workers <= 1 or len(paths) <= 1:
+        results = [ingest_file(p, chunksize) for p in paths]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(ingest_file, paths, [chunksize] * len(paths)))
+
+    merged = _merge_partials(r["partial"] for r in results)
+
+    # 月桶直接由计数得到；年桶 = 同年各月计数相加（不重新读数据）
+    yearly_counters: Partial = {}
+    monthly: Dict[str, Dict[str, Any]] = {}
+    for (metric, month), counter in sorted(merged.items()):
+        res = WEARABLE_RESOLUTION.get(metric, DEFAULT_RESOLUTION)
+        monthly.setdefault(metric, {})[month] = _bucket_stats(counter, res, percentiles)
+        yearly_counters.setdefault((metric, month[:4]), Counter()).update(counter)
+
+    yearly: Dict[str, Dict[int, Any]] = {}
+    for (metric, year), counter in sorted(yearly_counters.items()):
+        res = WEARABLE_RESOLUTION.get(metric, DEFAULT_RESOLUTION)
+        yearly.setdefault(metric, {})[int(year)] = _bucket_stats(counter, res, percentiles)
+
+    elapsed = time.perf_counter() - started
+    totals = {k: sum(r["stats"][k] for r in results) for k in
+              ("rows", "accepted", "rejected_metric", "rejected_unit", "rejected_value", "bytes")}
+    stats = {
+        **totals,
+        "files": len(paths),
+        "workers": workers,
+        "elapsed_sec": round(elapsed, 3),
+        "rows_per_sec": round(totals["rows"] / elapsed, 1) if elapsed > 0 else None,
+        "mb_per_sec": round(totals["bytes"] / 1e6 / elapsed, 2) if elapsed > 0 else None,
+        "per_file": [{"path": r["path"], **r["stats"]} for r in results],
+    }
+    return {"monthly": monthly, "yearly": yearly, "stats": stats}
+
+
+def merge_into_rows(
+    rows: List[Dict[str, Any]],
+    aggregates: Dict[str, Any],
+    overwrite: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    把年度聚合均值并入 run_analysis 的输入（每年一条）
+    - rows 为空：直接用可穿戴数据生成年度行
+    - rows 非空：只补到已有年份上（避免某年只有可穿戴数据、其余指标全为空）
+    - overwrite=False 时体检值优先，可穿戴均值只用于补缺
+    """
+    yearly = aggregates.get("yearly", {})
+
+    if not rows:
+        years = sorted({y for per_year in yearly.values() for y in per_year})
+        return [
+            {"year": y, **{m: per_year[y]["mean"] for m, per_year in yearly.items() if y in per_year}}
+            for y in years
+        ]
+
+    merged = []
+    for r in rows:
+        item = dict(r)
+        for metric, per_year in yearly.items():
+            bucket = per_year.get(int(item["year"]))
+            if bucket is None:
+                continue
+            if overwrite or item.get(metric) is None:
+                item[metric] = bucket["mean"]
+        merged.append(item)
+    return merged
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="可穿戴数据流式聚合")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args()
+
+    agg = aggregate_wearable_files(args.paths, chunksize=args.chunksize, max_workers=args.workers)
+    s = agg["stats"]
+    print(
+        f"files={s['files']} rows={s['rows']} accepted={s['accepted']} "
+        f"rejected(metric/unit/value)={s['rejected_metric']}/{s['rejected_unit']}/{s['rejected_value']} "
+        f"elapsed={s['elapsed_sec']}s rows/s={s['rows_per_sec']} MB/s={s['mb_per_sec']}"
+    )
+    print(json.dumps(agg["yearly"], ensure_ascii=False, indent=2))
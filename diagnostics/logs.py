@@ -0,0 +1,31 @@
+# diagnostics/logs.py
+"""
+统一日志配置：级别由 HA_LOG_LEVEL 控制（DEBUG / INFO / WARNING / ERROR / OFF，默认 WARNING）
+各模块用 logging.getLogger(__name__)，调试输出（如 OCR 原始结果）走 DEBUG，默认不输出也不格式化
+"""
+from __future__ import annotations
+
+import logging
+import os
+from typing import Optional
+
+DEFAULT_LEVEL = "WARNING"
+LOG_FORMAT = "%(asctime)s %(levelname)s %(name)s: %(message)s"
+
+_configured = False
+
+
+def configure_logging(level: Optional[str] = None) -> None:
+    """入口（api/app.py、main.py）调用一次；只配置本项目的 logger，不动第三方库的级别。"""
+    global _configured
+    level = (level or os.getenv("HA_LOG_LEVEL", DEFAULT_LEVEL)).upper()
+    root = logging.getLogger()
+    if not _configured and not root.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter(LOG_FORMAT))
+        root.addHandler(handler)
+    _configured = True
+
+    numeric = logging.CRITICAL + 1 if level == "OFF" else getattr(logging, level, logging.WARNING)
+    for name in ("ocr", "analysis", "llm", "export", "data", "diagnostics", "storage", "api", "main"):
+        logging.getLogger(name).setLevel(numeric)
@@ -0,0 +1,16 @@
+# diagnostics/metrics.py
+"""
+指标统计小工具：限流器指标（/metrics/llm）和 benchmarks/ 下的各个基准共用
+"""
+from __future__ import annotations
+
+import math
+from typing import Optional, Sequence
+
+
+def percentile(sorted_vals: Sequence[float], p: float) -> Optional[float]:
+    """最近秩法百分位（输入需已排序，p 取 0~100）；空序列返回 None。"""
+    if not sorted_vals:
+        return None
+    rank = math.ceil(p * len(sorted_vals) / 100)
+    return sorted_vals[min(len(sorted_vals) - 1, max(0, rank - 1))]
@@ -0,0 +1,239 @@
+# diagnostics/profiling.py
+"""
+按需 / 抽样的单请求性能剖析
+
+开启方式（默认都不开，不影响正常请求）：
+  - 抽样：HA_PROFILE_SAMPLE_N=N，每 N 个请求剖析 1 个（0 = 关闭）
+  - 按请求：需要 HA_PROFILE_ALLOW_REQUEST=1 且配置了 HA_PROFILE_TOKEN，
+    请求带 X-HA-Profile-Token: <token> 时才认下面的开关（剖析很重，也会把代码路径写到输出里，不能对外开放）：
+      - 请求头 X-HA-Profile: 1 | cprofile | sample
+      - 查询参数 ?profile=1 | cprofile | sample
+两种格式：
+  - cprofile：确定性剖析，输出 profile.prof（pstats / snakeviz）+ profile.txt（按累计耗时排序）
+  - sample：采样线程栈，输出 profile.folded（折叠栈，flamegraph.pl / speedscope 可直接打开），
+    每条栈以 stage:<阶段名> 开头，便于按 OCR / 分析 / 报告 等阶段拆开看
+剖析范围是调用 profile_block 的那一个线程（API 里就是处理该请求的线程池线程）：
+  - 同时在跑的其他请求不会计入；交给其他线程 / 进程的工作（OCR 进程池、PDF 导出、LLM 升级）也不计入，
+    LLM 升级任务用 profiled() 单独剖析
+  - sample 按墙钟采样，GIL 被其他请求占用时的等待会表现为这个线程停在某一行上
+剖析文件含源码路径和调用栈，调用方要写到不对外公开的目录（API 写在 outputs/profiles/，不在 /static 下）
+同一进程同一时刻只允许一个 cProfile（3.12 起 cProfile 走 sys.monitoring，全解释器只能有一个），
+冲突时自动降级为 sample
+"""
+from __future__ import annotations
+
+import cProfile
+import hmac
+import io
+import itertools
+import logging
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+MODES = ("cprofile", "sample")
+DEFAULT_MODE = "cprofile"
+DEFAULT_INTERVAL_MS = 5.0
+TOP_N = 40
+
+_request_counter = itertools.count(1)
+_cprofile_lock = threading.Lock()
+
+
+def _parse_mode(value: Optional[str]) -> Optional[str]:
+    if value is None:
+        return None
+    value = value.strip().lower()
+    if value in ("", "0", "false", "off", "no"):
+        return None
+    return value if value in MODES else DEFAULT_MODE
+
+
+def request_authorized(token: Optional[str]) -> bool:
+    """
+    按请求开启需要显式打开开关，并且请求带的 token 与 HA_PROFILE_TOKEN 一致（没配 token 视为关闭）
+    API 也用它决定是否把剖析结果返回给调用方：抽样命中的请求只写文件，不出现在响应里
+    """
+    if os.getenv("HA_PROFILE_ALLOW_REQUEST", "0") != "1":
+        return False
+    expected = os.getenv("HA_PROFILE_TOKEN", "")
+    if not expected or not token:
+        return False
+    return hmac.compare_digest(token.encode("utf-8"), expected.encode("utf-8"))
+
+
+def requested_mode(
+    header: Optional[str] = None,
+    query: Optional[str] = None,
+    token: Optional[str] = None,
+) -> Optional[str]:
+    """
+    本次请求是否剖析、用哪种格式；None 表示不剖析
+    header / query 只有在 token 校验通过时才生效（见 request_authorized）
+    抽样计数对每个请求都递增，保证“每 N 个请求 1 个”与是否显式请求无关
+    """
+    sample_n = int(os.getenv("HA_PROFILE_SAMPLE_N", "0"))
+    sampled = sample_n > 0 and next(_request_counter) % sample_n == 0
+
+    if request_authorized(token):
+        mode = _parse_mode(header) or _parse_mode(query)
+        if mode:
+            return mode
+    if sampled:
+        return _parse_mode(os.getenv("HA_PROFILE_SAMPLE_MODE", "sample"))
+    return None
+
+
+class _StackSampler:
+    """后台线程定时抓取目标线程的调用栈，累计成折叠栈计数。"""
+
+    def __init__(self, thread_id: int, interval: float, label: Callable[[], Optional[str]]):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.label = label
+        self.counts: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="profile-sampler", daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({Path(code.co_filename).name}:{code.co_firstlineno})")
+                frame = frame.f_back
+            stage = self.label()
+            stack.append(f"stage:{stage or 'other'}")
+            self.counts[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {n}\n" for stack, n in self.counts.most_common())
+
+
+class ProfileSession:
+    """一次剖析的结果：mode、输出文件、耗时等，放进响应的 artifacts。"""
+
+    def __init__(self, mode: str, out_dir: Path, name: str):
+        self.mode = mode
+        self.out_dir = out_dir
+        self.name = name
+        self.files: Dict[str, str] = {}
+        self.elapsed_sec: Optional[float] = None
+        self.error: Optional[str] = None
+        self.notes = ""
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "mode": self.mode,
+            "files": self.files,
+            "elapsed_sec": self.elapsed_sec,
+            "error": self.error,
+        }
+
+
+@contextmanager
+def profile_block(
+    mode: Optional[str],
+    out_dir: str | Path,
+    name: str = "profile",
+    stage: Optional[Callable[[], Optional[str]]] = None,
+) -> Iterator[Optional[ProfileSession]]:
+    """
+    剖析 with 块内当前线程的执行，结束后写入 out_dir/<name>.*
+    mode 为 None 时什么都不做（yield None），调用方不用分支
+    stage：返回当前阶段名的函数（sample 模式用来给栈打阶段标签）
+    块内可以设置 session.notes（例如各阶段耗时），会写在 .txt 开头
+    """
+    if mode is None:
+        yield None
+        return
+
+    out_dir = Path(out_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    if mode == "cprofile" and not _cprofile_lock.acquire(blocking=False):
+        mode = "sample"
+    session = ProfileSession(mode, out_dir, name)
+
+    profiler: Optional[cProfile.Profile] = None
+    sampler: Optional[_StackSampler] = None
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+    else:
+        interval = float(os.getenv("HA_PROFILE_INTERVAL_MS", str(DEFAULT_INTERVAL_MS))) / 1000
+        sampler = _StackSampler(threading.get_ident(), interval, stage or (lambda: None))
+
+    started = time.perf_counter()
+    try:
+        if profiler is not None:
+            profiler.enable()
+        else:
+            sampler.start()
+        yield session
+    finally:
+        if profiler is not None:
+            profiler.disable()
+            _cprofile_lock.release()
+        else:
+            sampler.stop()
+        session.elapsed_sec = round(time.perf_counter() - started, 4)
+        try:
+            _write(session, profiler, sampler)
+        except Exception as e:  # 剖析结果写失败不能影响请求本身
+            session.error = f"{type(e).__name__}: {e}"
+            logger.warning("failed to write profile %s: %s", out_dir / name, session.error)
+
+
+def _write(
+    session: ProfileSession,
+    profiler: Optional[cProfile.Profile],
+    sampler: Optional[_StackSampler],
+) -> None:
+    base = session.out_dir / session.name
+    if profiler is not None:
+        prof_path = base.with_suffix(".prof")
+        profiler.dump_stats(str(prof_path))
+        buf = io.StringIO()
+        pstats.Stats(profiler, stream=buf).sort_stats("cumulative").print_stats(TOP_N)
+        txt_path = base.with_suffix(".txt")
+        txt_path.write_text(
+            (session.notes + "\n" if session.notes else "") + f"elapsed {session.elapsed_sec}s\n" + buf.getvalue(),
+            encoding="utf-8",
+        )
+        session.files = {"prof": str(prof_path), "txt": str(txt_path)}
+    else:
+        folded_path = base.with_suffix(".folded")
+        folded_path.write_text(sampler.folded(), encoding="utf-8")
+        session.files = {"folded": str(folded_path)}
+    logger.info("profile (%s, %ss) -> %s", session.mode, session.elapsed_sec, session.files)
+
+
+def profiled(fn: Callable[[], Any], mode: Optional[str], out_dir: str | Path, name: str) -> Callable[[], Any]:
+    """包一层：在后台线程里执行 fn 时也剖析（例如 LLM 升级任务），mode 为 None 时原样返回。"""
+    if mode is None:
+        return fn
+
+    def _run() -> Any:
+        with profile_block(mode, out_dir, name=name, stage=lambda: name):
+            return fn()
+
+    return _run
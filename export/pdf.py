@@ -0,0 +1,286 @@
+# export/pdf.py
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import re
+import textwrap
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from storage.files import atomic_write_bytes
+
+# A4（英寸）
+PAGE_SIZE = (8.27, 11.69)
+MARGIN_X = 0.08
+MARGIN_TOP = 0.94
+MARGIN_BOTTOM = 0.06
+LINE_HEIGHT = 0.022
+WRAP_WIDTH = 44  # 每行大约容纳的中文字符数
+FIGURES_PER_PAGE = 2
+
+_HASH_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# 后台导出：少量线程即可，渲染本身很快，主要是避免阻塞 /analyze
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="pdf-export")
+_jobs: Dict[str, Future] = {}
+_jobs_lock = threading.Lock()
+# 失败的任务保留一段时间供查询错误，过期后在下次提交 / 查询时清掉（否则长期运行的服务里只增不减）
+FAILED_JOB_TTL_SEC = 600.0
+_failed_at: Dict[str, float] = {}
+
+
+def load_figure_bytes(figures: Dict[str, str]) -> Dict[str, bytes]:
+    """读取 run_analysis 已经渲染好的 PNG（不重新画图）。"""
+    out: Dict[str, bytes] = {}
+    for key, path in figures.items():
+        p = Path(path)
+        if p.is_file():
+            out[key] = p.read_bytes()
+    return out
+
+
+def report_content_hash(
+    report_child: str,
+    report_elder: str,
+    figure_bytes: Dict[str, bytes],
+) -> str:
+    """报告文字 + 图片字节 的内容哈希，内容不变则哈希不变（可直接命中缓存）。"""
+    h = hashlib.sha256()
+    for part in (report_child or "", report_elder or ""):
+        data = part.encode("utf-8")
+        h.update(len(data).to_bytes(8, "big"))
+        h.update(data)
+    for key in sorted(figure_bytes):
+        h.update(key.encode("utf-8") + b"\0")
+        h.update(hashlib.sha256(figure_bytes[key]).digest())
+    return h.hexdigest()
+
+
+def _md_lines(markdown: str) -> list[Tuple[str, float, str]]:
+    """把 Markdown 粗略转成 (文本, 字号, 字重) 的行列表（MVP：只处理标题和列表）。"""
+    lines: list[Tuple[str, float, str]] = []
+    for raw in (markdown or "").splitlines():
+        line = raw.rstrip()
+        if not line.strip():
+            lines.append(("", 9, "normal"))
+            continue
+        if line.startswith("# "):
+            size, weight, text = 15, "bold", line[2:]
+        elif line.startswith("## "):
+            size, weight, text = 12, "bold", line[3:]
+        elif line.startswith("### "):
+            size, weight, text = 10.5, "bold", line[4:]
+        else:
+            size, weight, text = 9.5, "normal", line.replace("**", "")
+        for part in textwrap.wrap(text, width=WRAP_WIDTH) or [""]:
+            lines.append((part, size, weight))
+    return lines
+
+
+def _text_pages(pdf: Any, title: str, markdown: str) -> None:
+    from matplotlib.figure import Figure
+
+    from analysis.stats import cn_font_family
+
+    # 字体显式传给每段文字，不去改全局 rcParams（请求线程可能正在并发画图）
+    family = [*cn_font_family(), "sans-serif"]
+    lines = [(title, 16, "bold"), ("", 9, "normal")] + _md_lines(markdown)
+    fig = None
+    y = 0.0
+    for text, size, weight in lines:
+        step = LINE_HEIGHT * size / 9.5
+        if fig is None or y - step < MARGIN_BOTTOM:
+            if fig is not None:
+                pdf.savefig(fig)
+            fig = Figure(figsize=PAGE_SIZE)
+            y = MARGIN_TOP
+        if text:
+            fig.text(MARGIN_X, y, text, fontsize=size, fontweight=weight, va="top", fontfamily=family)
+        y -= step
+    if fig is not None:
+        pdf.savefig(fig)
+
+
+def _figure_pages(pdf: Any, figure_bytes: Dict[str, bytes]) -> None:
+    import matplotlib.image as mpimg
+    from matplotlib.figure import Figure
+
+    keys = sorted(figure_bytes)
+    for start in range(0, len(keys), FIGURES_PER_PAGE):
+        fig = Figure(figsize=PAGE_SIZE)
+        chunk = keys[start:start + FIGURES_PER_PAGE]
+        for i, key in enumerate(chunk):
+            # 直接嵌入已渲染的 PNG 像素，不重新绘制趋势图
+            img = mpimg.imread(io.BytesIO(figure_bytes[key]), format="png")
+            ax = fig.add_subplot(FIGURES_PER_PAGE, 1, i + 1)
+            ax.imshow(img)
+            ax.set_axis_off()
+        pdf.savefig(fig)
+
+
+def render_report_pdf(
+    report_child: str,
+    report_elder: str,
+    figure_bytes: Dict[str, bytes],
+) -> bytes:
+    """
+    组装 PDF：子女版 -> 长辈版 -> 趋势图附录
+    只用 matplotlib 的面向对象接口（不经过 pyplot），也不修改 rcParams，可以在后台线程里安全运行
+    """
+    from matplotlib.backends.backend_pdf import PdfPages
+
+    buf = io.BytesIO()
+    with PdfPages(buf) as pdf:
+        if report_child:
+            _text_pages(pdf, "家庭健康趋势审计报告（给子女）", report_child)
+        if report_elder:
+            _text_pages(pdf, "健康小结（给长辈）", report_elder)
+        if figure_bytes:
+            _figure_pages(pdf, figure_bytes)
+    return buf.getvalue()
+
+
+def cached_pdf_path(content_hash: str, cache_dir: str | Path) -> Path:
+    if not _HASH_RE.match(content_hash):
+        raise ValueError(f"invalid content hash: {content_hash}")
+    return Path(cache_dir) / f"{content_hash}.pdf"
+
+
+def pdf_source_path(content_hash: str, cache_dir: str | Path) -> Path:
+    return cached_pdf_path(content_hash, cache_dir).with_suffix(".source.json")
+
+
+def record_pdf_source(content_hash: str, cache_dir: str | Path, source: Dict[str, Any]) -> None:
+    """
+    记录某个哈希的 PDF 从哪来（例如 {"request_id": ...}）
+    PDF 文件丢失（重启前没渲染完 / 被清理）时，调用方据此从原始 report.json 重新生成
+    """
+    path = pdf_source_path(content_hash, cache_dir)
+    if path.is_file():
+        return
+    atomic_write_bytes(path, json.dumps(source, ensure_ascii=False).encode("utf-8"))
+
+
+def load_pdf_source(content_hash: str, cache_dir: str | Path) -> Optional[Dict[str, Any]]:
+    path = pdf_source_path(content_hash, cache_dir)
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _build_and_store(
+    content_hash: str,
+    report_child: str,
+    report_elder: str,
+    figure_bytes: Dict[str, bytes],
+    cache_dir: Path,
+) -> Path:
+    path = cached_pdf_path(content_hash, cache_dir)
+    if path.is_file():
+        return path
+    data = render_report_pdf(report_child, report_elder, figure_bytes)
+    # 原子写，避免下载到半个 PDF
+    return atomic_write_bytes(path, data)
+
+
+def export_report_pdf(
+    reports: Dict[str, Any],
+    figures: Dict[str, str],
+    cache_dir: str | Path,
+) -> Path:
+    """同步导出（命令行用）：命中缓存则直接返回已有文件。"""
+    figure_bytes = load_figure_bytes(figures)
+    child = reports.get("report_child", "")
+    elder = reports.get("report_elder", "")
+    content_hash = report_content_hash(child, elder, figure_bytes)
+    return _build_and_store(content_hash, child, elder, figure_bytes, Path(cache_dir))
+
+
+def submit_report_pdf(
+    reports: Dict[str, Any],
+    figures: Dict[str, str],
+    cache_dir: str | Path,
+    source: Optional[Dict[str, Any]] = None,
+    lazy: bool = False,
+) -> str:
+    """
+    后台导出（API 用）：立即返回内容哈希，不等待渲染
+    - 已缓存：不提交任务
+    - 同一哈希正在渲染：复用同一个任务
+    - source：可选来源信息（见 record_pdf_source），用于 PDF 丢失后重新生成
+    - lazy=True：只算哈希、记录来源，不渲染；第一次下载时由调用方按来源重新提交（需要 source）
+    """
+    figure_bytes = load_figure_bytes(figures)
+    child = reports.get("report_child", "")
+    elder = reports.get("report_elder", "")
+    content_hash = report_content_hash(child, elder, figure_bytes)
+    cache_dir = Path(cache_dir)
+    if source is not None:
+        record_pdf_source(content_hash, cache_dir, source)
+
+    if lazy or cached_pdf_path(content_hash, cache_dir).is_file():
+        return content_hash
+
+    submitted = None
+    with _jobs_lock:
+        _prune_failed_locked()
+        job = _jobs.get(content_hash)
+        if job is None or (job.done() and job.exception() is not None):
+            _failed_at.pop(content_hash, None)
+            submitted = _executor.submit(
+                _build_and_store, content_hash, child, elder, figure_bytes, cache_dir
+            )
+            _jobs[content_hash] = submitted
+    if submitted is not None:
+        # 在锁外注册：任务已经结束时回调会在当前线程里立即执行，而回调本身要拿 _jobs_lock
+        submitted.add_done_callback(lambda f, h=content_hash: _forget_job(h, f))
+    return content_hash
+
+
+def _forget_job(content_hash: str, job: Future) -> None:
+    # 成功的任务结果已经落盘，不必再持有；失败的保留 FAILED_JOB_TTL_SEC 以便查询错误
+    with _jobs_lock:
+        if _jobs.get(content_hash) is not job:
+            return
+        if job.exception() is None:
+            del _jobs[content_hash]
+        else:
+            _failed_at[content_hash] = time.monotonic()
+
+
+def _prune_failed_locked() -> None:
+    """清掉过期的失败任务（调用方持有 _jobs_lock）。"""
+    cutoff = time.monotonic() - FAILED_JOB_TTL_SEC
+    for content_hash in [h for h, t in _failed_at.items() if t < cutoff]:
+        del _failed_at[content_hash]
+        _jobs.pop(content_hash, None)
+
+
+def report_pdf_status(content_hash: str, cache_dir: str | Path) -> Tuple[str, Optional[Path], Optional[str]]:
+    """
+    查询导出状态：
+      - ("ready", path, None)
+      - ("pending", None, None)
+      - ("failed", None, error)
+      - ("missing", None, None)
+    """
+    path = cached_pdf_path(content_hash, cache_dir)
+    if path.is_file():
+        return "ready", path, None
+    with _jobs_lock:
+        _prune_failed_locked()
+        job = _jobs.get(content_hash)
+    if job is None:
+        return "missing", None, None
+    if not job.done():
+        return "pending", None, None
+    err = job.exception()
+    if err is not None:
+        return "failed", None, str(err)
+    return "ready", job.result(), None
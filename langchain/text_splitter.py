@@ -1,6 +1,65 @@
 try:
     from langchain_text_splitters import RecursiveCharacterTextSplitter
 except Exception:
+    from langchain.docstore.document import Document
+
     class RecursiveCharacterTextSplitter:
-        def __init__(self, *args, **kwargs):
-            raise ImportError("langchain_text_splitters is not installed")
+        """langchain_text_splitters 未安装时的最小实现：按分隔符优先级递归切分，再合并到 chunk_size。"""
+
+        def __init__(self, chunk_size=400, chunk_overlap=50, separators=None, **kwargs):
+            if chunk_overlap >= chunk_size:
+                raise ValueError("chunk_overlap must be smaller than chunk_size")
+            self._chunk_size = chunk_size
+            self._chunk_overlap = chunk_overlap
+            self._separators = separators or ["\n\n", "\n", "。", "；", "，", " ", ""]
+
+        def _split(self, text, separators):
+            sep = separators[-1]
+            rest = []
+            for i, s in enumerate(separators):
+                if s == "" or s in text:
+                    sep, rest = s, separators[i + 1:]
+                    break
+            if sep:
+                # 与 langchain 默认行为一致：分隔符保留在后一段开头（标题、句号等不丢）
+                parts = text.split(sep)
+                pieces = [parts[0]] + [sep + p for p in parts[1:]]
+            else:
+                pieces = list(text)
+            out = []
+            for p in pieces:
+                if not p:
+                    continue
+                if len(p) > self._chunk_size and rest:
+                    out.extend(self._split(p, rest))
+                else:
+                    out.append(p)
+            return out
+
+        def split_text(self, text):
+            chunks, current, size = [], [], 0
+            for piece in self._split(text, self._separators):
+                if current and size + len(piece) > self._chunk_size:
+                    chunks.append("".join(current).strip())
+                    # 保留末尾若干片段作为重叠
+                    while current and (size > self._chunk_overlap or size + len(piece) > self._chunk_size):
+                        size -= len(current[0])
+                        current.pop(0)
+                current.append(piece)
+                size += len(piece)
+            if current:
+                chunks.append("".join(current).strip())
+            return [c for c in chunks if c]
+
+        def create_documents(self, texts, metadatas=None):
+            docs = []
+            for i, text in enumerate(texts):
+                meta = (metadatas[i] if metadatas else None) or {}
+                for chunk in self.split_text(text):
+                    docs.append(Document(page_content=chunk, metadata=dict(meta)))
+            return docs
+
+        def split_documents(self, documents):
+            return self.create_documents(
+                [d.page_content for d in documents], [d.metadata for d in documents]
+            )
@@ -2,36 +2,43 @@
 from __future__ import annotations
 import os
 import json
+import time
 from typing import Any, Dict, List, Optional, Tuple
 
+from analysis.models import AnalysisResult
+
 
 def build_llm_payload(
     rows: List[Dict[str, Any]],
-    analysis_result: Dict[str, Any],
+    analysis_result: AnalysisResult,
 ) -> Dict[str, Any]:
     """
     把步骤三输出整理成 LLM 更容易理解的结构（减少 prompt 体积，增强可控性）
     """
-    summary = analysis_result.get("summary", {})
-    warnings = analysis_result.get("warnings", [])
+    summary = analysis_result.summary
+    warnings = analysis_result.warning_texts
 
     # 精简 summary：只保留关键字段（避免prompt过长）
     compact_summary = []
     for k, v in summary.items():
         compact_summary.append({
             "key": k,
-            "name": v.get("name"),
-            "unit": v.get("unit"),
-            "latest": v.get("latest"),
-            "trend": v.get("trend"),
-            "zscore_latest": v.get("zscore_latest"),
-            "out_of_range": v.get("out_of_range"),
-            "out_flag": v.get("out_flag"),
-            "ref_low": v.get("ref_low"),
-            "ref_high": v.get("ref_high"),
-            "yoy_delta": v.get("yoy_delta"),
-            "monotonic_increase_last3": v.get("monotonic_increase_last3"),
+            "name": v.name,
+            "unit": v.unit,
+            "latest": v.latest,
+            "trend": v.trend,
+            "zscore_latest": v.zscore_latest,
+            "out_of_range": v.out_of_range,
+            "out_flag": v.out_flag,
+            "ref_low": v.ref_low,
+            "ref_high": v.ref_high,
+            "yoy_delta": v.yoy_delta,
+            "monotonic_increase_last3": v.monotonic_increase_last3,
         })
+        if v.cohort_percentile is not None:
+            # 人群百分位（同龄同性别）：仅在提供画像且有人群索引时出现
+            compact_summary[-1]["cohort_percentile"] = v.cohort_percentile
+            compact_summary[-1]["cohort"] = v.cohort
 
     # 提供最近N年原始序列（只保留 year + 若干关键指标即可，避免全量太大）
     # 你可以按产品策略挑选更重要的指标
@@ -44,11 +51,18 @@ def build_llm_payload(
                 item[m] = r[m]
         compact_rows.append(item)
 
+    # 本地检索：为异常指标补充生活方式 / 复查指引片段（语料见 data/guidance）
+    from llm.retrieval import retrieve_guidance
+
+    guidance = [{"metric": g["metric"], "source": g["source"], "text": g["text"]}
+                for g in retrieve_guidance(summary)]
+
     return {
         "years": [r.get("year") for r in rows],
         "warnings": warnings,
         "metrics_summary": compact_summary,
         "time_series": compact_rows,
+        "guidance": guidance,
     }
 
 
@@ -113,6 +127,8 @@ def build_prompt_cn(payload: Dict[str, Any], audience: str = "child") -> str:
 {payload_json}
 
 请基于 warnings + metrics_summary + time_series 来写报告。
+guidance 是与异常指标相关的生活方式与复查指引片段，可作为建议的依据（用自己的话表述，不要整段照抄）。
+metrics_summary 里若有 cohort_percentile，表示该指标在同龄同性别人群（cohort）中的百分位，可用于说明“在同龄人中处于什么水平”。
 要求：
 - 重点解释“趋势”而不是单次值。
 - 对于接近参考范围边界的指标，也要轻度提示（避免空报告）。
@@ -127,6 +143,30 @@ def safe_typos_fix(text: str) -> str:
     return text.replace("\u00a0", " ").strip()
 
 
+# 可重试状态码 -> LLMGuard 结果：429 只降并发（不计入熔断），503 降并发且计入熔断，其余 5xx 只计入熔断
+_RETRY_OUTCOME = {429: "throttled", 503: "overloaded"}
+_RETRY_STATUS = (429, 500, 502, 503, 504)
+
+_session = None
+
+
+def _get_session():
+    """进程内共享 Session（连接池复用）；重试交给 LLMGuard，不再用 urllib3 Retry 各自重试。"""
+    global _session
+    if _session is None:
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        from llm.limiter import get_llm_guard
+
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_maxsize=get_llm_guard().max_concurrency, max_retries=0)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _session = session
+    return _session
+
+
 def call_deepseek_openai_compatible(
     api_key: str,
     base_url: str,
@@ -142,10 +182,15 @@ def call_deepseek_openai_compatible(
     base_url 示例：
       - https://api.deepseek.com/v1
       - 或你实际的兼容地址
+    阻塞调用（排队 / 退避 sleep / 网络），只能在工作线程里调用，不要在事件循环里直接调用
+    所有调用经过进程级 LLMGuard（llm/limiter.py）：
+      - 共享自适应并发上限，429/503 时整体降速
+      - Retry-After 对全进程生效，重试也要重新排队
+      - 连续失败熔断，熔断期间直接抛 LLMRejectedError
     """
     import requests
-    from requests.adapters import HTTPAdapter
-    from urllib3.util.retry import Retry
+
+    from llm.limiter import get_llm_guard, parse_retry_after
 
     url = base_url.rstrip("/") + "/chat/completions"
     headers = {
@@ -161,48 +206,73 @@ def call_deepseek_openai_compatible(
         "temperature": temperature,
     }
 
-    retry = Retry(
-        total=max_retries,
-        connect=max_retries,
-        read=max_retries,
-        backoff_factor=backoff_factor,
-        status_forcelist=(429, 500, 502, 503, 504),
-        allowed_methods=frozenset(["POST"]),
-        raise_on_status=False,
-    )
-    session = requests.Session()
-    adapter = HTTPAdapter(max_retries=retry)
-    session.mount("https://", adapter)
-    session.mount("http://", adapter)
+    guard = get_llm_guard()
+    session = _get_session()
+
+    for attempt in range(max_retries + 1):
+        last_attempt = attempt == max_retries
+        with guard.slot() as slot:
+            try:
+                # timeout = (connect_timeout, read_timeout)
+                resp = session.post(url, headers=headers, json=body, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout):
+                if last_attempt:
+                    raise
+                slot["outcome"] = "failed"
+                resp = None
+
+            if resp is not None and resp.status_code in _RETRY_STATUS:
+                slot["outcome"] = _RETRY_OUTCOME.get(resp.status_code, "failed")
+                slot["retry_after"] = parse_retry_after(resp.headers.get("Retry-After"))
+                if last_attempt:
+                    resp.raise_for_status()
+            elif resp is not None:
+                if 400 <= resp.status_code < 500:
+                    # 400 / 401 等是请求本身的问题，服务是好的：不降并发、不计入熔断
+                    slot["outcome"] = "client_error"
+                resp.raise_for_status()
+                data = resp.json()
+                return data["choices"][0]["message"]["content"]
+
+        # 没有 Retry-After 时按指数退避；有 Retry-After 时由 guard 统一等待
+        if not slot["retry_after"]:
+            time.sleep(backoff_factor * (2 ** attempt))
+
+    raise RuntimeError("unreachable")
+
 
-    # timeout = (connect_timeout, read_timeout)
-    resp = session.post(url, headers=headers, json=body, timeout=timeout)
-    resp.raise_for_status()
-    data = resp.json()
-    return data["choices"][0]["message"]["content"]
+DEFAULT_BASE_URL = "https://api.deepseek.com/v1"
+DEFAULT_MODEL = "deepseek-chat"
 
 
 def generate_reports(
     rows: List[Dict[str, Any]],
-    analysis_result: Dict[str, Any],
+    analysis_result: AnalysisResult,
     api_key: str,
-    base_url: str,
-    model: str,
+    base_url: Optional[str] = None,
+    model: Optional[str] = None,
+    audience: str = "both",
 ) -> Dict[str, Any]:
     """
     生成两版报告：给子女、给老人
+    audience: "both" / "child" / "elder"（未请求的版本返回空字符串）
     """
+    base_url = base_url or DEFAULT_BASE_URL
+    model = model or DEFAULT_MODEL
     payload = build_llm_payload(rows, analysis_result)
 
-    prompt_child = build_prompt_cn(payload, audience="child")
-    prompt_elder = build_prompt_cn(payload, audience="elder")
-
-    report_child = call_deepseek_openai_compatible(
-        api_key=api_key, base_url=base_url, model=model, prompt=prompt_child
-    )
-    report_elder = call_deepseek_openai_compatible(
-        api_key=api_key, base_url=base_url, model=model, prompt=prompt_elder
-    )
+    report_child = ""
+    report_elder = ""
+    if audience in ("both", "child"):
+        prompt_child = build_prompt_cn(payload, audience="child")
+        report_child = call_deepseek_openai_compatible(
+            api_key=api_key, base_url=base_url, model=model, prompt=prompt_child
+        )
+    if audience in ("both", "elder"):
+        prompt_elder = build_prompt_cn(payload, audience="elder")
+        report_elder = call_deepseek_openai_compatible(
+            api_key=api_key, base_url=base_url, model=model, prompt=prompt_elder
+        )
 
     return {
         "payload": payload,
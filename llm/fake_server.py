@@ -0,0 +1,244 @@
+# llm/fake_server.py
+"""
+本地 OpenAI-兼容 /chat/completions 假服务（离线压测 / 复现 429、5xx 重试用）
+
+python -m llm.fake_server --port 8010 --latency lognormal:-0.5,0.6 --error-429 0.05 --retry-after 2
+然后：DEEPSEEK_API_KEY=fake DEEPSEEK_BASE_URL=http://127.0.0.1:8010/v1 uvicorn api.app:app
+"""
+from __future__ import annotations
+
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Optional
+
+CANNED_CHILD = """# 家庭健康趋势审计报告（给子女）
+## 1. 结论摘要（3-5条要点）
+- 这是本地假服务返回的示例报告，仅用于压测。
+## 2. 需要重点关注的指标（按优先级排序）
+- 收缩压：示例｜近5年趋势上升｜示例说明
+## 3. 风险分层（绿/黄/橙/红）
+- 黄：示例
+## 4. 可能原因线索（不确定性说明）
+- 这只是可能性，需要结合生活方式/病史/医生判断
+## 5. 行动清单（非常具体）
+- 1周内：示例
+- 1个月内：示例
+- 3个月内：示例
+## 6. 给家人的沟通话术（3句以内）
+示例。
+"""
+
+CANNED_ELDER = """# 健康小结（给长辈）
+## 1. 先说结论（安抚+鼓励，3句话以内）
+这是本地假服务返回的示例报告。
+## 2. 哪些指标要留意（最多5项）
+- 血压：示例
+## 3. 生活习惯小建议（不超过8条）
+- 示例
+## 4. 复查与就医建议
+示例。
+"""
+
+
+def parse_latency(spec: str) -> Callable[[random.Random], float]:
+    """
+    延迟分布（秒）：
+      - const:0.5
+      - uniform:0.2,1.5
+      - lognormal:mu,sigma   （exp(N(mu, sigma))）
+      - exp:mean
+    """
+    kind, _, args = spec.partition(":")
+    nums = [float(x) for x in args.split(",") if x.strip()]
+    if kind == "const":
+        return lambda rng: nums[0]
+    if kind == "uniform":
+        return lambda rng: rng.uniform(nums[0], nums[1])
+    if kind == "lognormal":
+        return lambda rng: rng.lognormvariate(nums[0], nums[1])
+    if kind == "exp":
+        return lambda rng: rng.expovariate(1.0 / nums[0])
+    raise ValueError(f"unknown latency spec: {spec}")
+
+
+class FakeLLMConfig:
+    def __init__(
+        self,
+        latency: str = "const:0.2",
+        error_429: float = 0.0,
+        error_5xx: float = 0.0,
+        retry_after: Optional[int] = 1,
+        stream_chunks: int = 8,
+        seed: Optional[int] = None,
+    ):
+        self.latency_spec = latency
+        self.sample_latency = parse_latency(latency)
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.retry_after = retry_after
+        self.stream_chunks = stream_chunks
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.stats: Dict[str, int] = {"requests": 0, "ok": 0, "429": 0, "5xx": 0, "stream": 0}
+        self.stats_lock = threading.Lock()
+
+    def count(self, key: str) -> None:
+        with self.stats_lock:
+            self.stats[key] = self.stats.get(key, 0) + 1
+
+
+def _completion(model: str, content: str) -> Dict[str, Any]:
+    return {
+        "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": "stop"}
+        ],
+        "usage": {"prompt_tokens": 0, "completion_tokens": len(content), "total_tokens": len(content)},
+    }
+
+
+def _make_handler(cfg: FakeLLMConfig) -> type:
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, fmt: str, *args: Any) -> None:  # 压测时不刷屏
+            pass
+
+        def _json(self, status: int, body: Dict[str, Any], headers: Optional[Dict[str, str]] = None) -> None:
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self) -> None:
+            if self.path.rstrip("/") == "/stats":
+                with cfg.stats_lock:
+                    self._json(200, dict(cfg.stats))
+                return
+            self._json(404, {"error": "not found"})
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length) if length else b"{}"
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._json(404, {"error": "not found"})
+                return
+            cfg.count("requests")
+
+            try:
+                body = json.loads(raw or b"{}")
+            except ValueError:
+                self._json(400, {"error": {"message": "invalid json"}})
+                return
+
+            with cfg.rng_lock:
+                roll = cfg.rng.random()
+                delay = max(0.0, cfg.sample_latency(cfg.rng))
+
+            if roll < cfg.error_429:
+                cfg.count("429")
+                headers = {} if cfg.retry_after is None else {"Retry-After": str(cfg.retry_after)}
+                self._json(429, {"error": {"message": "rate limited (fake)"}}, headers)
+                return
+            if roll < cfg.error_429 + cfg.error_5xx:
+                cfg.count("5xx")
+                with cfg.rng_lock:
+                    status = cfg.rng.choice((500, 502, 503))
+                self._json(status, {"error": {"message": "upstream error (fake)"}})
+                return
+
+            messages = body.get("messages") or []
+            prompt = str(messages[-1].get("content", "")) if messages else ""
+            content = CANNED_ELDER if "给长辈" in prompt else CANNED_CHILD
+            model = body.get("model") or "fake-model"
+
+            if body.get("stream"):
+                cfg.count("stream")
+                self._stream(model, content, delay)
+            else:
+                time.sleep(delay)
+                self._json(200, _completion(model, content))
+            cfg.count("ok")
+
+        def _stream(self, model: str, content: str, delay: float) -> None:
+            """SSE 流式返回：总耗时 ≈ delay，平均分摊到每个分片。"""
+            n = max(1, cfg.stream_chunks)
+            size = -(-len(content) // n)
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Cache-Control", "no-cache")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            cid = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+            for i in range(n):
+                time.sleep(delay / n)
+                piece = content[i * size:(i + 1) * size]
+                chunk = {
+                    "id": cid,
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "delta": {"content": piece}, "finish_reason": None}],
+                }
+                self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                self.wfile.flush()
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+            self.close_connection = True
+
+    return Handler
+
+
+def serve_fake_llm(
+    host: str = "127.0.0.1",
+    port: int = 8010,
+    config: Optional[FakeLLMConfig] = None,
+    background: bool = False,
+) -> ThreadingHTTPServer:
+    """启动假服务；background=True 时在守护线程里运行并立即返回 server（port=0 自动分配）。"""
+    cfg = config or FakeLLMConfig()
+    server = ThreadingHTTPServer((host, port), _make_handler(cfg))
+    server.daemon_threads = True
+    server.config = cfg  # type: ignore[attr-defined]
+    if background:
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+    else:
+        server.serve_forever()
+    return server
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="本地 OpenAI-兼容假服务")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8010)
+    parser.add_argument("--latency", default="const:0.2", help="const:s | uniform:a,b | lognormal:mu,sigma | exp:mean")
+    parser.add_argument("--error-429", type=float, default=0.0, help="429 比例（0~1）")
+    parser.add_argument("--error-5xx", type=float, default=0.0, help="5xx 比例（0~1）")
+    parser.add_argument("--retry-after", type=int, default=1, help="429 的 Retry-After 秒数（整数），<0 表示不带该头")
+    parser.add_argument("--stream-chunks", type=int, default=8)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    config = FakeLLMConfig(
+        latency=args.latency,
+        error_429=args.error_429,
+        error_5xx=args.error_5xx,
+        retry_after=None if args.retry_after < 0 else args.retry_after,
+        stream_chunks=args.stream_chunks,
+        seed=args.seed,
+    )
+    print(f"fake LLM listening on http://{args.host}:{args.port}/v1/chat/completions")
+    serve_fake_llm(args.host, args.port, config)
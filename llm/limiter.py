@@ -0,0 +1,282 @@
+# llm/limiter.py
+"""
+进程级 LLM 调用保护：AIMD 自适应并发 + Retry-After + 熔断
+
+所有请求共享同一个 LLMGuard：
+- 并发上限按 AIMD 调整：成功时缓慢加 1（每轮约 +1），遇到 429/503 时减半；
+  同一拥塞窗口只减一次：上次减半之前就已发出的请求再返回 429/503 不再继续减
+- 收到 Retry-After 后，全进程在该时间点之前都不再发新请求（而不是各自重试）
+- 连续失败达到阈值后熔断，冷却期内直接拒绝；冷却结束放一个探测请求（half-open）
+  只有 5xx / 超时 / 连接错误计入熔断；429 交给 AIMD + Retry-After，其他 4xx 不影响两者
+排队 / Retry-After 等待都是阻塞的（threading.Condition），只能在工作线程里调用：
+在事件循环线程里调用会卡住整个服务，且并发永远到不了 1 以上，acquire 会直接报错
+"""
+from __future__ import annotations
+
+import asyncio
+import email.utils
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, Optional
+
+
+class LLMRejectedError(RuntimeError):
+    """被限流器 / 熔断器拒绝（没有真正发出请求）。"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """Retry-After 支持秒数或 HTTP 日期两种格式。"""
+    if not value:
+        return None
+    value = value.strip()
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        dt = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, dt.timestamp() - time.time())
+
+
+def _ensure_not_on_event_loop() -> None:
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return
+    raise RuntimeError(
+        "LLMGuard blocks while queueing / honouring Retry-After; "
+        "call the LLM from a worker thread (run_in_threadpool / asyncio.to_thread), not the event loop"
+    )
+
+
+# 乘性减并发的结果 / 计入熔断的结果（见 LLMGuard.release）
+_DECREASE_OUTCOMES = ("throttled", "overloaded")
+_BREAKER_OUTCOMES = ("overloaded", "failed")
+
+
+class LLMGuard:
+    def __init__(
+        self,
+        max_concurrency: int = 8,
+        min_concurrency: int = 1,
+        initial_concurrency: Optional[int] = None,
+        decrease_factor: float = 0.5,
+        queue_timeout: float = 30.0,
+        breaker_failures: int = 5,
+        breaker_cooldown: float = 30.0,
+    ):
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.decrease_factor = decrease_factor
+        self.queue_timeout = queue_timeout
+        self.breaker_failures = breaker_failures
+        self.breaker_cooldown = breaker_cooldown
+
+        self._cond = threading.Condition()
+        self._limit = float(initial_concurrency or max_concurrency)
+        self._inflight = 0
+        self._waiting = 0
+        self._blocked_until = 0.0  # Retry-After 截止时间（monotonic）
+        self._last_decrease_at = float("-inf")  # 上次乘性减的时间（monotonic）
+
+        # 熔断：closed / open / half_open
+        self._state = "closed"
+        self._consecutive_failures = 0
+        self._opened_at = 0.0
+        self._probe_inflight = False
+
+        # 指标
+        self._waits: Deque[float] = deque(maxlen=2048)
+        self._stats: Dict[str, float] = {
+            "acquired": 0,
+            "success": 0,
+            "throttled": 0,
+            "overloaded": 0,
+            "failed": 0,
+            "client_error": 0,
+            "decrease_skipped": 0,
+            "rejected_breaker": 0,
+            "rejected_queue_timeout": 0,
+            "breaker_trips": 0,
+            "queue_wait_total_sec": 0.0,
+            "queue_wait_max_sec": 0.0,
+        }
+
+    # ---------- 熔断 ----------
+    def _breaker_allows(self, now: float) -> bool:
+        if self._state == "closed":
+            return True
+        if self._state == "open" and now - self._opened_at >= self.breaker_cooldown:
+            self._state = "half_open"
+        # half_open：只放一个探测请求
+        return self._state == "half_open" and not self._probe_inflight
+
+    def _trip(self, now: float) -> None:
+        if self._state != "open":
+            self._stats["breaker_trips"] += 1
+        self._state = "open"
+        self._opened_at = now
+        self._probe_inflight = False
+
+    # ---------- 获取 / 释放 ----------
+    def acquire(self, timeout: Optional[float] = None) -> bool:
+        """排队等待一个并发名额；返回值表示是否为 half-open 探测请求。"""
+        _ensure_not_on_event_loop()
+        timeout = self.queue_timeout if timeout is None else timeout
+        start = time.monotonic()
+        deadline = start + timeout
+
+        with self._cond:
+            self._waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    if not self._breaker_allows(now):
+                        if self._state == "open":
+                            self._stats["rejected_breaker"] += 1
+                            raise LLMRejectedError("breaker_open", "LLM circuit breaker is open")
+                    elif now >= self._blocked_until and self._inflight < int(self._limit):
+                        break
+
+                    remaining = deadline - now
+                    if remaining <= 0:
+                        self._stats["rejected_queue_timeout"] += 1
+                        raise LLMRejectedError("queue_timeout", f"LLM queue wait exceeded {timeout}s")
+                    wake = remaining
+                    if self._blocked_until > now:
+                        wake = min(wake, self._blocked_until - now)
+                    self._cond.wait(wake)
+            finally:
+                self._waiting -= 1
+
+            probe = self._state == "half_open"
+            if probe:
+                self._probe_inflight = True
+            self._inflight += 1
+
+            waited = now - start
+            self._waits.append(waited)
+            self._stats["acquired"] += 1
+            self._stats["queue_wait_total_sec"] += waited
+            self._stats["queue_wait_max_sec"] = max(self._stats["queue_wait_max_sec"], waited)
+            return probe
+
+    def release(
+        self,
+        outcome: str,
+        retry_after: Optional[float] = None,
+        probe: bool = False,
+        started_at: Optional[float] = None,
+    ) -> None:
+        """
+        started_at：该请求拿到名额的时间（monotonic，slot() 自动传入）；早于上次减半的请求
+          属于同一拥塞窗口，它的 429/503 不再减并发（一波并发 429 只减一次，而不是直接减到底）
+          不传时每次 429/503 都减
+        outcome:
+          - "success":      并发 +1/limit（加性增），清零连续失败
+          - "throttled":    429，并发乘性减，记录 Retry-After；服务本身可用，不计入熔断
+          - "overloaded":   503，并发乘性减，记录 Retry-After，计入熔断
+          - "failed":       其他 5xx / 超时 / 连接错误，计入熔断
+          - "client_error": 其他 4xx（400 / 401 …），请求本身的问题：只归还名额，不调并发、不计入熔断
+        half-open 探测遇到 throttled / client_error 时保持 half-open，下一个请求继续探测
+        """
+        now = time.monotonic()
+        with self._cond:
+            self._inflight -= 1
+            if probe:
+                self._probe_inflight = False
+
+            if outcome == "success":
+                self._stats["success"] += 1
+                self._consecutive_failures = 0
+                self._state = "closed"
+                self._limit = min(self.max_concurrency, self._limit + 1.0 / self._limit)
+            else:
+                self._stats[outcome] += 1
+                if outcome in _DECREASE_OUTCOMES:
+                    if started_at is not None and started_at < self._last_decrease_at:
+                        self._stats["decrease_skipped"] += 1
+                    else:
+                        self._limit = max(self.min_concurrency, self._limit * self.decrease_factor)
+                        self._last_decrease_at = now
+                if retry_after:
+                    self._blocked_until = max(self._blocked_until, now + retry_after)
+                if outcome in _BREAKER_OUTCOMES:
+                    self._consecutive_failures += 1
+                    if probe or self._consecutive_failures >= self.breaker_failures:
+                        self._trip(now)
+
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, timeout: Optional[float] = None) -> Iterator[Dict[str, Any]]:
+        """
+        with guard.slot() as s:
+            ... 发请求 ...
+            s["outcome"] = "throttled"; s["retry_after"] = 2
+        未设置 outcome 时：正常退出算 success，抛异常算 failed
+        """
+        probe = self.acquire(timeout)
+        started_at = time.monotonic()
+        state: Dict[str, Any] = {"outcome": None, "retry_after": None}
+        try:
+            yield state
+        except BaseException:
+            self.release(state["outcome"] or "failed", state["retry_after"], probe, started_at)
+            raise
+        self.release(state["outcome"] or "success", state["retry_after"], probe, started_at)
+
+    # ---------- 指标 ----------
+    def snapshot(self) -> Dict[str, Any]:
+        """容量规划用：当前并发上限、排队情况、等待时间分位数、拒绝次数、熔断状态。"""
+        from diagnostics.metrics import percentile
+
+        with self._cond:
+            waits = sorted(self._waits)
+            now = time.monotonic()
+
+            def pct(p: int) -> Optional[float]:
+                value = percentile(waits, p)
+                return None if value is None else round(value, 4)
+
+            return {
+                "limit": round(self._limit, 2),
+                "max_concurrency": self.max_concurrency,
+                "inflight": self._inflight,
+                "waiting": self._waiting,
+                "breaker_state": self._state,
+                "consecutive_failures": self._consecutive_failures,
+                "retry_after_remaining_sec": round(max(0.0, self._blocked_until - now), 3),
+                "queue_wait_p50_sec": pct(50),
+                "queue_wait_p95_sec": pct(95),
+                "queue_wait_p99_sec": pct(99),
+                **{k: (round(v, 4) if isinstance(v, float) else v) for k, v in self._stats.items()},
+            }
+
+
+_guard: Optional[LLMGuard] = None
+_guard_lock = threading.Lock()
+
+
+def get_llm_guard() -> LLMGuard:
+    """进程内单例，参数来自环境变量。"""
+    global _guard
+    if _guard is None:
+        with _guard_lock:
+            if _guard is None:
+                _guard = LLMGuard(
+                    max_concurrency=int(os.getenv("HA_LLM_MAX_CONCURRENCY", "8")),
+                    queue_timeout=float(os.getenv("HA_LLM_QUEUE_TIMEOUT", "30")),
+                    breaker_failures=int(os.getenv("HA_LLM_BREAKER_FAILURES", "5")),
+                    breaker_cooldown=float(os.getenv("HA_LLM_BREAKER_COOLDOWN", "30")),
+                )
+    return _guard
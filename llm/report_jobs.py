@@ -0,0 +1,194 @@
+# llm/report_jobs.py
+"""
+报告升级任务：先给模板报告，LLM 报告在后台生成，完成后替换
+
+状态：
+  - "pending"：当前是模板版，LLM 版还在生成
+  - "ready"：已替换为 LLM 版
+  - "template"：最终使用模板版（reason: no_api_key / queue_full / timeout / 错误信息）
+超时以提交时刻为起点：查询时发现已超时直接判定回退；超时后才返回的 LLM 结果丢弃，
+保证同一个请求看到的报告不会在“已回退”之后又变掉
+排队中的任务轮到执行时已超时，直接判定回退，不再调用 LLM；
+等待执行的任务超过 HA_LLM_UPGRADE_QUEUE（默认 64）时新任务不再排队，直接定为模板版
+
+传入 state_path（例如 outputs/requests/{id}/report_status.json）时，每次状态变化都原子写入该文件，
+本进程内存里查不到的任务（多 worker 下落到别的进程、或服务重启后）从文件读取；
+pending 记录带绝对期限 deadline_at，生成它的进程没了也能按期限判定回退
+"""
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Union
+
+DEFAULT_TIMEOUT_SEC = 60.0
+DEFAULT_MAX_QUEUED = 64
+MAX_JOBS = 2048  # 只在内存里保留最近的任务记录
+
+_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("HA_LLM_UPGRADE_WORKERS", "8")),
+    thread_name_prefix="llm-upgrade",
+)
+_jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+_queued = 0  # 已提交、还没开始执行的任务数
+
+
+def upgrade_timeout() -> float:
+    return float(os.getenv("HA_LLM_REPORT_TIMEOUT", str(DEFAULT_TIMEOUT_SEC)))
+
+
+def max_queued() -> int:
+    return int(os.getenv("HA_LLM_UPGRADE_QUEUE", str(DEFAULT_MAX_QUEUED)))
+
+
+def _view(record: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "status": record["status"],
+        "source": "llm" if record["status"] == "ready" else "template",
+        "reason": record["reason"],
+        "report_child": record["report_child"],
+        "report_elder": record["report_elder"],
+        **record["extra"],
+    }
+
+
+def _persist(record: Dict[str, Any]) -> None:
+    """把当前状态写到 state_path（没有就跳过）；写失败只影响跨进程查询，不影响本进程。"""
+    path = record.get("state_path")
+    if path is None:
+        return
+    from storage.files import atomic_write_bytes
+
+    with _lock:
+        state = {**_view(record), "deadline_at": record["deadline_at"]}
+    try:
+        atomic_write_bytes(path, json.dumps(state, ensure_ascii=False).encode("utf-8"))
+    except OSError:
+        pass
+
+
+def _store(job_id: str, record: Dict[str, Any]) -> None:
+    with _lock:
+        _jobs[job_id] = record
+        _jobs.move_to_end(job_id)
+        while len(_jobs) > MAX_JOBS:
+            _jobs.popitem(last=False)
+    _persist(record)
+
+
+def _finish(job_id: str, record: Dict[str, Any], status: str, **fields: Any) -> bool:
+    """仅当任务仍是 pending 时更新（超时判定与后台完成之间只有一个生效）。"""
+    with _lock:
+        if _jobs.get(job_id) is not record or record["status"] != "pending":
+            return False
+        record.update(status=status, finished_at=time.time(), **fields)
+    _persist(record)
+    return True
+
+
+def submit_report_upgrade(
+    job_id: str,
+    template: Dict[str, str],
+    generate: Optional[Callable[[], Dict[str, Any]]] = None,
+    on_ready: Optional[Callable[[Dict[str, str]], Optional[Dict[str, Any]]]] = None,
+    timeout: Optional[float] = None,
+    extra: Optional[Dict[str, Any]] = None,
+    state_path: Optional[Union[str, Path]] = None,
+) -> Optional[Future]:
+    """
+    登记模板报告，并在后台用 generate() 生成 LLM 报告
+    - generate 为 None（没有 API key）：直接定为模板版
+    - 排队任务已满：直接定为模板版（reason=queue_full），返回 None
+    - on_ready(reports)：LLM 版就绪后回调（例如重写 report.json、重新导出 PDF），
+      返回的 dict 合并进 extra（初始 extra 例如模板版的 PDF 链接），随查询结果一起返回
+    - state_path：状态文件，供其他进程 / 重启后的 report_status 读取
+    """
+    global _queued
+    timeout = upgrade_timeout() if timeout is None else timeout
+    reason = None if generate is not None else "no_api_key"
+    if generate is not None:
+        with _lock:
+            if _queued >= max_queued():
+                generate, reason = None, "queue_full"
+            else:
+                _queued += 1
+    now = time.time()
+    record: Dict[str, Any] = {
+        "status": "pending" if generate is not None else "template",
+        "reason": reason,
+        "report_child": template.get("report_child", ""),
+        "report_elder": template.get("report_elder", ""),
+        "submitted_at": now,
+        "deadline": time.monotonic() + timeout,
+        "deadline_at": now + timeout,
+        "extra": dict(extra or {}),
+        "state_path": state_path,
+    }
+    _store(job_id, record)
+    if generate is None:
+        return None
+
+    def _run() -> None:
+        global _queued
+        with _lock:
+            _queued -= 1
+        if time.monotonic() > record["deadline"]:
+            # 在队列里等到超时：结果反正会被丢弃，不再调用 LLM
+            _finish(job_id, record, "template", reason="timeout")
+            return
+        try:
+            reports = generate()
+        except Exception as e:
+            _finish(job_id, record, "template", reason=f"{type(e).__name__}: {e}")
+            return
+        if time.monotonic() > record["deadline"]:
+            _finish(job_id, record, "template", reason="timeout")
+            return
+        upgraded = {
+            "report_child": reports.get("report_child", ""),
+            "report_elder": reports.get("report_elder", ""),
+        }
+        if not _finish(job_id, record, "ready", **upgraded) or on_ready is None:
+            return
+        try:
+            updates = on_ready(upgraded) or {}
+        except Exception as e:  # 落盘 / 导出失败不影响报告本身
+            updates = {"on_ready_error": f"{type(e).__name__}: {e}"}
+        with _lock:
+            record["extra"] = {**record["extra"], **updates}
+        _persist(record)
+
+    return _executor.submit(_run)
+
+
+def _load_state(state_path: Union[str, Path]) -> Optional[Dict[str, Any]]:
+    try:
+        state = json.loads(Path(state_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    deadline_at = state.pop("deadline_at", None)
+    if state.get("status") == "pending" and deadline_at is not None and time.time() > deadline_at:
+        # 负责生成的进程已超过期限（或已退出）：按超时回退，与进程内的判定一致
+        state.update(status="template", source="template", reason="timeout")
+    return state
+
+
+def report_status(job_id: str, state_path: Optional[Union[str, Path]] = None) -> Optional[Dict[str, Any]]:
+    """
+    查询当前报告（任务不存在返回 None）；pending 超过期限时在这里判定为模板回退
+    本进程没有该任务时读 state_path（其他 worker 提交的、或重启前提交的任务）
+    """
+    with _lock:
+        record = _jobs.get(job_id)
+    if record is None:
+        return _load_state(state_path) if state_path is not None else None
+    if record["status"] == "pending" and time.monotonic() > record["deadline"]:
+        _finish(job_id, record, "template", reason="timeout")
+    with _lock:
+        return _view(record)
@@ -0,0 +1,322 @@
+# llm/retrieval.py
+"""
+本地离线检索：给 LLM prompt 补充“生活方式 / 复查”指引片段
+
+- 语料：data/guidance/*.md（头部 front matter 标注 title / metrics）
+- 切分：langchain RecursiveCharacterTextSplitter（未安装时用 langchain/ 下的最小实现）
+- 索引：BM25，分词为 ASCII 单词 + 中文二元组；每个 posting 的 BM25 权重在建索引时就算好，
+  以 CSR 数组存成 .npy，启动时 np.load(mmap_mode="r") 映射，查询只是几次切片求和
+- 语料内容变化（按内容哈希判断）时自动重建
+- 数据文件写在按语料哈希命名的子目录里（每个文件原子写），manifest.json 最后原子写并指向该子目录：
+  多个进程同时重建 / 一边重建一边加载，读到的都是某一个完整版本，不会混用新旧文件
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import math
+import re
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from analysis.models import MetricSummary
+from storage.files import atomic_write_bytes
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_CORPUS_DIR = PROJECT_ROOT / "data" / "guidance"
+DEFAULT_INDEX_DIR = PROJECT_ROOT / "outputs" / "guidance_index"
+
+INDEX_VERSION = 1
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_ASCII_RE = re.compile(r"[a-z0-9_]+")
+_CJK_RE = re.compile(r"[一-鿿]+")
+
+
+def tokenize(text: str) -> List[str]:
+    """ASCII 单词 + 中文二元组（单字的中文片段保留单字）。"""
+    text = text.lower()
+    tokens = _ASCII_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+def _parse_front_matter(text: str) -> Tuple[Dict[str, str], str]:
+    if not text.startswith("---"):
+        return {}, text
+    end = text.find("\n---", 3)
+    if end < 0:
+        return {}, text
+    meta: Dict[str, str] = {}
+    for line in text[3:end].strip().splitlines():
+        k, _, v = line.partition(":")
+        if k.strip():
+            meta[k.strip()] = v.strip()
+    return meta, text[end + 4:].lstrip("\n")
+
+
+def _corpus_files(corpus_dir: Path) -> List[Path]:
+    return sorted(p for p in corpus_dir.glob("*.md") if p.is_file())
+
+
+def _corpus_hash(files: List[Path], chunk_size: int, chunk_overlap: int) -> str:
+    h = hashlib.sha256(f"v{INDEX_VERSION}:{chunk_size}:{chunk_overlap}".encode("utf-8"))
+    for p in files:
+        h.update(p.name.encode("utf-8") + b"\0")
+        h.update(p.read_bytes())
+    return h.hexdigest()
+
+
+def build_index(
+    corpus_dir: str | Path = DEFAULT_CORPUS_DIR,
+    index_dir: str | Path = DEFAULT_INDEX_DIR,
+    chunk_size: int = 200,
+    chunk_overlap: int = 30,
+) -> Dict[str, Any]:
+    """切分语料并写出 BM25 索引；返回构建信息（耗时、chunk 数、词表大小）。"""
+    from langchain.docstore.document import Document
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    started = time.perf_counter()
+    corpus_dir, index_dir = Path(corpus_dir), Path(index_dir)
+    files = _corpus_files(corpus_dir)
+
+    docs = []
+    for p in files:
+        meta, body = _parse_front_matter(p.read_text(encoding="utf-8"))
+        metrics = [m.strip() for m in meta.get("metrics", "").split(",") if m.strip()]
+        # 一级标题已在 metadata 里，正文从小节开始，避免切出只有标题的 chunk
+        body = re.sub(r"^# .*\n+", "", body)
+        docs.append(Document(page_content=body, metadata={
+            "source": p.name,
+            "title": meta.get("title", p.stem),
+            "metrics": metrics,
+        }))
+
+    splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        separators=["\n## ", "\n\n", "\n", "。", "；", "，", ""],
+    )
+    chunks = splitter.split_documents(docs)
+
+    # 每个 chunk 的词频；front matter 里的指标标签作为额外词项（metric:sbp）参与打分
+    tfs: List[Counter] = []
+    for c in chunks:
+        tokens = tokenize(c.page_content)
+        tokens += [f"metric:{m}" for m in c.metadata["metrics"]] * 3
+        tfs.append(Counter(tokens))
+
+    n = len(chunks)
+    doc_len = np.array([sum(tf.values()) for tf in tfs], dtype=np.float32)
+    avgdl = float(doc_len.mean()) if n else 1.0
+    df: Counter = Counter()
+    for tf in tfs:
+        df.update(tf.keys())
+
+    vocab = {t: i for i, t in enumerate(sorted(df))}
+    postings: List[List[Tuple[int, float]]] = [[] for _ in vocab]
+    for d, tf in enumerate(tfs):
+        norm = BM25_K1 * (1 - BM25_B + BM25_B * doc_len[d] / avgdl)
+        for t, f in tf.items():
+            idf = math.log(1 + (n - df[t] + 0.5) / (df[t] + 0.5))
+            postings[vocab[t]].append((d, idf * f * (BM25_K1 + 1) / (f + norm)))
+
+    term_ptr = np.zeros(len(vocab) + 1, dtype=np.int64)
+    term_ptr[1:] = np.cumsum([len(p) for p in postings])
+    post_doc = np.fromiter((d for p in postings for d, _ in p), dtype=np.int32, count=int(term_ptr[-1]))
+    post_w = np.fromiter((w for p in postings for _, w in p), dtype=np.float32, count=int(term_ptr[-1]))
+
+    corpus_hash = _corpus_hash(files, chunk_size, chunk_overlap)
+    # 同一语料的构建结果是确定的：并发构建写同一子目录也只是写入相同内容
+    data_dir = f"v{INDEX_VERSION}-{corpus_hash[:16]}"
+    for name, arr in (("term_ptr.npy", term_ptr), ("post_doc.npy", post_doc), ("post_w.npy", post_w)):
+        buf = io.BytesIO()
+        np.save(buf, arr)
+        atomic_write_bytes(index_dir / data_dir / name, buf.getvalue())
+    atomic_write_bytes(index_dir / data_dir / "vocab.json", json.dumps(vocab, ensure_ascii=False).encode("utf-8"))
+    atomic_write_bytes(
+        index_dir / data_dir / "chunks.json",
+        json.dumps([{"text": c.page_content, **c.metadata} for c in chunks], ensure_ascii=False).encode("utf-8"),
+    )
+    info = {
+        "version": INDEX_VERSION,
+        "corpus_hash": corpus_hash,
+        "data_dir": data_dir,
+        "chunk_size": chunk_size,
+        "chunk_overlap": chunk_overlap,
+        "files": len(files),
+        "chunks": n,
+        "vocab": len(vocab),
+        "postings": int(term_ptr[-1]),
+        "build_sec": round(time.perf_counter() - started, 4),
+    }
+    # manifest 最后写：作为“索引完整”的标记，同时切换到新的数据子目录（旧子目录保留，体积很小）
+    atomic_write_bytes(index_dir / "manifest.json", json.dumps(info).encode("utf-8"))
+    return info
+
+
+class GuidanceIndex:
+    def __init__(self, index_dir: str | Path = DEFAULT_INDEX_DIR):
+        self.manifest = json.loads((Path(index_dir) / "manifest.json").read_text(encoding="utf-8"))
+        data_dir = Path(index_dir) / self.manifest.get("data_dir", "")
+        self.term_ptr = np.load(data_dir / "term_ptr.npy", mmap_mode="r")
+        self.post_doc = np.load(data_dir / "post_doc.npy", mmap_mode="r")
+        self.post_w = np.load(data_dir / "post_w.npy", mmap_mode="r")
+        self.vocab: Dict[str, int] = json.loads((data_dir / "vocab.json").read_text(encoding="utf-8"))
+        self.chunks: List[Dict[str, Any]] = json.loads((data_dir / "chunks.json").read_text(encoding="utf-8"))
+        # 指标 -> 带该标签的 chunk 下标；按指标检索时只在这些 chunk 里排序
+        self.metric_chunks: Dict[str, np.ndarray] = {}
+        for i, c in enumerate(self.chunks):
+            for m in c.get("metrics", []):
+                self.metric_chunks.setdefault(m, []).append(i)
+        self.metric_chunks = {m: np.array(ids, dtype=np.int64) for m, ids in self.metric_chunks.items()}
+        self._cache: Dict[Tuple[str, int], List[Dict[str, Any]]] = {}
+        self._cache_lock = threading.Lock()
+
+    def search(
+        self,
+        query: str,
+        k: int = 3,
+        extra_terms: Tuple[str, ...] = (),
+        restrict_to: Optional[np.ndarray] = None,
+    ) -> List[Dict[str, Any]]:
+        """BM25 top-k；返回 chunk（含 text / source / title / metrics / score）。"""
+        term_ids = {self.vocab[t] for t in tokenize(query) + list(extra_terms) if t in self.vocab}
+        if not term_ids:
+            return []
+        scores = np.zeros(len(self.chunks), dtype=np.float32)
+        for tid in term_ids:
+            lo, hi = int(self.term_ptr[tid]), int(self.term_ptr[tid + 1])
+            # 同一词项在一个 chunk 里只有一个 posting，可以直接花式索引相加
+            scores[self.post_doc[lo:hi]] += self.post_w[lo:hi]
+        if restrict_to is not None:
+            mask = np.zeros(len(scores), dtype=bool)
+            mask[restrict_to] = True
+            scores[~mask] = 0
+
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [{**self.chunks[i], "score": round(float(scores[i]), 4)} for i in top if scores[i] > 0]
+
+    def search_metric(self, key: str, name: str, flag: str, k: int = 2) -> List[Dict[str, Any]]:
+        """按指标检索（带进程内缓存：同一指标 + 状态的结果不会变）。"""
+        cache_key = (f"{key}|{flag}", k)
+        with self._cache_lock:
+            hit = self._cache.get(cache_key)
+        if hit is not None:
+            return hit
+        query = f"{name} {key} {_FLAG_WORDS.get(flag, '')} 复查 就医 生活方式"
+        result = self.search(
+            query, k=k, extra_terms=(f"metric:{key}",), restrict_to=self.metric_chunks.get(key)
+        )
+        with self._cache_lock:
+            self._cache[cache_key] = result
+        return result
+
+
+_FLAG_WORDS = {
+    "HIGH": "偏高 超过 上限",
+    "LOW": "偏低 低于 下限",
+    "UP": "上升 升高 趋势",
+}
+
+
+def flagged_metrics(summary: Dict[str, MetricSummary]) -> List[Tuple[str, str]]:
+    """需要补充指引的指标：超范围 / 明显偏离 / 连续上升；按严重程度排序。"""
+    flagged = []
+    for key, v in summary.items():
+        if v.out_of_range:
+            flagged.append((0, key, v.out_flag or "HIGH"))
+        elif v.zscore_latest is not None and abs(v.zscore_latest) >= 2:
+            flagged.append((1, key, "HIGH" if v.zscore_latest > 0 else "LOW"))
+        elif v.monotonic_increase_last3 and v.trend == "UP":
+            flagged.append((2, key, "UP"))
+    flagged.sort(key=lambda x: x[0])
+    return [(key, flag) for _, key, flag in flagged]
+
+
+def retrieve_guidance(
+    summary: Dict[str, MetricSummary],
+    k_per_metric: int = 2,
+    max_snippets: int = 8,
+    index: Optional[GuidanceIndex] = None,
+) -> List[Dict[str, Any]]:
+    """为异常指标检索指引片段（去重），用于注入 prompt。"""
+    index = index or get_guidance_index()
+    if index is None:
+        return []
+    out: List[Dict[str, Any]] = []
+    seen = set()
+    for key, flag in flagged_metrics(summary):
+        name = summary[key].name or key
+        for hit in index.search_metric(key, name, flag, k=k_per_metric):
+            sig = (hit["source"], hit["text"])
+            if sig in seen:
+                continue
+            seen.add(sig)
+            out.append({"metric": key, "source": hit["title"], "text": hit["text"]})
+            if len(out) >= max_snippets:
+                return out
+    return out
+
+
+_index: Optional[GuidanceIndex] = None
+_index_lock = threading.Lock()
+
+
+def get_guidance_index(
+    corpus_dir: str | Path = DEFAULT_CORPUS_DIR,
+    index_dir: str | Path = DEFAULT_INDEX_DIR,
+) -> Optional[GuidanceIndex]:
+    """
+    进程内单例：索引缺失或语料变化时构建一次，之后只做 mmap 加载
+    语料目录不存在时返回 None（检索是可选增强，不影响主流程）
+    """
+    global _index
+    if _index is None:
+        with _index_lock:
+            if _index is None:
+                corpus_dir, index_dir = Path(corpus_dir), Path(index_dir)
+                files = _corpus_files(corpus_dir) if corpus_dir.is_dir() else []
+                if not files:
+                    return None
+                manifest_path = index_dir / "manifest.json"
+                stale = True
+                if manifest_path.is_file():
+                    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+                    stale = manifest.get("corpus_hash") != _corpus_hash(
+                        files, manifest.get("chunk_size", 0), manifest.get("chunk_overlap", 0)
+                    )
+                if stale:
+                    build_index(corpus_dir, index_dir)
+                _index = GuidanceIndex(index_dir)
+    return _index
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="构建 / 查询指引检索索引")
+    parser.add_argument("--corpus", default=str(DEFAULT_CORPUS_DIR))
+    parser.add_argument("--index", default=str(DEFAULT_INDEX_DIR))
+    parser.add_argument("--query", default=None)
+    parser.add_argument("-k", type=int, default=3)
+    args = parser.parse_args()
+
+    print(build_index(args.corpus, args.index))
+    if args.query:
+        for hit in GuidanceIndex(args.index).search(args.query, k=args.k):
+            print(f"[{hit['score']}] {hit['title']}: {hit['text'][:80]}")
@@ -0,0 +1,338 @@
+# llm/template_report.py
+"""
+本地模板报告：不调用大模型，直接根据 summary / warnings 生成两版 Markdown
+结构与 build_prompt_cn 里要求 LLM 输出的结构一致，毫秒级完成
+用途：
+  - 没有 DEEPSEEK_API_KEY 时的默认报告
+  - /analyze 先返回模板版，LLM 版生成后再替换；LLM 超时 / 失败时保底
+"""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional, Tuple
+
+from analysis.models import AnalysisResult, MetricSummary
+
+# 指标分组：同组共用“可能原因 / 生活建议 / 就诊科室”
+METRIC_GROUPS = {
+    "sbp": "blood_pressure",
+    "dbp": "blood_pressure",
+    "resting_heart_rate": "heart",
+    "weight_kg": "weight",
+    "fasting_glucose": "glucose",
+    "tc": "lipids",
+    "tg": "lipids",
+    "hdl": "lipids",
+    "ldl": "lipids",
+    "alt": "liver",
+    "ast": "liver",
+    "creatinine": "kidney",
+    "uric_acid": "uric_acid",
+}
+
+GROUP_NOTES: Dict[str, Dict[str, Any]] = {
+    "blood_pressure": {
+        "label": "血压",
+        "causes": "饮食偏咸、体重增加、运动少、睡眠不足或精神压力大，也可能与测量时紧张有关",
+        "tips": ["做菜少放盐和酱油，少吃咸菜、腌肉", "每天早晚在家量一次血压并记下来"],
+        "dept": "心内科",
+    },
+    "heart": {
+        "label": "心率",
+        "causes": "运动量变化、睡眠不足、饮用咖啡或浓茶、情绪紧张等",
+        "tips": ["保证每天7小时左右睡眠，少喝浓茶和咖啡"],
+        "dept": "心内科",
+    },
+    "weight": {
+        "label": "体重",
+        "causes": "饮食热量偏高、活动量下降、作息变化等",
+        "tips": ["每餐吃到七八分饱，晚饭少吃油炸和甜食"],
+        "dept": "全科",
+    },
+    "glucose": {
+        "label": "血糖",
+        "causes": "主食和甜食偏多、体重增加、运动少，也可能与检查前饮食或睡眠有关",
+        "tips": ["少喝含糖饮料，主食里搭配一些粗粮", "饭后散步15到30分钟"],
+        "dept": "内分泌科",
+    },
+    "lipids": {
+        "label": "血脂",
+        "causes": "饮食油腻、肉类和动物内脏偏多、运动少、饮酒，也与遗传有关",
+        "tips": ["少吃肥肉、动物内脏和油炸食品，多吃蔬菜", "每周快走或做操5次，每次30分钟"],
+        "dept": "心内科",
+    },
+    "liver": {
+        "label": "肝功能",
+        "causes": "饮酒、脂肪肝、近期服药或保健品、劳累，抽血前剧烈运动也会影响结果",
+        "tips": ["少喝酒或不喝酒，不自行加吃保健品"],
+        "dept": "消化内科",
+    },
+    "kidney": {
+        "label": "肾功能",
+        "causes": "饮水偏少、高蛋白饮食、剧烈运动，或与血压、血糖控制有关",
+        "tips": ["每天喝够水，不要憋尿"],
+        "dept": "肾内科",
+    },
+    "uric_acid": {
+        "label": "尿酸",
+        "causes": "海鲜、动物内脏、啤酒和含糖饮料摄入偏多，饮水少或体重增加",
+        "tips": ["少喝啤酒和甜饮料，海鲜和内脏少吃", "多喝白开水"],
+        "dept": "内分泌科",
+    },
+}
+
+# 数值越高越好的指标：上升不算风险
+HIGHER_IS_BETTER = {"hdl"}
+
+GENERAL_TIPS = [
+    "每周坚持几次适量运动，比如快走、太极",
+    "按时吃饭、按时睡觉，少熬夜",
+    "保持好心情，有事多和家人聊聊",
+    "戒烟，少喝酒",
+]
+
+TIER_ORDER = ["red", "orange", "yellow", "green"]
+TIER_LABELS = {
+    "red": ("红", "超出参考范围且变化明显，建议尽快就医评估"),
+    "orange": ("橙", "超出参考范围，建议按期复查并咨询医生"),
+    "yellow": ("黄", "仍在范围内但接近边界、明显偏离或持续上升，需要留意"),
+    "green": ("绿", "在参考范围内且趋势平稳，保持即可"),
+}
+TREND_TEXT = {"UP": "上升", "DOWN": "下降", "FLAT": "持平", "NA": "数据不足"}
+
+NEAR_BOUNDARY_RATIO = 0.1  # 距离边界不到参考范围宽度 10%（单侧范围按边界值 5%）算“接近边界”
+
+
+def _fmt(x: Any) -> str:
+    if isinstance(x, float):
+        return f"{round(x, 2):g}"
+    return str(x)
+
+
+def _ref_text(m: MetricSummary) -> str:
+    if m.ref_low is not None and m.ref_high is not None:
+        return f"参考 {_fmt(m.ref_low)}–{_fmt(m.ref_high)}"
+    if m.ref_high is not None:
+        return f"参考 ≤{_fmt(m.ref_high)}"
+    if m.ref_low is not None:
+        return f"参考 ≥{_fmt(m.ref_low)}"
+    return "无固定参考范围"
+
+
+def _near_boundary(m: MetricSummary) -> Optional[str]:
+    """接近参考范围边界时返回 "HIGH" / "LOW"。"""
+    if m.out_of_range or not isinstance(m.latest, (int, float)):
+        return None
+    low, high, v = m.ref_low, m.ref_high, float(m.latest)
+    if low is not None and high is not None:
+        margin = (high - low) * NEAR_BOUNDARY_RATIO
+    else:
+        margin = abs(high if high is not None else (low or 0)) * NEAR_BOUNDARY_RATIO / 2
+    if high is not None and high - margin <= v:
+        return "HIGH"
+    if low is not None and v <= low + margin:
+        return "LOW"
+    return None
+
+
+def _is_rising(m: MetricSummary) -> bool:
+    return m.monotonic_increase_last3 and m.trend == "UP" and m.key not in HIGHER_IS_BETTER
+
+
+def _is_deviating(m: MetricSummary) -> bool:
+    return m.zscore_latest is not None and abs(m.zscore_latest) >= 2
+
+
+def classify_metric(m: MetricSummary) -> Tuple[str, List[str]]:
+    """风险分层 + 关注理由（理由为空表示无需关注）。"""
+    reasons: List[str] = []
+    if m.out_of_range:
+        reasons.append("高于参考范围上限" if m.out_flag == "HIGH" else "低于参考范围下限")
+    if _is_deviating(m):
+        reasons.append(f"相对往年明显偏离（Z={m.zscore_latest}）")
+    if _is_rising(m):
+        reasons.append("最近3年持续上升")
+    near = _near_boundary(m)
+    if near:
+        reasons.append("接近参考范围上限" if near == "HIGH" else "接近参考范围下限")
+
+    if m.out_of_range:
+        tier = "red" if (_is_deviating(m) or _is_rising(m)) else "orange"
+    elif reasons:
+        tier = "yellow"
+    else:
+        tier = "green"
+    return tier, reasons
+
+
+def _ranked(summary: Dict[str, MetricSummary]) -> List[Tuple[str, MetricSummary, List[str]]]:
+    """按风险等级排序的 (等级, 指标, 理由)，同级保持原指标顺序。"""
+    items = []
+    for i, m in enumerate(summary.values()):
+        tier, reasons = classify_metric(m)
+        items.append((TIER_ORDER.index(tier), i, tier, m, reasons))
+    items.sort(key=lambda x: (x[0], x[1]))
+    return [(tier, m, reasons) for _, _, tier, m, reasons in items]
+
+
+def _groups(items: List[Tuple[str, MetricSummary, List[str]]]) -> List[str]:
+    out: List[str] = []
+    for _, m, _ in items:
+        g = METRIC_GROUPS.get(m.key)
+        if g and g not in out:
+            out.append(g)
+    return out
+
+
+def _depts(items) -> str:
+    return "、".join(dict.fromkeys(GROUP_NOTES[g]["dept"] for g in _groups(list(items)))) or "全科"
+
+
+def _metric_line(m: MetricSummary, n_years: int, reasons: List[str]) -> str:
+    trend = TREND_TEXT.get(m.trend, m.trend)
+    if m.yoy_delta is not None:
+        trend += f"（较上年 {m.yoy_delta:+g}）"
+    cohort = "" if m.cohort_percentile is None else f"｜{m.cohort}第{m.cohort_percentile:.0f}百分位"
+    return (
+        f"- {m.name}：{_fmt(m.latest)}{m.unit}（{_ref_text(m)}）｜近{n_years}年趋势{trend}"
+        f"{cohort}｜{'；'.join(reasons)}"
+    )
+
+
+def render_child_report(rows: List[Dict[str, Any]], result: AnalysisResult) -> str:
+    ranked = _ranked(result.summary)
+    attention = [x for x in ranked if x[0] != "green"]
+    by_tier = {t: [m.name for tier, m, _ in ranked if tier == t] for t in TIER_ORDER}
+    n_years = len(rows)
+
+    lines = ["# 家庭健康趋势审计报告（给子女）", "", "> 快速版：由本地规则模板生成，不含个性化解读。", ""]
+
+    lines.append("## 1. 结论摘要（3-5条要点）")
+    lines.append(f"- 共分析 {len(ranked)} 项指标、{n_years} 年数据。")
+    if attention:
+        counts = "、".join(f"{TIER_LABELS[t][0]}色 {len(by_tier[t])} 项" for t in TIER_ORDER[:3] if by_tier[t])
+        lines.append(f"- 需要关注：{counts}。")
+        lines.append(f"- 优先关注：{'、'.join(m.name for _, m, _ in attention[:3])}。")
+    else:
+        lines.append("- 各项指标均在参考范围内，趋势平稳。")
+    lines.append(f"- 预警条目 {len(result.warnings)} 条，详见下文；结论以趋势为主，单次波动不必过度紧张。")
+    lines.append("")
+
+    lines.append("## 2. 需要重点关注的指标（按优先级排序）")
+    if attention:
+        lines.extend(_metric_line(m, n_years, reasons) for _, m, reasons in attention)
+    else:
+        lines.append("- 暂无明显异常指标，建议保持每年体检。")
+    lines.append("")
+
+    lines.append("## 3. 风险分层（绿/黄/橙/红）")
+    for t in reversed(TIER_ORDER):
+        label, meaning = TIER_LABELS[t]
+        names = "、".join(by_tier[t]) or "无"
+        lines.append(f"- {label}：{meaning}。本次：{names}")
+    lines.append("")
+
+    lines.append("## 4. 可能原因线索（不确定性说明）")
+    groups = _groups(attention)
+    if groups:
+        for g in groups:
+            note = GROUP_NOTES[g]
+            lines.append(f"- {note['label']}：常见相关因素包括{note['causes']}。")
+    else:
+        lines.append("- 本次没有需要特别解释的异常。")
+    lines.append("- 以上只是可能性，需要结合生活方式、既往病史和医生判断。")
+    lines.append("")
+
+    week, month, quarter = [], [], []
+    if by_tier["red"]:
+        depts = _depts(x for x in attention if x[0] == "red")
+        week.append(f"带上近{n_years}年体检报告，到{depts}门诊咨询医生（{'、'.join(by_tier['red'])}）")
+    if by_tier["orange"]:
+        depts = _depts(x for x in attention if x[0] == "orange")
+        month.append(f"复查 {'、'.join(by_tier['orange'])}，必要时就诊{depts}")
+    if by_tier["yellow"]:
+        quarter.append(f"调整生活方式后复查 {'、'.join(by_tier['yellow'])}")
+    if any(METRIC_GROUPS.get(m.key) == "blood_pressure" for _, m, _ in attention):
+        week.append("开始家庭血压监测，早晚各一次并记录")
+    week = week or ["和家人一起看一遍本报告，确认近期有无不适"]
+    month = month or ["建立饮食与运动记录，逐步调整作息"]
+    quarter = quarter or ["保持现有习惯，按年度计划体检"]
+
+    lines.append("## 5. 行动清单（非常具体）")
+    lines.append(f"- 1周内：{'；'.join(week)}")
+    lines.append(f"- 1个月内：{'；'.join(month)}")
+    lines.append(f"- 3个月内：{'；'.join(quarter)}")
+    lines.append("")
+
+    lines.append("## 6. 给家人的沟通话术（3句以内）")
+    if attention:
+        focus = "、".join(m.name for _, m, _ in attention[:2])
+        lines.append(f"“这次体检整体还行，就是{focus}需要多留意一下。”")
+        lines.append("“咱们先从饮食和作息上慢慢调，过段时间一起去复查。”")
+    else:
+        lines.append("“这次体检各项都不错，咱们继续保持，明年接着一起体检。”")
+    return "\n".join(lines) + "\n"
+
+
+def render_elder_report(rows: List[Dict[str, Any]], result: AnalysisResult) -> str:
+    ranked = _ranked(result.summary)
+    attention = [x for x in ranked if x[0] != "green"]
+    urgent = [m.name for tier, m, _ in attention if tier in ("red", "orange")]
+
+    lines = ["# 健康小结（给长辈）", ""]
+
+    lines.append("## 1. 先说结论（安抚+鼓励，3句话以内）")
+    if not attention:
+        lines.append("这次体检各项指标都在正常范围内，身体状况不错。继续保持现在的好习惯就行。")
+    elif urgent:
+        lines.append(f"大部分指标都还可以，有 {len(attention)} 项需要多留意一下。"
+                     "这些都是常见情况，按时复查、慢慢调整就好，不用太担心。")
+    else:
+        lines.append(f"整体情况不错，有 {len(attention)} 项指标接近边界或在慢慢变化，平时多注意就行。")
+    lines.append("")
+
+    lines.append("## 2. 哪些指标要留意（最多5项）")
+    if attention:
+        for tier, m, _ in attention[:5]:
+            level = {
+                "red": "比正常范围高出不少" if m.out_flag == "HIGH" else "比正常范围低了不少",
+                "orange": "稍微超出正常范围" if m.out_flag == "HIGH" else "稍微低于正常范围",
+                "yellow": "还在正常范围内，但需要留意",
+            }[tier]
+            group = METRIC_GROUPS.get(m.key)
+            tip = GROUP_NOTES[group]["tips"][0] if group else "平时多注意观察"
+            lines.append(f"- {m.name}：现在{level}，{tip}。")
+    else:
+        lines.append("- 暂时没有需要特别留意的指标。")
+    lines.append("")
+
+    tips: List[str] = []
+    for g in _groups(attention):
+        tips.extend(GROUP_NOTES[g]["tips"])
+    tips.extend(GENERAL_TIPS)
+    lines.append("## 3. 生活习惯小建议（不超过8条）")
+    lines.extend(f"- {t}" for t in list(dict.fromkeys(tips))[:8])
+    lines.append("")
+
+    lines.append("## 4. 复查与就医建议")
+    if urgent:
+        lines.append(f"- {'、'.join(urgent)}超出了正常范围，建议这一两个月内带着这份报告去医院，请医生看一看。")
+    if attention and not urgent:
+        lines.append("- 留意的指标可以在三个月左右复查一次，看看有没有变化。")
+    lines.append("- 如果出现头晕、胸闷、胸痛、明显乏力等不舒服，请及时去医院，不要硬扛。")
+    lines.append("- 每年按时做一次体检，把报告留好，方便和往年对比。")
+    return "\n".join(lines) + "\n"
+
+
+def render_template_reports(
+    rows: List[Dict[str, Any]],
+    analysis_result: AnalysisResult,
+    audience: str = "both",
+) -> Dict[str, str]:
+    """
+    生成两版模板报告（返回结构与 generate_reports 相同的两个字段）
+    audience: "both" / "child" / "elder"（未请求的版本返回空字符串）
+    """
+    return {
+        "report_child": render_child_report(rows, analysis_result) if audience in ("both", "child") else "",
+        "report_elder": render_elder_report(rows, analysis_result) if audience in ("both", "elder") else "",
+    }
@@ -1,10 +1,27 @@
-﻿import json
+﻿import argparse
+import contextlib
+import hashlib
+import io
+import json
+import logging
 import os
+import shutil
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
 from pathlib import Path
-from pprint import pprint
+from pprint import pformat
+
+# 直接运行时 __name__ 是 "__main__"，固定用 "main"，级别由 configure_logging 统一设置
+logger = logging.getLogger("main")
 
 USE_MOCK_DATA = True
 
+# 可穿戴设备导出文件（CSV/JSONL），非空时按年聚合后并入体检数据
+WEARABLE_FILES: list[str] = []
+
 
 def get_data():
     if USE_MOCK_DATA:
@@ -17,106 +34,153 @@ def get_data():
         )
     else:
         from ocr.extractor import ocr_extract
+        from ocr.rows import ocr_to_rows
 
         image_path = r""
-        return ocr_extract(image_path)
+        return ocr_to_rows(ocr_extract(image_path))
+
+
+def get_wearable_aggregates(paths: list[str]):
+    from data.wearable_ingest import aggregate_wearable_files
+
+    agg = aggregate_wearable_files(paths)
+    s = agg["stats"]
+    print(
+        f"wearable: {s['files']} files, {s['rows']} rows ({s['accepted']} accepted) "
+        f"in {s['elapsed_sec']}s, {s['rows_per_sec']} rows/s"
+    )
+    return agg
 
 
 def step1_get_data():
-    return get_data()
+    data = get_data()
+    if WEARABLE_FILES:
+        from data.wearable_ingest import merge_into_rows
 
+        data = merge_into_rows(data, get_wearable_aggregates(WEARABLE_FILES))
+    return data
 
-def step2_analyze(data, output_dir: str):
+
+def step2_analyze(data, output_dir: str, profile=None):
     from analysis.stats import run_analysis
 
-    return run_analysis(data, output_dir=output_dir)
+    return run_analysis(data, output_dir=output_dir, profile=profile)
 
 
 def step3_llm_report(data, analysis_result):
     from llm.explain import generate_reports
+    from llm.template_report import render_template_reports
 
     api_key = os.getenv("DEEPSEEK_API_KEY")
     base_url = os.getenv("DEEPSEEK_BASE_URL")
     model = os.getenv("DEEPSEEK_MODEL")  
 
     if not api_key:
-        print("\n[跳过步骤四] 未检测到环境变量 DEEPSEEK_API_KEY")
-        return None
-
-    return generate_reports(
-        rows=data,
-        analysis_result=analysis_result,
-        api_key=api_key,
-        base_url=base_url,
-        model=model,
-    )
+        print("\n[步骤三] 未检测到环境变量 DEEPSEEK_API_KEY，使用本地模板报告")
+        return render_template_reports(data, analysis_result)
+
+    try:
+        return generate_reports(
+            rows=data,
+            analysis_result=analysis_result,
+            api_key=api_key,
+            base_url=base_url,
+            model=model,
+        )
+    except Exception as e:
+        # 大模型超时 / 失败：退回模板报告，流程照常往下走
+        print(f"\n[步骤三] 大模型调用失败（{type(e).__name__}: {e}），使用本地模板报告")
+        return render_template_reports(data, analysis_result)
 
 
-def step4_save_reports(data, analysis_result, reports, output_dir: str):
+def _link_or_copy(src: Path, dst: Path) -> None:
+    # 硬链接：报告目录里的 report.pdf 和 PDF 缓存共用同一份数据；不支持硬链接时退回复制
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+
+
+def step4_save_reports(data, analysis_result, reports, output_dir: str, pdf_cache_dir=None):
+    """pdf_cache_dir：PDF 缓存目录，默认 <output_dir>/pdf_cache；批量模式传入所有人共用的缓存目录"""
     out_dir = Path(output_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
-    analysis_payload = {k: v for k, v in analysis_result.items() if k != "dataframe"}
+    from analysis.models import dumps
+
     payload = {
         "data": data,
-        "analysis": analysis_payload,
+        "analysis": analysis_result,
         "report_child": reports["report_child"],
         "report_elder": reports["report_elder"],
     }
-    (out_dir / "report.json").write_text(
-        json.dumps(payload, ensure_ascii=False, indent=2), encoding="utf-8"
-    )
+    (out_dir / "report.json").write_bytes(dumps(payload, indent=True))
     (out_dir / "report_child.md").write_text(reports["report_child"], encoding="utf-8")
     (out_dir / "report_elder.md").write_text(reports["report_elder"], encoding="utf-8")
+
+    from export.pdf import export_report_pdf
+
+    pdf_path = export_report_pdf(reports, analysis_result.figure_paths, pdf_cache_dir or out_dir / "pdf_cache")
+    _link_or_copy(pdf_path, out_dir / "report.pdf")
     print(
         "\nSaved:",
         out_dir / "report.json",
         out_dir / "report_child.md",
         out_dir / "report_elder.md",
+        out_dir / "report.pdf",
     )
 
 
 def step5_print_outputs(analysis_result):
     print("\n=== WARNINGS ===")
-    for w in analysis_result["warnings"]:
-        print("-", w)
+    for w in analysis_result.warnings:
+        print("-", w.text)
 
     print("\n=== FIGURES SAVED ===")
-    for k, p in analysis_result["figures"].items():
-        print(k, "->", p)
+    for f in analysis_result.figures:
+        print(f.key, "->", f.path)
+
+
+def run_pipeline(profile_mode=None):
+    """profile_mode: None / "cprofile" / "sample"，剖析结果写到 outputs/profile.*（见 diagnostics/profiling.py）"""
+    from diagnostics.profiling import profile_block
+
+    output_dir = os.path.join(os.path.dirname(__file__), "outputs")
+    current = {"step": None}
+
+    with profile_block(profile_mode, output_dir, stage=lambda: current["step"]) as session:
+        _run_steps(output_dir, current)
+    if session is not None:
+        print("\nProfile:", session.files)
 
 
-def run_pipeline():
+def _run_steps(output_dir, current):
     total_steps = 5
     current_step = 0
 
     def _progress(message: str) -> None:
         nonlocal current_step
         current_step += 1
+        current["step"] = message.split(" ", 1)[0]
         bar_len = 24
         filled = int(bar_len * current_step / total_steps)
         bar = "#" * filled + "-" * (bar_len - filled)
         print(f"[{bar}] {current_step}/{total_steps} {message}")
 
-    output_dir = os.path.join(os.path.dirname(__file__), "outputs")
-
     _progress("step1 get data")
     data = step1_get_data()
-    print("data =")
-    pprint(data, width=120, sort_dicts=False)
+    # 完整数据 / 报告正文只在调试时输出（HA_LOG_LEVEL / --log-level），报告本身已写入 report_*.md
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("data =\n%s", pformat(data, width=120, sort_dicts=False))
 
     _progress("step2 analyze + charts")
     result = step2_analyze(data, output_dir)
 
     _progress("step3 llm report")
     reports = step3_llm_report(data, result)
-    if reports is None:
-        return
-
-    print("\n=== REPORT (CHILD) ===\n")
-    print(reports["report_child"])
 
-    print("\n=== REPORT (ELDER) ===\n")
-    print(reports["report_elder"])
+    logger.info("report (child):\n%s", reports["report_child"])
+    logger.info("report (elder):\n%s", reports["report_elder"])
 
     _progress("step4 save reports")
     step4_save_reports(data, result, reports, output_dir)
@@ -125,5 +189,260 @@ def run_pipeline():
     step5_print_outputs(result)
 
 
+# ---------------- 批量模式 ----------------
+# python main.py batch <目录 | manifest.jsonl> --out outputs/batch --workers 4
+# - 目录：每个 .json（该人的年度数据 list）/ 图片（OCR）算一个人，人员 id = 文件名
+# - manifest.jsonl：每行一个人，{"id": ..., "rows": [...]} / {"id": ..., "image": ...}
+#   / {"id": ..., "mock": {"years": 5, "seed": 1}}，可选 "wearable": [导出文件...]
+#   可选 "sex" / "age" / "birth_year"：附带人群百分位（需先构建 analysis/population 索引）
+# - 输出按人分片：<out>/<id 哈希前两位>/<id>-<id 哈希前 8 位>/，完成一个人就往 checkpoint.jsonl 追加一行，
+#   中断后重跑同一命令会跳过已成功的人
+# - PDF 缓存所有人共用：<out>/pdf_cache/，各人目录里的 report.pdf 是它的硬链接
+# - 任务按窗口提交（进程数 x 2）；某个子进程崩溃（例如被 OOM kill）时换一个新进程池继续跑，
+#   当时在跑的人逐个单独重跑：单独跑仍然崩溃的那个人记为失败，其余人不受牵连
+
+IMAGE_SUFFIXES = {".png", ".jpg", ".jpeg", ".bmp", ".webp"}
+CHECKPOINT_NAME = "checkpoint.jsonl"
+PDF_CACHE_NAME = "pdf_cache"
+
+
+def load_batch_items(source):
+    src = Path(source)
+    items = []
+    if src.is_dir():
+        for p in sorted(src.iterdir()):
+            suffix = p.suffix.lower()
+            if suffix == ".json":
+                items.append({"id": p.stem, "rows_path": str(p)})
+            elif suffix in IMAGE_SUFFIXES:
+                items.append({"id": p.stem, "image": str(p)})
+    else:
+        with open(src, "r", encoding="utf-8") as f:
+            for line_no, line in enumerate(f, 1):
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                item.setdefault("id", f"item{line_no:06d}")
+                for key in ("image", "rows_path"):
+                    # manifest 里的相对路径按 manifest 所在目录解析
+                    if key in item and not os.path.isabs(item[key]):
+                        item[key] = str(src.parent / item[key])
+                items.append(item)
+
+    counts = Counter(str(it["id"]) for it in items)
+    dup = sorted(i for i, n in counts.items() if n > 1)
+    if dup:
+        raise ValueError(f"duplicate person ids in batch input: {dup[:5]}")
+    return items
+
+
+def person_output_dir(out_root, person_id):
+    # 两级目录分片，避免单个目录下上万个子目录
+    # 目录名 = 清洗后的 id + 原始 id 的短哈希：清洗后相同（"a b" / "a_b"）或只差大小写的 id 不会落到同一目录
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in str(person_id))
+    digest = hashlib.sha1(str(person_id).encode("utf-8")).hexdigest()
+    return Path(out_root) / digest[:2] / f"{safe}-{digest[:8]}"
+
+
+def load_checkpoint(out_root):
+    """读取已完成的人员 id（只认 status=ok；崩溃时写了半行的记录直接忽略）"""
+    done = set()
+    path = Path(out_root) / CHECKPOINT_NAME
+    if not path.exists():
+        return done
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+            except ValueError:
+                continue
+            if rec.get("status") == "ok":
+                done.add(str(rec["id"]))
+    return done
+
+
+def batch_get_data(item):
+    if "rows" in item:
+        data = item["rows"]
+    elif "rows_path" in item:
+        with open(item["rows_path"], "r", encoding="utf-8") as f:
+            data = json.load(f)
+    elif "image" in item:
+        from ocr.extractor import ocr_extract
+        from ocr.rows import ocr_to_rows
+
+        data = ocr_to_rows(ocr_extract(item["image"]), item.get("year"))
+    else:
+        from data.mock_generator import generate_mock_health_data
+
+        data = generate_mock_health_data(**item.get("mock", {}))
+
+    if item.get("wearable"):
+        from data.wearable_ingest import aggregate_wearable_files, merge_into_rows
+
+        data = merge_into_rows(data, aggregate_wearable_files(item["wearable"], max_workers=1))
+    return data
+
+
+def run_batch_item(item, out_root, use_llm=True, profile_mode=None):
+    """
+    在子进程里跑一个人的 step1~step4，返回一条 checkpoint 记录
+    各步骤的 print 输出收进缓冲区，避免多进程刷屏
+    profile_mode 非空时剖析这个人，结果写在该人的输出目录（profile.*）
+    """
+    from diagnostics.profiling import profile_block
+
+    person_id = str(item["id"])
+    out_dir = person_output_dir(out_root, person_id)
+    started = time.perf_counter()
+    record = {"id": person_id, "output_dir": str(out_dir)}
+
+    try:
+        with contextlib.redirect_stdout(io.StringIO()), profile_block(profile_mode, out_dir):
+            data = batch_get_data(item)
+            profile = {k: item[k] for k in ("sex", "age", "birth_year") if item.get(k) is not None}
+            result = step2_analyze(data, str(out_dir), profile=profile or None)
+            if use_llm:
+                reports = step3_llm_report(data, result)
+            else:
+                from llm.template_report import render_template_reports
+
+                reports = render_template_reports(data, result)
+            step4_save_reports(data, result, reports, str(out_dir), Path(out_root) / PDF_CACHE_NAME)
+        record.update(status="ok", warnings=len(result.warnings))
+    except Exception as e:
+        record.update(status="failed", error=f"{type(e).__name__}: {e}")
+
+    record["elapsed_sec"] = round(time.perf_counter() - started, 3)
+    return record
+
+
+def _format_eta(seconds):
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def run_batch(source, out_root, workers=None, use_llm=True, profile_every=0):
+    out_root = Path(out_root)
+    out_root.mkdir(parents=True, exist_ok=True)
+
+    items = load_batch_items(source)
+    done = load_checkpoint(out_root)
+    todo = [it for it in items if str(it["id"]) not in done]
+    print(f"batch: {len(items)} persons, {len(done)} already done, {len(todo)} to run")
+    if not todo:
+        return
+
+    ckpt_path = out_root / CHECKPOINT_NAME
+    if ckpt_path.exists() and ckpt_path.stat().st_size:
+        with open(ckpt_path, "rb") as f:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b"\n":
+                # 上次崩溃留下半行：补一个换行，别让新记录和它粘在一起
+                with open(ckpt_path, "a", encoding="utf-8") as fa:
+                    fa.write("\n")
+
+    workers = workers or os.cpu_count() or 1
+    window = workers * 2  # 在途任务上限：不一次性把所有人都塞进进程池
+    queue = deque(enumerate(todo))
+    suspects = deque()  # 进程池崩溃时在跑的人：逐个单独重跑，找出真正导致崩溃的那个
+    inflight = {}
+
+    ok = failed = 0
+    started = time.perf_counter()
+    pool = ProcessPoolExecutor(max_workers=workers)
+    # 只有父进程写 checkpoint：每完成一人追加一行并 fsync，崩溃最多丢正在跑的那几个
+    try:
+        with open(ckpt_path, "a", encoding="utf-8") as ckpt:
+            while queue or suspects or inflight:
+                if suspects:
+                    # 嫌疑人单独跑（在途任务清空后才提交下一个），崩溃就能确定是谁
+                    pending = [suspects.popleft()] if not inflight else []
+                else:
+                    pending = [queue.popleft() for _ in range(min(len(queue), window - len(inflight)))]
+                for i, it in pending:
+                    # profile_every=N：每 N 个人剖析 1 个，看批量里典型的一个人时间花在哪
+                    mode = "cprofile" if profile_every and i % profile_every == 0 else None
+                    inflight[pool.submit(run_batch_item, it, str(out_root), use_llm, mode)] = (i, it)
+
+                completed, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                records = []
+                crashed = []
+                for fut in completed:
+                    i, it = inflight.pop(fut)
+                    try:
+                        records.append(fut.result())
+                    except BrokenProcessPool:
+                        crashed.append((i, it))
+                    except Exception as e:  # 提交 / 序列化失败等：只影响这一个人
+                        records.append({"id": str(it["id"]), "status": "failed",
+                                        "error": f"{type(e).__name__}: {e}"})
+
+                if crashed:
+                    # 进程池坏了之后，其余在途任务也都会以 BrokenProcessPool 结束，一起算作“崩溃时在跑”
+                    crashed += inflight.values()
+                    inflight.clear()
+                    pool.shutdown(wait=False, cancel_futures=True)
+                    pool = ProcessPoolExecutor(max_workers=workers)
+                    if len(crashed) == 1:
+                        i, it = crashed[0]
+                        records.append({
+                            "id": str(it["id"]),
+                            "output_dir": str(person_output_dir(out_root, it["id"])),
+                            "status": "failed",
+                            "error": "worker process died while running this person alone (killed / out of memory?)",
+                        })
+                    else:
+                        suspects.extend(sorted(crashed, key=lambda x: x[0]))
+                    print(f"\n[batch] worker process died, restarted the pool ({len(crashed)} persons affected)")
+
+                for record in records:
+                    ckpt.write(json.dumps(record, ensure_ascii=False) + "\n")
+                    ckpt.flush()
+                    os.fsync(ckpt.fileno())
+
+                    if record["status"] == "ok":
+                        ok += 1
+                    else:
+                        failed += 1
+                        print(f"\n[failed] {record['id']}: {record['error']}")
+
+                    # 聚合吞吐量 + ETA（原地刷新，替代单人模式的进度条）
+                    finished = ok + failed
+                    elapsed = time.perf_counter() - started
+                    rate = finished / elapsed if elapsed > 0 else 0.0
+                    eta = (len(todo) - finished) / rate if rate > 0 else 0.0
+                    sys.stdout.write(
+                        f"\r[{finished}/{len(todo)}] ok={ok} failed={failed} "
+                        f"{rate:.2f} persons/s  elapsed {_format_eta(elapsed)}  ETA {_format_eta(eta)}"
+                    )
+                    sys.stdout.flush()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+    print(f"\nbatch done: ok={ok} failed={failed}, checkpoint -> {ckpt_path}")
+
+
 if __name__ == "__main__":
-    run_pipeline()
+    from diagnostics.logs import configure_logging
+
+    parser = argparse.ArgumentParser(description="Health Actuary 本地运行入口")
+    parser.add_argument("--profile", choices=["cprofile", "sample"], default=None,
+                        help="剖析单人流程，结果写到 outputs/profile.*")
+    parser.add_argument("--log-level", default=None, help="覆盖 HA_LOG_LEVEL（DEBUG/INFO/WARNING/OFF）")
+    sub = parser.add_subparsers(dest="command")
+    batch = sub.add_parser("batch", help="批量处理目录或 manifest.jsonl（多进程，可断点续跑）")
+    batch.add_argument("source", help="输入目录，或 manifest.jsonl")
+    batch.add_argument("--out", default=os.path.join(os.path.dirname(os.path.abspath(__file__)), "outputs", "batch"))
+    batch.add_argument("--workers", type=int, default=None, help="进程数，默认 CPU 核数")
+    batch.add_argument("--no-llm", action="store_true", help="不调用大模型，直接用本地模板报告")
+    batch.add_argument("--profile-every", type=int, default=0, help="每 N 个人剖析 1 个（0 = 不剖析）")
+    args = parser.parse_args()
+    configure_logging(args.log_level)
+
+    if args.command == "batch":
+        run_batch(args.source, args.out, workers=args.workers, use_llm=not args.no_llm,
+                  profile_every=args.profile_every)
+    else:
+        run_pipeline(profile_mode=args.profile)
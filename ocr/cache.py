@@ -0,0 +1,222 @@
+# ocr/cache.py
+# OCR 结果缓存：同一张报告图重复上传（重试、多个家人、换受众重跑）时跳过 PaddleOCR 推理
+# - 精确命中：图片字节的 sha256（+ 前处理档位）
+# - 近似命中（可选，默认关闭）：dHash 感知哈希，汉明距离不超过阈值即视为同一张图（转码/压缩后的副本）
+#   注意：近似命中会把“看起来一样”的图当成同一份结果，阈值要保守
+# - 本地磁盘持久化，按总大小做 LRU 淘汰；提供命中率指标
+# - 多进程（uvicorn --workers）共用同一目录：精确命中在内存索引没有时直接查文件，
+#   淘汰按目录里的实际文件计算总大小，上限对所有进程一起生效
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from storage.files import atomic_write_bytes
+
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+DEFAULT_CACHE_DIR = PROJECT_ROOT / "outputs" / "ocr_cache"
+
+
+def content_hash(image_bytes: bytes, preset: str) -> str:
+    h = hashlib.sha256(image_bytes)
+    h.update(b"\0" + preset.encode("utf-8"))
+    return h.hexdigest()
+
+
+def perceptual_hash(image_bytes: bytes) -> int:
+    """
+    dHash（256 位）：缩到 17x16 灰度，比较相邻像素明暗。对重新编码 / 轻微缩放不敏感。
+    用 256 位而不是常见的 64 位：同一医院模板的不同报告版式几乎一样，位数太少容易误判成同一张
+    """
+    from PIL import Image
+
+    image = Image.open(io.BytesIO(image_bytes))
+    image.draft("L", (128, 128))  # JPEG 直接低分辨率解码
+    small = image.convert("L").resize((17, 16), Image.BILINEAR)
+    px = small.tobytes()  # L 模式每像素一个字节
+    bits = 0
+    for row in range(16):
+        for col in range(16):
+            left = px[row * 17 + col]
+            right = px[row * 17 + col + 1]
+            bits = (bits << 1) | (1 if left > right else 0)
+    return bits
+
+
+class OCRCache:
+    def __init__(
+        self,
+        cache_dir: str | Path = DEFAULT_CACHE_DIR,
+        max_bytes: int = 256 * 1024 * 1024,
+        phash_max_distance: Optional[int] = None,
+    ):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.phash_max_distance = phash_max_distance
+        self._lock = threading.Lock()
+        # key -> (phash, preset)；首次使用时从磁盘重建，之后只加入本进程见过的条目
+        # （近似命中只在这里面找；精确命中和淘汰都以磁盘为准）
+        self._index: Optional[Dict[str, Dict[str, Any]]] = None
+        self._stats = {"hits_exact": 0, "hits_phash": 0, "misses": 0, "puts": 0, "evictions": 0}
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    def _load_index(self) -> Dict[str, Dict[str, Any]]:
+        if self._index is None:
+            index: Dict[str, Dict[str, Any]] = {}
+            if self.cache_dir.is_dir():
+                for p in self.cache_dir.glob("*.json"):
+                    try:
+                        entry = json.loads(p.read_text(encoding="utf-8"))
+                        index[p.stem] = {"phash": entry.get("phash"), "preset": entry.get("preset")}
+                    except (OSError, ValueError):
+                        continue
+            self._index = index
+        return self._index
+
+    def _read(self, key: str) -> Optional[Dict[str, Any]]:
+        """读整条缓存记录（preset / phash / result）；文件不存在或损坏返回 None。"""
+        path = self._path(key)
+        try:
+            entry = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, ValueError):
+            return None
+        # 命中即更新 mtime，淘汰时按 mtime 做 LRU
+        try:
+            os.utime(path, None)
+        except OSError:
+            pass
+        return entry if isinstance(entry, dict) and entry.get("result") is not None else None
+
+    def get(self, image_bytes: bytes, preset: str) -> Optional[Dict[str, Any]]:
+        key = content_hash(image_bytes, preset)
+        with self._lock:
+            index = self._load_index()
+            # 内存索引里没有也要查文件：可能是其他 worker 进程写入的
+            entry = self._read(key)
+            if entry is not None:
+                if key not in index:
+                    index[key] = {"phash": entry.get("phash"), "preset": entry.get("preset")}
+                self._stats["hits_exact"] += 1
+                return entry["result"]
+            index.pop(key, None)
+            has_candidates = any(m["preset"] == preset and m["phash"] is not None for m in index.values())
+
+        if self.phash_max_distance is not None and has_candidates:
+            # 解码 + 缩图放在锁外，避免阻塞其他请求
+            try:
+                ph = perceptual_hash(image_bytes)
+            except Exception:
+                ph = None
+            if ph is not None:
+                with self._lock:
+                    best_key, best_dist = None, self.phash_max_distance + 1
+                    for k, meta in self._load_index().items():
+                        if meta["preset"] != preset or meta["phash"] is None:
+                            continue
+                        dist = (ph ^ meta["phash"]).bit_count()
+                        if dist < best_dist:
+                            best_key, best_dist = k, dist
+                    if best_key is not None:
+                        entry = self._read(best_key)
+                        if entry is not None:
+                            self._stats["hits_phash"] += 1
+                            return entry["result"]
+                        self._index.pop(best_key, None)  # 已被其他进程淘汰
+
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def put(self, image_bytes: bytes, preset: str, result: Dict[str, Any]) -> None:
+        key = content_hash(image_bytes, preset)
+        try:
+            ph = perceptual_hash(image_bytes) if self.phash_max_distance is not None else None
+        except Exception:
+            ph = None
+        data = json.dumps(
+            {"preset": preset, "phash": ph, "created": time.time(), "result": result},
+            ensure_ascii=False,
+        ).encode("utf-8")
+
+        with self._lock:
+            index = self._load_index()
+            atomic_write_bytes(self._path(key), data)
+            index[key] = {"phash": ph, "preset": preset}
+            self._stats["puts"] += 1
+            self._evict(index)
+
+    def _disk_entries(self) -> List[Tuple[float, int, str]]:
+        """目录里所有缓存文件 (mtime, size, key)，包括其他进程写入的。"""
+        out: List[Tuple[float, int, str]] = []
+        if not self.cache_dir.is_dir():
+            return out
+        for p in self.cache_dir.glob("*.json"):
+            try:
+                st = p.stat()
+            except OSError:  # 其他进程刚删掉
+                continue
+            out.append((st.st_mtime, st.st_size, p.stem))
+        return out
+
+    def _evict(self, index: Dict[str, Dict[str, Any]]) -> None:
+        # 按磁盘上的实际文件算总大小：只算本进程索引的话，多个 worker 合起来会超出上限
+        # 每次 put 列一次目录，相对 OCR 推理本身的耗时可以忽略
+        entries = self._disk_entries()
+        total = sum(size for _, size, _ in entries)
+        if total <= self.max_bytes:
+            return
+        entries.sort()
+        for _, size, k in entries:
+            if total <= self.max_bytes:
+                break
+            total -= size
+            index.pop(k, None)
+            try:
+                self._path(k).unlink()
+            except OSError:  # 其他进程已经删掉
+                continue
+            self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            entries = self._disk_entries()
+            s = dict(self._stats)
+            lookups = s["hits_exact"] + s["hits_phash"] + s["misses"]
+            s["lookups"] = lookups
+            s["hit_rate"] = None if lookups == 0 else round((s["hits_exact"] + s["hits_phash"]) / lookups, 4)
+            s["entries"] = len(entries)
+            s["bytes"] = sum(size for _, size, _ in entries)
+            s["max_bytes"] = self.max_bytes
+            return s
+
+
+_cache: Optional[OCRCache] = None
+_cache_lock = threading.Lock()
+
+
+def get_ocr_cache() -> OCRCache:
+    """
+    进程内单例，参数来自环境变量：
+      - HA_OCR_CACHE_DIR：缓存目录（默认 outputs/ocr_cache）
+      - HA_OCR_CACHE_MAX_MB：磁盘占用上限
+      - HA_OCR_CACHE_PHASH_DISTANCE：近似命中的汉明距离阈值（256 位中，建议 ≤8），<0 关闭（默认）
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                distance = int(os.getenv("HA_OCR_CACHE_PHASH_DISTANCE", "-1"))
+                _cache = OCRCache(
+                    cache_dir=os.getenv("HA_OCR_CACHE_DIR", str(DEFAULT_CACHE_DIR)),
+                    max_bytes=int(float(os.getenv("HA_OCR_CACHE_MAX_MB", "256")) * 1024 * 1024),
+                    phash_max_distance=None if distance < 0 else distance,
+                )
+    return _cache
@@ -1,22 +1,61 @@
 from paddleocr import PaddleOCR
 from PIL import Image
 import numpy as np
-import re
+import io
 import json
+import logging
+import os
+import re
+
+from ocr.cache import get_ocr_cache
+from ocr.preprocess import DEFAULT_PRESET, get_preset, preprocess_image
+
+# 调试输出走 DEBUG（HA_LOG_LEVEL=DEBUG 时才打印原始结果和每一行识别文本）
+logger = logging.getLogger(__name__)
 
 
 #步骤一
 # OCR图像识别与数据结构化。
 # 将用户上传的数据转换为结构化的JSON格式,并返回结构化数据。
 
-# 初始化PaddleOCR，指定中文语言
-ocr = PaddleOCR(use_textline_orientation=True, lang="ch")
+# 初始化PaddleOCR，指定中文语言（首次调用时再加载模型，import 本模块不再触发）
+_ocr = None
+
+
+def get_ocr():
+    global _ocr
+    if _ocr is None:
+        _ocr = PaddleOCR(use_textline_orientation=True, lang="ch")
+    return _ocr
+
+
 # 执行OCR识别并提取指定指标
-def ocr_extract(image_path):
-    image = Image.open(image_path).convert("RGB")
+# preset: 前处理档位（见 ocr/preprocess.py），默认取 HA_OCR_PRESET
+# use_cache: 同一张图（按内容哈希）已识别过则直接返回缓存结果，跳过推理（见 ocr/cache.py）
+def ocr_extract(image_path, preset=None, use_cache=True):
+    preset = preset or os.getenv("HA_OCR_PRESET", DEFAULT_PRESET)
+    with open(image_path, "rb") as f:
+        image_bytes = f.read()
+
+    cache = get_ocr_cache() if use_cache else None
+    if cache is not None:
+        cached = cache.get(image_bytes, preset)
+        if cached is not None:
+            return cached
+
+    image, _ = preprocess_image(Image.open(io.BytesIO(image_bytes)), **get_preset(preset))
     image_np = np.array(image)
-    result = ocr.predict(image_np)
-    print(f"Raw result: {result}")
+    result = get_ocr().predict(image_np)
+    extracted_data = extract_indicators(result)
+
+    if cache is not None:
+        cache.put(image_bytes, preset, extracted_data)
+    return extracted_data
+
+
+# 从 PaddleOCR 原始结果中提取指标（与推理分开，便于基准测试单独计时）
+def extract_indicators(result):
+    logger.debug("Raw result: %s", result)
 #根据图片给出的指标示例，提取指标和数值
     indicators = [
         "Haemoglobin",
@@ -38,18 +77,20 @@ def ocr_extract(image_path):
     extracted_data = {}
 # 检查OCR结果是否为空
     if not result:
-        print("No OCR result returned.")
+        logger.warning("No OCR result returned.")
         return {}
     if not result[0]:
-        print(f"No text blocks found. Raw result: {result}")
+        logger.warning("No text blocks found. Raw result: %s", result)
         return {}
 # 提取OCR识别的文本块
     texts = result[0].get("rec_texts", [])
     scores = result[0].get("rec_scores", [])
     recognized_lines = list(zip(texts, scores))
+    debug = logger.isEnabledFor(logging.DEBUG)
 # 遍历识别的文本块，尝试匹配指标和数值
     for idx, (text, conf) in enumerate(recognized_lines):
-        print(f"recognized: {text}, score: {conf}")
+        if debug:
+            logger.debug("recognized: %s, score: %s", text, conf)
 
         for indicator in indicators:
             if indicator in text:
@@ -65,10 +106,14 @@ def ocr_extract(image_path):
                     extracted_data[indicator] = value
                 break
 
-    print(f"Total recognized lines: {len(recognized_lines)}")
+    logger.info("Total recognized lines: %d, indicators: %d", len(recognized_lines), len(extracted_data))
     return extracted_data
 
 # 测试函数
-image_path = "D:/虚拟环境code/8e82006ac461468c9eca50b0f0c6bce0.png"
-data = ocr_extract(image_path)
-print(json.dumps(data, indent=4, ensure_ascii=False))
\ No newline at end of file
+if __name__ == "__main__":
+    from diagnostics.logs import configure_logging
+
+    configure_logging()
+    image_path = "D:/虚拟环境code/8e82006ac461468c9eca50b0f0c6bce0.png"
+    data = ocr_extract(image_path)
+    print(json.dumps(data, indent=4, ensure_ascii=False))
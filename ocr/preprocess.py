@@ -0,0 +1,186 @@
+# ocr/preprocess.py
+# OCR 前处理：限制分辨率 -> 灰度/对比度归一 -> 纠偏 -> 裁剪到表格区域
+# 手机拍的体检单经常 12MP 以上，PaddleOCR 耗时随像素数增长；先缩图再识别。
+# 各部署通过 HA_OCR_PRESET 选择速度/精度档位（fast / balanced / accurate / off），
+# 档位的取舍可以用 benchmarks/ocr_preprocess.py 在样例图片上实测。
+from __future__ import annotations
+
+import os
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+from PIL import Image, ImageOps
+
+PRESETS: Dict[str, Dict[str, Any]] = {
+    "off": {
+        "exif_transpose": False,
+        "max_long_edge": None,
+        "grayscale": False,
+        "autocontrast": False,
+        "deskew": False,
+        "crop_table": False,
+    },
+    "fast": {
+        "exif_transpose": True,
+        "max_long_edge": 1280,
+        "grayscale": True,
+        "autocontrast": True,
+        "deskew": False,
+        "crop_table": True,
+    },
+    "balanced": {
+        "exif_transpose": True,
+        "max_long_edge": 1920,
+        "grayscale": True,
+        "autocontrast": True,
+        "deskew": True,
+        "crop_table": True,
+    },
+    "accurate": {
+        "exif_transpose": True,
+        "max_long_edge": 2880,
+        "grayscale": False,
+        "autocontrast": True,
+        "deskew": True,
+        "crop_table": False,
+    },
+}
+
+# 默认不做前处理（"off" 连 EXIF 方向也不处理，图片原样交给 OCR）：未设置 HA_OCR_PRESET 的已有部署识别结果保持不变，
+# 需要提速的部署显式选择 fast / balanced（先用 benchmarks/ocr_preprocess.py 在自己的样例上确认准确率）
+DEFAULT_PRESET = "off"
+
+# 纠偏 / 裁剪都在小图上估计，再映射回原图
+_ANALYSIS_LONG_EDGE = 800
+_DESKEW_MAX_ANGLE = 5.0
+_DESKEW_STEP = 0.5
+
+
+def get_preset(name: Optional[str] = None) -> Dict[str, Any]:
+    name = name or os.getenv("HA_OCR_PRESET", DEFAULT_PRESET)
+    if name not in PRESETS:
+        raise ValueError(f"unknown OCR preset: {name} (choose from {', '.join(PRESETS)})")
+    return dict(PRESETS[name])
+
+
+def _limit_long_edge(image: Image.Image, max_long_edge: Optional[int]) -> Image.Image:
+    if not max_long_edge:
+        return image
+    w, h = image.size
+    scale = max_long_edge / max(w, h)
+    if scale >= 1:
+        return image
+    # reducing_gap：先用整数倍 reduce 快速缩小，再做 LANCZOS，效果接近但快很多
+    return image.resize(
+        (max(1, round(w * scale)), max(1, round(h * scale))), Image.LANCZOS, reducing_gap=3.0
+    )
+
+
+def _ink_mask(gray: Image.Image) -> Tuple[np.ndarray, float]:
+    """在小图上二值化（深色=文字/表格线），返回 mask 与缩放比例。"""
+    w, h = gray.size
+    scale = min(1.0, _ANALYSIS_LONG_EDGE / max(w, h))
+    small = gray if scale >= 1 else gray.resize((max(1, round(w * scale)), max(1, round(h * scale))))
+    arr = np.asarray(small, dtype=np.uint8)
+    # 简单全局阈值：比均值暗一截的算墨迹
+    return arr < (arr.mean() * 0.75), scale
+
+
+def _estimate_skew(mask: np.ndarray) -> float:
+    """
+    投影法估计倾斜角：文字行水平时，行投影的方差最大
+    只在小图上搜索 ±5°，代价很小
+    """
+    if mask.sum() == 0:
+        return 0.0
+    img = Image.fromarray((mask * 255).astype(np.uint8))
+    best_angle, best_score = 0.0, -1.0
+    angle = -_DESKEW_MAX_ANGLE
+    while angle <= _DESKEW_MAX_ANGLE + 1e-9:
+        rotated = np.asarray(img.rotate(angle, resample=Image.NEAREST, fillcolor=0), dtype=np.float32)
+        score = float(rotated.sum(axis=1).var())
+        if score > best_score:
+            best_angle, best_score = angle, score
+        angle += _DESKEW_STEP
+    return best_angle
+
+
+def _table_bbox(mask: np.ndarray, scale: float, size: Tuple[int, int]) -> Optional[Tuple[int, int, int, int]]:
+    """
+    表格区域：墨迹密度超过阈值的行/列所围成的外接框（加少量边距）
+    框几乎占满整图时返回 None（不裁）
+    """
+    if mask.sum() == 0:
+        return None
+    rows = np.where(mask.mean(axis=1) > 0.01)[0]
+    cols = np.where(mask.mean(axis=0) > 0.01)[0]
+    if rows.size == 0 or cols.size == 0:
+        return None
+
+    h_small, w_small = mask.shape
+    pad_y = max(2, int(h_small * 0.02))
+    pad_x = max(2, int(w_small * 0.02))
+    top = max(0, rows[0] - pad_y)
+    bottom = min(h_small, rows[-1] + 1 + pad_y)
+    left = max(0, cols[0] - pad_x)
+    right = min(w_small, cols[-1] + 1 + pad_x)
+
+    if (bottom - top) * (right - left) > 0.9 * h_small * w_small:
+        return None
+
+    w, h = size
+    return (
+        max(0, int(left / scale)),
+        max(0, int(top / scale)),
+        min(w, int(round(right / scale))),
+        min(h, int(round(bottom / scale))),
+    )
+
+
+def preprocess_image(
+    image: Image.Image,
+    max_long_edge: Optional[int] = 1920,
+    grayscale: bool = True,
+    autocontrast: bool = True,
+    deskew: bool = True,
+    crop_table: bool = True,
+    exif_transpose: bool = True,
+) -> Tuple[Image.Image, Dict[str, Any]]:
+    """
+    返回 (处理后的 RGB 图, 处理信息)
+    处理顺序：按 EXIF 转正 -> 先缩图（后面每一步都在小图上做，更快）-> 灰度/对比度 -> 纠偏 -> 裁剪
+    """
+    info: Dict[str, Any] = {"original_size": image.size}
+    if max_long_edge and image.format == "JPEG":
+        # JPEG 可以在解码阶段直接按 1/2、1/4、1/8 缩小，12MP 照片不必全尺寸解码
+        image.draft("RGB", (max_long_edge, max_long_edge))
+    if exif_transpose:
+        image = ImageOps.exif_transpose(image)  # 手机照片的方向信息
+    image = _limit_long_edge(image.convert("RGB"), max_long_edge)
+
+    work = image.convert("L") if grayscale else image
+    if autocontrast:
+        work = ImageOps.autocontrast(work, cutoff=1)
+
+    if deskew or crop_table:
+        gray = work if work.mode == "L" else work.convert("L")
+        mask, scale = _ink_mask(gray)
+
+        if deskew:
+            angle = _estimate_skew(mask)
+            info["deskew_angle"] = angle
+            if angle:
+                fill = 255 if work.mode == "L" else (255, 255, 255)
+                work = work.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=fill)
+                mask, scale = _ink_mask(work if work.mode == "L" else work.convert("L"))
+
+        if crop_table:
+            bbox = _table_bbox(mask, scale, work.size)
+            info["crop_box"] = bbox
+            if bbox is not None:
+                work = work.crop(bbox)
+
+    # PaddleOCR 需要 3 通道输入
+    out = work.convert("RGB") if work.mode != "RGB" else work
+    info["output_size"] = out.size
+    return out, info
@@ -0,0 +1,32 @@
+# ocr/rows.py
+# OCR 结果 -> run_analysis 的输入：ocr_extract 返回单次体检的键值对（多为字符串），
+# run_analysis 需要 list[{"year":..., ...}]；命令行（main.py）和 /analyze 共用这一个适配
+from __future__ import annotations
+
+import time
+from typing import Any, Dict, List, Optional
+
+
+def to_num(x: Any) -> Any:
+    """尽量把 OCR 识别出的字符串转成 float / int，转不了原样返回。"""
+    try:
+        if isinstance(x, str) and x.strip() == "":
+            return x
+        if isinstance(x, str) and "." in x:
+            return float(x)
+        if isinstance(x, str):
+            return int(float(x))
+        return x
+    except Exception:
+        return x
+
+
+def ocr_to_rows(extracted: Dict[str, Any], year: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    把 OCR 结果当作“当年一次体检”（year 为空时取今年）
+    以后识别出报告上的日期 / 支持多页多份报告时在这里扩展
+    """
+    item: Dict[str, Any] = {"year": int(year or time.localtime().tm_year)}
+    for k, v in extracted.items():
+        item[k] = to_num(v)
+    return [item]
@@ -0,0 +1,35 @@
+# ocr/stub.py
+# OCR 替身：不加载 PaddleOCR，按固定延迟返回一份示例识别结果（压测 / 无 GPU 环境用）
+# 由环境变量开启：HA_OCR_STUB=1，HA_OCR_STUB_LATENCY_MS=800
+from __future__ import annotations
+
+import os
+import time
+from typing import Dict
+
+STUB_RESULT = {
+    "Haemoglobin": "13.8",
+    "RBC": "4.62",
+    "PCV": "41.5",
+    "MCV": "89.8",
+    "MCH": "29.9",
+    "MCHC": "33.3",
+    "RDW": "13.1",
+    "Neutrophils": "58",
+    "Lymphocytes": "31",
+    "Monocytes": "7",
+    "Eosinophils": "3",
+    "Basophils": "1",
+    "N:LRatio": "1.87",
+    "WhiteCellCount": "6.4",
+}
+
+
+def stub_enabled() -> bool:
+    return os.getenv("HA_OCR_STUB", "").lower() in ("1", "true", "yes")
+
+
+def ocr_extract_stub(image_path: str) -> Dict[str, str]:
+    latency_ms = float(os.getenv("HA_OCR_STUB_LATENCY_MS", "800"))
+    time.sleep(latency_ms / 1000.0)
+    return dict(STUB_RESULT)
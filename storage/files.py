@@ -0,0 +1,29 @@
+# storage/files.py
+"""
+落盘小工具：原子写文件
+
+报告 PDF、OCR 缓存、检索索引、report.json 等都可能被多线程 / 多进程（uvicorn --workers、批量模式）
+同时写，或在写的同时被读取（静态文件下载、mmap 加载），统一先写临时文件再 os.replace
+"""
+from __future__ import annotations
+
+import os
+import threading
+from pathlib import Path
+
+
+def atomic_write_bytes(path: str | Path, data: bytes) -> Path:
+    """
+    先写同目录下的临时文件再原子替换：读者要么看到旧文件，要么看到完整的新文件，不会读到写了一半的内容
+    临时文件名带 pid + 线程 id，多个进程 / 线程同时写同一路径也不会互相覆盖临时文件
+    """
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        tmp.write_bytes(data)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    return path
@@ -0,0 +1,126 @@
+# storage/retention.py
+"""
+运行产物清理：每个 /analyze 请求都会写 outputs/requests/{request_id}/（趋势图、report.json），
+剖析过的请求还有 outputs/profiles/{request_id}/，上传的图片在 outputs/uploads/，PDF 在 outputs/pdf_cache/，不清理的话磁盘占用只增不减
+
+- HA_OUTPUT_TTL_HOURS：超过这么久没有更新的请求目录 / 上传文件 / PDF 删除（默认 168 = 7 天，0 = 不按时间清理）
+- HA_OUTPUT_MAX_REQUESTS：最多保留的请求目录数（requests/ 与 profiles/ 分别计数），超出时从最旧的开始删（默认 2000，0 = 不限）
+- HA_OUTPUT_SWEEP_MINUTES：API 进程内的清理周期（默认 30 分钟，0 = 只在启动时清理一次）
+OCR 缓存（ocr_cache）有自己的 LRU 上限，索引目录（guidance_index / population_index）不在清理范围内
+"""
+from __future__ import annotations
+
+import logging
+import os
+import shutil
+import threading
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_TTL_HOURS = 168.0
+DEFAULT_MAX_REQUESTS = 2000
+DEFAULT_SWEEP_MINUTES = 30.0
+
+# 每个请求一个子目录，按 TTL + 最大数量清理
+_REQUEST_DIRS = ("requests", "profiles")
+# 按 TTL 清理的平铺目录（里面是文件）
+_FILE_DIRS = ("uploads", "pdf_cache")
+
+
+def _mtimes(directory: Path, dirs: bool) -> List[Tuple[float, Path]]:
+    out: List[Tuple[float, Path]] = []
+    if not directory.is_dir():
+        return out
+    for p in directory.iterdir():
+        try:
+            if p.is_dir() == dirs:
+                out.append((p.stat().st_mtime, p))
+        except OSError:  # 其他进程刚删掉
+            continue
+    return out
+
+
+def sweep_outputs(
+    output_dir: str | Path,
+    max_age_sec: Optional[float] = None,
+    max_requests: Optional[int] = None,
+    now: Optional[float] = None,
+) -> Dict[str, int]:
+    """
+    清理一次，返回各类删除的数量
+    请求目录按修改时间判断（LLM 版报告重写 report.json 也会刷新目录时间）
+    多个 worker 同时清理是安全的：删除失败（已被别人删掉）直接跳过
+    """
+    output_dir = Path(output_dir)
+    now = time.time() if now is None else now
+    removed = {"requests": 0, "files": 0}
+
+    # 最新的在前：超出 max_requests 的部分 + 超过 TTL 的都删
+    for name in _REQUEST_DIRS:
+        entries = sorted(_mtimes(output_dir / name, dirs=True), reverse=True)
+        for i, (mtime, path) in enumerate(entries):
+            too_many = bool(max_requests) and i >= max_requests
+            too_old = bool(max_age_sec) and now - mtime > max_age_sec
+            if too_many or too_old:
+                shutil.rmtree(path, ignore_errors=True)
+                removed["requests"] += 1
+
+    if max_age_sec:
+        for name in _FILE_DIRS:
+            for mtime, path in _mtimes(output_dir / name, dirs=False):
+                if now - mtime > max_age_sec:
+                    try:
+                        path.unlink()
+                        removed["files"] += 1
+                    except OSError:
+                        continue
+    return removed
+
+
+def retention_from_env() -> Tuple[Optional[float], Optional[int]]:
+    ttl_hours = float(os.getenv("HA_OUTPUT_TTL_HOURS", str(DEFAULT_TTL_HOURS)))
+    max_requests = int(os.getenv("HA_OUTPUT_MAX_REQUESTS", str(DEFAULT_MAX_REQUESTS)))
+    return (ttl_hours * 3600 if ttl_hours > 0 else None), (max_requests if max_requests > 0 else None)
+
+
+_sweeper: Optional[threading.Thread] = None
+_sweeper_lock = threading.Lock()
+
+
+def start_output_sweeper(output_dir: str | Path) -> None:
+    """进程内只启动一次：立即清理一次，之后按 HA_OUTPUT_SWEEP_MINUTES 周期在后台线程里清理。"""
+    global _sweeper
+    with _sweeper_lock:
+        if _sweeper is not None:
+            return
+        max_age_sec, max_requests = retention_from_env()
+        interval = float(os.getenv("HA_OUTPUT_SWEEP_MINUTES", str(DEFAULT_SWEEP_MINUTES))) * 60
+
+        def _run() -> None:
+            while True:
+                try:
+                    removed = sweep_outputs(output_dir, max_age_sec, max_requests)
+                    if any(removed.values()):
+                        logger.info("output sweep removed %s", removed)
+                except Exception:  # 清理失败不能影响服务
+                    logger.exception("output sweep failed")
+                if interval <= 0:
+                    return
+                time.sleep(interval)
+
+        _sweeper = threading.Thread(target=_run, name="output-sweeper", daemon=True)
+        _sweeper.start()
+
+
+if __name__ == "__main__":
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description="清理 outputs/ 下过期的请求产物")
+    parser.add_argument("--output-dir", default=str(Path(__file__).resolve().parents[1] / "outputs"))
+    args = parser.parse_args()
+
+    print(json.dumps(sweep_outputs(args.output_dir, *retention_from_env())))
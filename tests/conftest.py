@@ -0,0 +1,8 @@
+# tests/conftest.py
+# 仓库里的模块都按顶层包导入（from analysis.xxx import ...），从任意目录跑 pytest 都把仓库根目录放进 sys.path
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[1]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
@@ -0,0 +1,65 @@
+# tests/test_batch.py
+import json
+
+import main
+
+
+def test_load_checkpoint_skips_failed_and_torn_lines(tmp_path):
+    (tmp_path / main.CHECKPOINT_NAME).write_text(
+        '{"id": "a", "status": "ok"}\n'
+        '{"id": "b", "status": "failed", "error": "x"}\n'
+        '{"id": "c", "status": "ok"}\n'
+        '{"id": "d", "sta',  # 崩溃时写了半行
+        encoding="utf-8",
+    )
+    assert main.load_checkpoint(tmp_path) == {"a", "c"}
+    assert main.load_checkpoint(tmp_path / "missing") == set()
+
+
+def test_person_output_dir_keeps_colliding_ids_apart(tmp_path):
+    a = main.person_output_dir(tmp_path, "a b")
+    b = main.person_output_dir(tmp_path, "a_b")
+    assert a != b
+    assert a.parent.parent == tmp_path
+
+
+def test_run_batch_resumes_after_torn_checkpoint(tmp_path):
+    manifest = tmp_path / "manifest.jsonl"
+    manifest.write_text(
+        "".join(json.dumps({"id": pid, "mock": {"years": 3, "seed": n}}) + "\n"
+                for n, pid in enumerate(["p1", "p2"])),
+        encoding="utf-8",
+    )
+    out = tmp_path / "out"
+    out.mkdir()
+    ckpt = out / main.CHECKPOINT_NAME
+    ckpt.write_text('{"id": "p1", "status": "ok"}\n{"id": "p2", "st', encoding="utf-8")
+
+    main.run_batch(manifest, out, workers=1, use_llm=False)
+
+    lines = ckpt.read_text(encoding="utf-8").splitlines()
+    records = [json.loads(line) for line in lines if line.endswith("}")]
+    assert [r["id"] for r in records] == ["p1", "p2"]  # p1 跳过，只跑了 p2
+    assert records[-1]["status"] == "ok"
+    assert main.load_checkpoint(out) == {"p1", "p2"}
+    person_dir = main.person_output_dir(out, "p2")
+    assert (person_dir / "report.json").is_file()
+    assert (person_dir / "report.pdf").is_file()
+    assert not main.person_output_dir(out, "p1").exists()
+
+
+def test_run_steps_keeps_data_and_reports_off_stdout(tmp_path, monkeypatch, capsys, caplog):
+    import logging
+
+    monkeypatch.delenv("DEEPSEEK_API_KEY", raising=False)
+    caplog.set_level(logging.WARNING, logger="main")
+    main._run_steps(str(tmp_path), {"step": None})
+    out = capsys.readouterr().out
+    assert "data =" not in out and "REPORT" not in out
+    assert not [r for r in caplog.records if r.name == "main"]
+    assert (tmp_path / "report_child.md").is_file()
+
+    caplog.set_level(logging.DEBUG, logger="main")
+    main._run_steps(str(tmp_path), {"step": None})
+    messages = [r.getMessage() for r in caplog.records if r.name == "main"]
+    assert messages[0].startswith("data =") and any(m.startswith("report (child)") for m in messages)
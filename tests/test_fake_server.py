@@ -0,0 +1,73 @@
+# tests/test_fake_server.py
+import json
+import random
+import urllib.error
+import urllib.request
+
+import pytest
+
+from llm.fake_server import CANNED_ELDER, FakeLLMConfig, parse_latency, serve_fake_llm
+
+
+@pytest.fixture
+def fake_llm():
+    servers = []
+
+    def start(**kwargs):
+        server = serve_fake_llm(port=0, config=FakeLLMConfig(latency="const:0", **kwargs), background=True)
+        servers.append(server)
+        return f"http://127.0.0.1:{server.server_address[1]}", server.config
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def _post(base, body):
+    req = urllib.request.Request(
+        base + "/v1/chat/completions",
+        data=json.dumps(body).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=5) as resp:
+            return resp.status, dict(resp.headers), resp.read()
+    except urllib.error.HTTPError as e:
+        return e.code, dict(e.headers), e.read()
+
+
+def test_parse_latency_specs():
+    rng = random.Random(0)
+    assert parse_latency("const:0.5")(rng) == 0.5
+    assert 0.2 <= parse_latency("uniform:0.2,0.4")(rng) <= 0.4
+    assert parse_latency("lognormal:-1,0.5")(rng) > 0
+    with pytest.raises(ValueError):
+        parse_latency("gamma:1")
+
+
+def test_completion_and_stats(fake_llm):
+    base, cfg = fake_llm()
+    status, _, body = _post(base, {"model": "m", "messages": [{"role": "user", "content": "给长辈 写报告"}]})
+    assert status == 200
+    assert json.loads(body)["choices"][0]["message"]["content"] == CANNED_ELDER
+    with urllib.request.urlopen(base + "/stats", timeout=5) as resp:
+        assert json.loads(resp.read())["ok"] == 1
+
+
+def test_throttling_sends_retry_after(fake_llm):
+    base, cfg = fake_llm(error_429=1.0, retry_after=3)
+    status, headers, _ = _post(base, {"messages": []})
+    assert status == 429 and headers["Retry-After"] == "3"
+    assert cfg.stats["429"] == 1 and cfg.stats["ok"] == 0
+
+
+def test_streaming_reassembles_canned_report(fake_llm):
+    base, _ = fake_llm(stream_chunks=5)
+    status, headers, body = _post(base, {"stream": True, "messages": [{"content": "给长辈"}]})
+    assert status == 200 and headers["Content-Type"] == "text/event-stream"
+    events = [line[len("data: "):] for line in body.decode("utf-8").split("\n\n") if line]
+    assert events[-1] == "[DONE]"
+    pieces = [json.loads(e)["choices"][0]["delta"]["content"] for e in events[:-1]]
+    assert len(pieces) == 5 and "".join(pieces) == CANNED_ELDER
@@ -0,0 +1,78 @@
+# tests/test_limiter.py
+import time
+
+import pytest
+
+from llm.limiter import LLMGuard, LLMRejectedError
+
+
+def _call(guard: LLMGuard, outcome: str) -> None:
+    with guard.slot(timeout=0.1) as s:
+        s["outcome"] = outcome
+
+
+def test_aimd_adjusts_limit_by_outcome():
+    guard = LLMGuard(max_concurrency=8)
+    _call(guard, "throttled")
+    assert guard.snapshot()["limit"] == 4
+    _call(guard, "overloaded")
+    assert guard.snapshot()["limit"] == 2
+    _call(guard, "client_error")  # 4xx 不调并发
+    assert guard.snapshot()["limit"] == 2
+    _call(guard, "success")
+    assert guard.snapshot()["limit"] == 2.5
+    for _ in range(10):
+        _call(guard, "throttled")
+    assert guard.snapshot()["limit"] == 1  # 不低于 min_concurrency
+
+
+def test_concurrent_throttling_halves_once_per_window():
+    guard = LLMGuard(max_concurrency=8)
+    slots = [guard.slot(timeout=0.1) for _ in range(8)]
+    states = [cm.__enter__() for cm in slots]  # 8 个请求同时在途
+    for cm, state in zip(slots, states):
+        state["outcome"] = "throttled"
+        cm.__exit__(None, None, None)
+    snap = guard.snapshot()
+    assert snap["limit"] == 4  # 一波 429 只减一次，而不是减到 min_concurrency
+    assert (snap["throttled"], snap["decrease_skipped"]) == (8, 7)
+
+    _call(guard, "throttled")  # 减半之后才发出的请求仍然 429：新的窗口，继续减
+    assert guard.snapshot()["limit"] == 2
+
+
+def test_breaker_ignores_throttling_and_client_errors():
+    guard = LLMGuard(breaker_failures=2)
+    for _ in range(5):
+        _call(guard, "throttled")
+        _call(guard, "client_error")
+    snap = guard.snapshot()
+    assert snap["breaker_state"] == "closed"
+    assert snap["consecutive_failures"] == 0
+
+
+def test_breaker_opens_then_recovers_through_probe():
+    guard = LLMGuard(breaker_failures=2, breaker_cooldown=0.05)
+    _call(guard, "failed")
+    _call(guard, "overloaded")
+    assert guard.snapshot()["breaker_state"] == "open"
+    with pytest.raises(LLMRejectedError) as exc:
+        guard.acquire(timeout=0.01)
+    assert exc.value.reason == "breaker_open"
+
+    time.sleep(0.06)
+    assert guard.acquire(timeout=0.1) is True  # 冷却结束：half-open 探测
+    guard.release("success", probe=True)
+    snap = guard.snapshot()
+    assert snap["breaker_state"] == "closed"
+    assert snap["breaker_trips"] == 1
+
+
+def test_failed_probe_reopens_breaker():
+    guard = LLMGuard(breaker_failures=1, breaker_cooldown=0.05)
+    _call(guard, "failed")
+    time.sleep(0.06)
+    probe = guard.acquire(timeout=0.1)
+    assert probe is True
+    guard.release("failed", probe=probe)
+    assert guard.snapshot()["breaker_state"] == "open"
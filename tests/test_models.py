@@ -0,0 +1,47 @@
+# tests/test_models.py
+import json
+
+import numpy as np
+import pytest
+
+from analysis import models
+from analysis.models import AnalysisResult, AnalysisWarning, FigureRef, MetricSummary, dumps, loads
+from analysis.stats import run_analysis
+from data.mock_generator import generate_mock_health_data
+
+
+def _result() -> AnalysisResult:
+    summary = {
+        "ldl": MetricSummary(
+            key="ldl", name="低密度脂蛋白", unit="mmol/L", latest=np.float64(3.9), zscore_latest=None,
+            trend="UP", yoy_delta=0.3, out_of_range=True, out_flag="HIGH", ref_low=None, ref_high=3.4,
+            monotonic_increase_last3=True,
+        )
+    }
+    return AnalysisResult(
+        summary=summary,
+        warnings=[AnalysisWarning(metric="ldl", kind="out_of_range", text="LDL 偏高")],
+        figures=[FigureRef(key="ldl", path="/tmp/ldl.png")],
+    )
+
+
+@pytest.mark.parametrize("fast", [True, False])
+def test_dumps_serializes_slotted_results(monkeypatch, fast):
+    if not fast:
+        monkeypatch.setattr(models, "orjson", None)  # 标准库 json 回退路径
+    elif models.orjson is None:
+        pytest.skip("orjson not installed")
+    data = loads(dumps({"analysis": _result()}, indent=True))
+    assert data["analysis"]["summary"]["ldl"]["latest"] == 3.9  # numpy 标量
+    assert data["analysis"]["warnings"][0]["text"] == "LDL 偏高"
+    assert data["analysis"]["figures"] == [{"key": "ldl", "path": "/tmp/ldl.png"}]
+
+
+def test_run_analysis_returns_typed_result_without_dataframe(tmp_path):
+    rows = generate_mock_health_data(years=5, seed=3)
+    result = run_analysis(rows, output_dir=str(tmp_path), make_figures=False)
+    assert isinstance(result, AnalysisResult)
+    assert not hasattr(result, "__dict__")  # slots：没有多余属性，也放不下 DataFrame
+    assert result.figures == [] and not any(tmp_path.iterdir())
+    assert all(isinstance(m, MetricSummary) for m in result.summary.values())
+    json.loads(dumps(result))
@@ -0,0 +1,64 @@
+# tests/test_ocr_cache.py
+import io
+import os
+
+from PIL import Image, ImageDraw
+
+from ocr.cache import OCRCache
+
+
+def _png(seed: int, size=(200, 120)) -> bytes:
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    for i in range(6):
+        y = 10 + i * 18
+        draw.rectangle([10, y, 40 + (seed * 37 + i * 53) % 150, y + 8], fill="black")
+    buf = io.BytesIO()
+    image.save(buf, format="PNG")
+    return buf.getvalue()
+
+
+def test_exact_hit_and_preset_isolation(tmp_path):
+    cache = OCRCache(tmp_path)
+    img = _png(1)
+    assert cache.get(img, "off") is None
+    cache.put(img, "off", {"RBC": 4.5})
+    assert cache.get(img, "off") == {"RBC": 4.5}
+    assert cache.get(img, "fast") is None  # 不同前处理档位结果可能不同，不共用
+    s = cache.stats()
+    assert (s["hits_exact"], s["misses"], s["entries"]) == (1, 2, 1)
+    assert s["hit_rate"] == round(1 / 3, 4)
+
+
+def test_entry_written_by_another_worker_is_found(tmp_path):
+    a, b = OCRCache(tmp_path), OCRCache(tmp_path)
+    img = _png(2)
+    assert b.get(img, "off") is None  # b 的内存索引在这之后就建好了
+    a.put(img, "off", {"MCV": 90})
+    assert b.get(img, "off") == {"MCV": 90}
+    assert b.stats()["entries"] == 1
+
+
+def test_eviction_counts_files_from_all_workers(tmp_path):
+    a, b = OCRCache(tmp_path), OCRCache(tmp_path)
+    a.put(_png(3), "off", {"x": "a" * 400})
+    size = next(tmp_path.glob("*.json")).stat().st_size
+    old = next(tmp_path.glob("*.json"))
+    os.utime(old, (1, 1))  # 最久没用
+
+    b.max_bytes = int(size * 1.5)  # 只容得下一条
+    b.put(_png(4), "off", {"x": "b" * 400})
+    assert not old.exists()
+    assert a.get(_png(3), "off") is None
+    assert b.get(_png(4), "off") == {"x": "b" * 400}
+    assert b.stats()["evictions"] == 1
+
+
+def test_perceptual_hit_for_reencoded_copy(tmp_path):
+    cache = OCRCache(tmp_path, phash_max_distance=8)
+    png = _png(5)
+    cache.put(png, "off", {"WhiteCellCount": 6.1})
+    buf = io.BytesIO()
+    Image.open(io.BytesIO(png)).convert("RGB").save(buf, format="JPEG", quality=85)
+    assert cache.get(buf.getvalue(), "off") == {"WhiteCellCount": 6.1}
+    assert cache.stats()["hits_phash"] == 1
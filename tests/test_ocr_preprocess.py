@@ -0,0 +1,53 @@
+# tests/test_ocr_preprocess.py
+import io
+
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from ocr.preprocess import get_preset, preprocess_image
+
+
+def _report_image(size=(1600, 1200)) -> Image.Image:
+    """白底 + 中间一块“表格”（横线），四周留白。"""
+    image = Image.new("RGB", size, "white")
+    draw = ImageDraw.Draw(image)
+    w, h = size
+    for y in range(h // 4, 3 * h // 4, 24):
+        draw.rectangle([w // 4, y, 3 * w // 4, y + 4], fill="black")
+    return image
+
+
+def _with_exif_rotation(image: Image.Image) -> Image.Image:
+    exif = Image.Exif()
+    exif[0x0112] = 6  # Orientation：需要顺时针转 90°
+    buf = io.BytesIO()
+    image.save(buf, format="JPEG", exif=exif.tobytes())
+    return Image.open(io.BytesIO(buf.getvalue()))
+
+
+def test_off_preset_is_a_noop_even_with_exif_orientation():
+    source = _with_exif_rotation(_report_image())
+    expected = np.asarray(source.convert("RGB"))
+    out, info = preprocess_image(source, **get_preset("off"))
+    assert out.size == (1600, 1200) and info["output_size"] == (1600, 1200)
+    assert np.array_equal(np.asarray(out), expected)
+
+
+def test_fast_preset_rotates_caps_resolution_and_crops():
+    out, info = preprocess_image(_with_exif_rotation(_report_image()), **get_preset("fast"))
+    assert info["crop_box"] is not None
+    assert max(out.size) <= 1280
+    assert out.size[1] > out.size[0]  # 按 EXIF 转成竖图
+    assert out.mode == "RGB"
+
+
+def test_deskew_estimates_small_rotation():
+    tilted = _report_image().rotate(3, resample=Image.BICUBIC, fillcolor="white")
+    _, info = preprocess_image(tilted, **get_preset("balanced"))
+    assert abs(abs(info["deskew_angle"]) - 3) <= 1
+
+
+def test_unknown_preset_is_rejected():
+    with pytest.raises(ValueError):
+        get_preset("turbo")
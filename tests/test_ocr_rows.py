@@ -0,0 +1,21 @@
+# tests/test_ocr_rows.py
+import time
+
+from ocr.rows import ocr_to_rows, to_num
+from ocr.stub import STUB_RESULT
+
+
+def test_to_num_converts_numeric_strings_only():
+    assert to_num("13.8") == 13.8
+    assert to_num("58") == 58 and isinstance(to_num("58"), int)
+    assert to_num(" ") == " "
+    assert to_num("阴性") == "阴性"
+    assert to_num(7.5) == 7.5
+
+
+def test_ocr_to_rows_builds_single_exam_row():
+    rows = ocr_to_rows(STUB_RESULT)
+    assert len(rows) == 1
+    assert rows[0]["year"] == time.localtime().tm_year
+    assert rows[0]["RBC"] == 4.62
+    assert ocr_to_rows({"RBC": "4.5"}, year=2023) == [{"year": 2023, "RBC": 4.5}]
@@ -0,0 +1,84 @@
+# tests/test_pdf_export.py
+import time
+
+import pytest
+
+from export import pdf
+
+
+@pytest.fixture
+def renders(monkeypatch):
+    """替换真正的渲染：记录调用次数，返回假的 PDF 字节。"""
+    calls = []
+
+    def fake_render(child, elder, figure_bytes):
+        calls.append((child, elder, sorted(figure_bytes)))
+        return b"%PDF-fake " + child.encode("utf-8")
+
+    monkeypatch.setattr(pdf, "render_report_pdf", fake_render)
+    return calls
+
+
+def _wait_status(content_hash, cache_dir, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while True:
+        status, path, error = pdf.report_pdf_status(content_hash, cache_dir)
+        if status != "pending" or time.monotonic() > deadline:
+            return status, path, error
+        time.sleep(0.01)
+
+
+def test_content_hash_covers_text_and_figure_bytes():
+    base = pdf.report_content_hash("a", "b", {"ldl": b"png1"})
+    assert base == pdf.report_content_hash("a", "b", {"ldl": b"png1"})
+    assert base != pdf.report_content_hash("a", "b", {"ldl": b"png2"})
+    assert base != pdf.report_content_hash("ab", "", {"ldl": b"png1"})
+
+
+def test_export_hits_cache_for_unchanged_report(tmp_path, renders):
+    figure = tmp_path / "ldl.png"
+    figure.write_bytes(b"png")
+    reports = {"report_child": "子女版", "report_elder": "长辈版"}
+
+    first = pdf.export_report_pdf(reports, {"ldl": str(figure)}, tmp_path / "cache")
+    second = pdf.export_report_pdf(reports, {"ldl": str(figure)}, tmp_path / "cache")
+    assert first == second and first.read_bytes().startswith(b"%PDF-fake")
+    assert len(renders) == 1 and renders[0][2] == ["ldl"]
+
+
+def test_submit_renders_in_background_and_lazy_only_records_source(tmp_path, renders):
+    cache = tmp_path / "cache"
+    lazy_hash = pdf.submit_report_pdf(
+        {"report_child": "lazy"}, {}, cache, source={"request_id": "r1"}, lazy=True
+    )
+    assert pdf.report_pdf_status(lazy_hash, cache)[0] == "missing"
+    assert pdf.load_pdf_source(lazy_hash, cache) == {"request_id": "r1"}
+
+    content_hash = pdf.submit_report_pdf({"report_child": "eager"}, {}, cache)
+    status, path, _ = _wait_status(content_hash, cache)
+    assert status == "ready" and path == pdf.cached_pdf_path(content_hash, cache)
+    assert [c[0] for c in renders] == ["eager"]
+
+
+def test_failed_jobs_are_evicted_after_ttl(tmp_path, monkeypatch):
+    def broken(child, elder, figure_bytes):
+        raise RuntimeError("font missing")
+
+    monkeypatch.setattr(pdf, "render_report_pdf", broken)
+    cache = tmp_path / "cache"
+    content_hash = pdf.submit_report_pdf({"report_child": "boom"}, {}, cache)
+    status, _, error = _wait_status(content_hash, cache)
+    assert (status, error) == ("failed", "font missing")
+
+    deadline = time.monotonic() + 5
+    while content_hash not in pdf._failed_at and time.monotonic() < deadline:
+        time.sleep(0.01)  # 完成回调在工作线程里，可能比状态稍晚
+    monkeypatch.setattr(pdf, "FAILED_JOB_TTL_SEC", 0.0)
+    time.sleep(0.01)
+    assert pdf.report_pdf_status(content_hash, cache)[0] == "missing"
+    assert content_hash not in pdf._jobs
+
+
+def test_rejects_malformed_hash(tmp_path):
+    with pytest.raises(ValueError):
+        pdf.cached_pdf_path("../etc/passwd", tmp_path)
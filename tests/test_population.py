@@ -0,0 +1,53 @@
+# tests/test_population.py
+import random
+
+import numpy as np
+
+from analysis.population import KLLSketch, PopulationIndex
+
+
+def _max_rank_error(sketch: KLLSketch, values: list) -> float:
+    cdf = sketch.freeze()
+    exact = np.sort(values)
+    worst = 0.0
+    for q in np.linspace(0.01, 0.99, 99):
+        x = exact[int(q * len(exact))]
+        true_rank = np.searchsorted(exact, x, side="right") / len(exact)
+        worst = max(worst, abs(cdf.percentile(x) / 100 - true_rank))
+    return worst
+
+
+def test_kll_quantile_error_within_bound():
+    rng = random.Random(1)
+    values = [rng.lognormvariate(0, 1) for _ in range(50_000)]
+    sketch = KLLSketch(seed=1)
+    sketch.update_many(values)
+    assert sketch.n == len(values)
+    assert _max_rank_error(sketch, values) < 0.02
+
+
+def test_kll_merge_matches_single_stream():
+    rng = random.Random(2)
+    values = [rng.gauss(0, 1) for _ in range(60_000)]
+    parts = [KLLSketch(seed=s) for s in range(3)]
+    for i, sk in enumerate(parts):
+        sk.update_many(values[i::3])
+    merged = parts[0]
+    merged.merge(parts[1])
+    merged.merge(parts[2])
+
+    assert merged.n == len(values)
+    _, weights = merged.weighted_items()
+    assert int(weights.sum()) == len(values)  # 压缩不丢总权重
+    assert _max_rank_error(merged, values) < 0.02
+
+
+def test_add_person_counts_latest_value_once():
+    index = PopulationIndex(min_count=1)
+    rows = [{"year": 2020 + i, "ldl": 2.0 + i} for i in range(5)]
+    assert index.add_person(rows, sex="M", age=54) == 1
+
+    hit = index.lookup("ldl", 6.0, sex="M", age=54)
+    assert hit["n"] == 1
+    assert hit["cohort"] == "50–59岁男性"
+    assert index.lookup("ldl", 5.9, sex="M", age=54)["percentile"] == 0.0
@@ -0,0 +1,59 @@
+# tests/test_profiling.py
+import pytest
+
+from diagnostics.profiling import profile_block, request_authorized, requested_mode
+
+
+@pytest.fixture(autouse=True)
+def _clean_env(monkeypatch):
+    for name in ("HA_PROFILE_SAMPLE_N", "HA_PROFILE_SAMPLE_MODE", "HA_PROFILE_ALLOW_REQUEST", "HA_PROFILE_TOKEN"):
+        monkeypatch.delenv(name, raising=False)
+
+
+def test_request_switch_needs_allow_flag_and_matching_token(monkeypatch):
+    assert requested_mode("1", "sample") is None
+    monkeypatch.setenv("HA_PROFILE_TOKEN", "s3cret")
+    assert requested_mode("1", token="s3cret") is None  # 没开 HA_PROFILE_ALLOW_REQUEST
+
+    monkeypatch.setenv("HA_PROFILE_ALLOW_REQUEST", "1")
+    assert requested_mode("1") is None
+    assert requested_mode("1", token="wrong") is None
+    assert requested_mode("1", token="s3cret") == "cprofile"
+    assert requested_mode(None, "sample", token="s3cret") == "sample"
+    assert request_authorized("s3cret") and not request_authorized(None)
+
+    monkeypatch.setenv("HA_PROFILE_TOKEN", "")
+    assert not request_authorized("")
+
+
+def test_sampling_profiles_one_in_n_without_authorizing(monkeypatch):
+    monkeypatch.setenv("HA_PROFILE_SAMPLE_N", "3")
+    modes = [requested_mode() for _ in range(6)]
+    assert modes.count("sample") == 2 and modes.count(None) == 4
+    # 抽样命中不等于授权：API 只把剖析结果返回给 token 校验通过的请求
+    assert not request_authorized(None)
+
+
+def test_profile_block_writes_files(tmp_path):
+    with profile_block("cprofile", tmp_path / "p") as session:
+        sum(i * i for i in range(10000))
+    assert sorted(session.files) == ["prof", "txt"]
+    assert all((tmp_path / "p" / f"profile.{ext}").is_file() for ext in ("prof", "txt"))
+
+    with profile_block(None, tmp_path / "off") as session:
+        pass
+    assert session is None and not (tmp_path / "off").exists()
+
+
+def test_api_returns_profile_only_to_authorized_requests(monkeypatch):
+    from api.app import PROFILES_DIR, REQUESTS_DIR, _profile_artifacts
+    from diagnostics.profiling import ProfileSession
+
+    session = ProfileSession("sample", PROFILES_DIR / "abc", "profile")
+    session.files = {"folded": str(PROFILES_DIR / "abc" / "profile.folded")}
+    assert _profile_artifacts(session, "abc", authorized=False) is None
+    assert _profile_artifacts(None, "abc", authorized=True) is None
+    info = _profile_artifacts(session, "abc", authorized=True)
+    assert info["files"] == {"folded": "/profile/abc/profile.folded"}
+    # 剖析目录不在 /static 挂载的 requests/ 下
+    assert not PROFILES_DIR.resolve().is_relative_to(REQUESTS_DIR.resolve())
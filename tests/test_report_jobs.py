@@ -0,0 +1,81 @@
+# tests/test_report_jobs.py
+import json
+import threading
+import time
+import uuid
+
+from llm.report_jobs import report_status, submit_report_upgrade
+
+TEMPLATE = {"report_child": "模板-子女", "report_elder": "模板-长辈"}
+
+
+def _job_id() -> str:
+    return uuid.uuid4().hex[:10]
+
+
+def test_upgrade_replaces_template(tmp_path):
+    job_id, state_path = _job_id(), tmp_path / "report_status.json"
+    job = submit_report_upgrade(
+        job_id, TEMPLATE,
+        generate=lambda: {"report_child": "LLM-子女", "report_elder": "LLM-长辈"},
+        on_ready=lambda reports: {"artifacts": {"report_pdf": "/report/pdf/x"}},
+        timeout=5, state_path=state_path,
+    )
+    job.result(timeout=5)
+
+    current = report_status(job_id)
+    assert current["status"] == "ready" and current["source"] == "llm"
+    assert current["report_child"] == "LLM-子女"
+    assert current["artifacts"] == {"report_pdf": "/report/pdf/x"}
+    assert json.loads(state_path.read_text(encoding="utf-8"))["status"] == "ready"
+
+
+def test_deadline_falls_back_and_late_result_is_dropped(tmp_path):
+    release = threading.Event()
+
+    def slow():
+        release.wait(5)
+        return {"report_child": "迟到", "report_elder": "迟到"}
+
+    job_id = _job_id()
+    job = submit_report_upgrade(job_id, TEMPLATE, generate=slow, timeout=0.05,
+                                state_path=tmp_path / "s.json")
+    time.sleep(0.1)
+    current = report_status(job_id)
+    assert (current["status"], current["reason"]) == ("template", "timeout")
+
+    release.set()
+    job.result(timeout=5)
+    assert report_status(job_id)["report_child"] == "模板-子女"  # 回退之后不再变
+
+
+def test_no_generator_is_final_template():
+    job_id = _job_id()
+    assert submit_report_upgrade(job_id, TEMPLATE) is None
+    current = report_status(job_id)
+    assert (current["status"], current["reason"]) == ("template", "no_api_key")
+
+
+def test_queue_full_skips_llm(monkeypatch):
+    monkeypatch.setenv("HA_LLM_UPGRADE_QUEUE", "0")
+    job_id = _job_id()
+    assert submit_report_upgrade(job_id, TEMPLATE, generate=lambda: {}) is None
+    assert report_status(job_id)["reason"] == "queue_full"
+
+
+def test_status_from_file_for_other_process(tmp_path):
+    # 其他 worker / 重启前提交的任务：本进程内存里没有，只能读状态文件
+    state_path = tmp_path / "report_status.json"
+    state = {"status": "pending", "source": "template", "reason": None,
+             "report_child": "c", "report_elder": "e", "deadline_at": time.time() + 60}
+    state_path.write_text(json.dumps(state), encoding="utf-8")
+    assert report_status(_job_id(), state_path=state_path)["status"] == "pending"
+
+    state["deadline_at"] = time.time() - 1  # 负责生成的进程已经没了
+    state_path.write_text(json.dumps(state), encoding="utf-8")
+    current = report_status(_job_id(), state_path=state_path)
+    assert (current["status"], current["reason"]) == ("template", "timeout")
+    assert "deadline_at" not in current
+
+    assert report_status(_job_id(), state_path=tmp_path / "missing.json") is None
+    assert report_status(_job_id()) is None
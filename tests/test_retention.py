@@ -0,0 +1,52 @@
+# tests/test_retention.py
+import os
+import time
+
+from storage.retention import retention_from_env, sweep_outputs
+
+
+def _touch(path, age_sec, now):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if not path.suffix:
+        path.mkdir(exist_ok=True)
+        (path / "report.json").write_text("{}", encoding="utf-8")
+    else:
+        path.write_bytes(b"x")
+    os.utime(path, (now - age_sec, now - age_sec))
+
+
+def test_sweep_removes_old_and_excess_requests(tmp_path):
+    now = time.time()
+    for i, age in enumerate([10, 20, 30, 7200]):
+        _touch(tmp_path / "requests" / f"r{i}", age, now)
+    _touch(tmp_path / "uploads" / "old.png", 7200, now)
+    _touch(tmp_path / "uploads" / "new.png", 10, now)
+    _touch(tmp_path / "pdf_cache" / "old.pdf", 7200, now)
+    _touch(tmp_path / "ocr_cache" / "keep.json", 7200, now)  # 有自己的 LRU，不归这里管
+
+    removed = sweep_outputs(tmp_path, max_age_sec=3600, max_requests=2, now=now)
+    assert removed == {"requests": 2, "files": 2}
+    assert sorted(p.name for p in (tmp_path / "requests").iterdir()) == ["r0", "r1"]
+    assert [p.name for p in (tmp_path / "uploads").iterdir()] == ["new.png"]
+    assert (tmp_path / "ocr_cache" / "keep.json").exists()
+
+
+def test_sweep_covers_profile_dirs(tmp_path):
+    now = time.time()
+    _touch(tmp_path / "profiles" / "old", 7200, now)
+    _touch(tmp_path / "profiles" / "new", 10, now)
+    assert sweep_outputs(tmp_path, max_age_sec=3600, now=now) == {"requests": 1, "files": 0}
+    assert [p.name for p in (tmp_path / "profiles").iterdir()] == ["new"]
+
+
+def test_sweep_with_limits_disabled_keeps_everything(tmp_path):
+    now = time.time()
+    _touch(tmp_path / "requests" / "r0", 10 ** 7, now)
+    assert sweep_outputs(tmp_path, None, None, now=now) == {"requests": 0, "files": 0}
+    assert sweep_outputs(tmp_path / "missing", 1, 1) == {"requests": 0, "files": 0}
+
+
+def test_retention_from_env(monkeypatch):
+    monkeypatch.setenv("HA_OUTPUT_TTL_HOURS", "2")
+    monkeypatch.setenv("HA_OUTPUT_MAX_REQUESTS", "0")
+    assert retention_from_env() == (7200.0, None)
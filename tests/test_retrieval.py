@@ -0,0 +1,52 @@
+# tests/test_retrieval.py
+import json
+import shutil
+
+from llm.retrieval import DEFAULT_CORPUS_DIR, GuidanceIndex, build_index, tokenize
+
+
+def _write_doc(corpus, name, metrics, body):
+    corpus.mkdir(parents=True, exist_ok=True)
+    (corpus / name).write_text(
+        f"---\ntitle: {name}\nmetrics: {metrics}\n---\n# {name}\n\n{body}\n", encoding="utf-8"
+    )
+
+
+def test_tokenize_mixes_ascii_words_and_cjk_bigrams():
+    assert tokenize("LDL 偏高") == ["ldl", "偏高"]
+    assert tokenize("血压高") == ["血压", "压高"]
+
+
+def test_metric_search_on_shipped_corpus(tmp_path):
+    build_index(DEFAULT_CORPUS_DIR, tmp_path / "index")
+    index = GuidanceIndex(tmp_path / "index")
+    hits = index.search_metric("ldl", "低密度脂蛋白", "HIGH", k=2)
+    assert hits and all("ldl" in h["metrics"] for h in hits)
+    assert index.search_metric("ldl", "低密度脂蛋白", "HIGH", k=2) is hits  # 进程内缓存
+
+
+def test_rebuild_switches_manifest_to_new_data_dir(tmp_path):
+    corpus, index_dir = tmp_path / "corpus", tmp_path / "index"
+    _write_doc(corpus, "bp.md", "sbp", "## 饮食\n少盐，每天盐不超过五克。")
+    first = build_index(corpus, index_dir)
+    old = GuidanceIndex(index_dir)
+
+    _write_doc(corpus, "bp.md", "sbp", "## 运动\n每周快走五次，每次半小时。")
+    second = build_index(corpus, index_dir)
+    assert second["data_dir"] != first["data_dir"]
+    assert json.loads((index_dir / "manifest.json").read_text())["data_dir"] == second["data_dir"]
+
+    # 已加载的旧索引继续可用（旧子目录保留），新加载的读到新内容
+    assert "少盐" in old.search("少盐", k=1)[0]["text"]
+    assert GuidanceIndex(index_dir).search("少盐", k=1) == []
+    assert "快走" in GuidanceIndex(index_dir).search("快走", k=1)[0]["text"]
+
+
+def test_loads_legacy_manifest_without_data_dir(tmp_path):
+    index_dir = tmp_path / "index"
+    info = build_index(DEFAULT_CORPUS_DIR, index_dir)
+    for p in (index_dir / info["data_dir"]).iterdir():
+        shutil.move(str(p), index_dir / p.name)
+    manifest = {k: v for k, v in info.items() if k != "data_dir"}
+    (index_dir / "manifest.json").write_text(json.dumps(manifest), encoding="utf-8")
+    assert GuidanceIndex(index_dir).search_metric("sbp", "收缩压", "HIGH")
@@ -0,0 +1,32 @@
+# tests/test_template_report.py
+import pytest
+
+from analysis.models import MetricSummary
+from llm.template_report import classify_metric
+
+
+def _metric(latest, key="ldl", out_flag="OK", zscore=None, rising=False, trend="FLAT"):
+    return MetricSummary(
+        key=key, name=key, unit="mmol/L", latest=latest, zscore_latest=zscore,
+        trend=trend, yoy_delta=None, out_of_range=out_flag != "OK", out_flag=out_flag,
+        ref_low=None, ref_high=3.4, monotonic_increase_last3=rising,
+    )
+
+
+@pytest.mark.parametrize(
+    "metric, tier",
+    [
+        (_metric(2.0), "green"),
+        (_metric(3.3), "yellow"),  # 接近上限
+        (_metric(2.0, zscore=2.5), "yellow"),  # 范围内但明显偏离往年
+        (_metric(4.0, out_flag="HIGH"), "orange"),
+        (_metric(4.0, out_flag="HIGH", zscore=-2.1), "red"),
+        (_metric(4.0, out_flag="HIGH", rising=True, trend="UP"), "red"),
+        # HDL 越高越好：持续上升不算风险
+        (_metric(4.0, key="hdl", out_flag="HIGH", rising=True, trend="UP"), "orange"),
+    ],
+)
+def test_classify_metric_tiers(metric, tier):
+    got, reasons = classify_metric(metric)
+    assert got == tier
+    assert bool(reasons) == (tier != "green")
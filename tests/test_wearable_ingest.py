@@ -0,0 +1,51 @@
+# tests/test_wearable_ingest.py
+import json
+
+from data.wearable_ingest import aggregate_wearable_files, merge_into_rows
+
+
+def test_wide_csv_skips_empty_cells_and_counts_bad_values(tmp_path):
+    path = tmp_path / "wide.csv"
+    path.write_text(
+        "timestamp,resting_heart_rate,weight_kg\n"
+        "2024-01-01,60,70.0\n"
+        "2024-01-02,62,\n"  # 当天没称体重：空单元格不算拒绝
+        "2024-01-03,,70.4\n"
+        "2024-01-04,abc,\n",  # 无法解析的值才算 rejected_value
+        encoding="utf-8",
+    )
+    out = aggregate_wearable_files([str(path)], max_workers=1)
+    stats = out["stats"]
+    assert (stats["rows"], stats["accepted"], stats["rejected_value"]) == (5, 4, 1)
+    assert out["monthly"]["resting_heart_rate"]["2024-01"]["mean"] == 61
+    assert out["monthly"]["weight_kg"]["2024-01"]["count"] == 2
+
+
+def test_long_jsonl_checks_metric_and_unit_and_buckets_by_local_date(tmp_path):
+    path = tmp_path / "long.jsonl"
+    records = [
+        # 当地 2 月 1 日凌晨，换算成 UTC 是 1 月 31 日：按当地日期归到 2 月
+        {"timestamp": "2024-02-01T00:30:00+08:00", "metric": "weight_kg", "value": 70, "unit": "kg"},
+        {"timestamp": "2024-01-31T23:30:00+08:00", "metric": "weight_kg", "value": 71, "unit": "kg"},
+        {"timestamp": "2024-01-15T08:00:00Z", "metric": "weight_kg", "value": 150, "unit": "lb"},
+        {"timestamp": "2024-01-15T08:00:00Z", "metric": "steps", "value": 8000},
+    ]
+    path.write_text("".join(json.dumps(r) + "\n" for r in records), encoding="utf-8")
+
+    out = aggregate_wearable_files([str(path)], max_workers=1)
+    stats = out["stats"]
+    assert (stats["accepted"], stats["rejected_unit"], stats["rejected_metric"]) == (2, 1, 1)
+    assert out["monthly"]["weight_kg"]["2024-02"]["mean"] == 70
+    assert out["monthly"]["weight_kg"]["2024-01"]["mean"] == 71
+    assert out["yearly"]["weight_kg"][2024]["count"] == 2
+
+
+def test_merge_into_rows_fills_gaps_only():
+    aggregates = {"yearly": {"weight_kg": {2023: {"mean": 70.5}, 2024: {"mean": 71.0}}}}
+    rows = [{"year": 2023, "weight_kg": 69.0}, {"year": 2024}]
+    merged = merge_into_rows(rows, aggregates)
+    assert [r["weight_kg"] for r in merged] == [69.0, 71.0]
+    assert merge_into_rows([], aggregates) == [
+        {"year": 2023, "weight_kg": 70.5},
+        {"year": 2024, "weight_kg": 71.0},
+    ]